@@ -0,0 +1,143 @@
+import argparse
+import logging
+import os
+import runpy
+import sys
+import time
+
+# One command line for the whole pipeline:
+#   python cli.py crawl [--refresh] [--fresh] [--coordinator --workers 4] ...   the whole crawl, same as python scraping.py
+#   python cli.py crawl all_years             just the stages up to all_years, cached ones get read back
+#   python cli.py parse                       reparse the stored trim pages into txt_files/final_data.txt
+#   python cli.py export                      rewrite csv_files/the_big_data.* from txt_files/final_data.txt
+#   python cli.py clean [input] [output] [--incremental]     python/data_cleaning.py
+#   python cli.py impute [input] [output] [--incremental]    python/imputation.py
+#   python cli.py features [input] [folder] [--force]        python/creating_features.py
+#   python cli.py train [folder] [model file] [--boosted]      python/training_model.py
+#   python cli.py price [input] [output] [--serve --port 8081] python/pricing.py
+# Each command only imports what it uses (and scraping.py imports pandas, aiohttp etc. lazily), so --help and
+# the single stage commands don't sit there loading libraries they never touch.
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Same as scraping.stage_names, copied here so --help doesn't have to import scraping.py
+stage_names = ["all_makes", "all_models", "all_years", "all_specs", "all_trims", "specifications"]
+
+def crawl(args):
+    import scraping
+
+    if args.stage is None:
+        argv = [flag for flag, on in [("--refresh", args.refresh), ("--replay-dead-letters", args.replay_dead_letters),
+                                      ("--fresh", args.fresh),
+                                      ("--coordinator", args.coordinator), ("--worker", args.worker)] if on]
+        if args.workers is not None:
+            argv += ["--workers", str(args.workers)]
+        if args.queue is not None:
+            argv += ["--queue", args.queue]
+        scraping.main(argv)
+        return
+
+    scraping.setup()
+    if args.fresh:
+        scraping.fresh_since = time.time()
+    if args.stage == "specifications":
+        scraping.crawl_through("all_trims")
+        scraping.load_specifications()
+    else:
+        scraping.crawl_through(args.stage)
+    scraping.run_crawl(scraping.close_crawl_session())
+    scraping.write_metrics()
+
+def parse(args):
+    import scraping
+
+    scraping.setup()
+    records = scraping.parse_specifications(scraping.readFromfile(scraping.all_trims_file))
+    logging.info("Parsed %s specifications into %s", len(records), scraping.final_data_file)
+
+def export(args):
+    import scraping
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(message)s', datefmt='%m-%d-%y %H:%M:%S')
+    records = scraping.readFromfile(scraping.final_data_file)
+    scraping.export(records)
+    logging.info("Exported %s specifications", len(records))
+
+# The python/ scripts read their file names off the command line, so they get run as if they'd been started
+# directly, with their own folder on the path for cleaning_rules.py and friends
+def run_script(file_name, arguments):
+    script = os.path.join(here, "python", file_name)
+    sys.path.insert(0, os.path.dirname(script))
+    sys.argv = [script] + arguments
+    runpy.run_path(script, run_name="__main__")
+
+def clean(args):
+    run_script("data_cleaning.py", args.files + (["--incremental"] if args.incremental else []))
+
+def impute(args):
+    run_script("imputation.py", args.files + (["--incremental"] if args.incremental else []))
+
+def features(args):
+    run_script("creating_features.py", args.files + (["--force"] if args.force else []))
+
+def train(args):
+    run_script("training_model.py", args.files + (["--boosted"] if args.boosted else []))
+
+def price(args):
+    arguments = args.files + (["--serve"] if args.serve else [])
+    for flag, value in [("--model", args.model), ("--port", args.port)]:
+        if value is not None:
+            arguments += [flag, str(value)]
+    run_script("pricing.py", arguments)
+
+def parser():
+    parser = argparse.ArgumentParser(description="Scrape thecarconnection.com and turn it into a car price dataset")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("crawl", help="crawl the site (everything, or up to one stage)")
+    command.add_argument("stage", nargs="?", choices=stage_names, help="only run the stages up to this one")
+    command.add_argument("--refresh", action="store_true", help="go back for the pages most likely to have changed")
+    command.add_argument("--replay-dead-letters", action="store_true", help="retry the URLs that failed for good last time")
+    command.add_argument("--fresh", action="store_true", help="fetch every page again instead of reusing saved ones")
+    command.add_argument("--coordinator", action="store_true", help="split the crawl across worker processes")
+    command.add_argument("--workers", type=int, help="local worker processes for --coordinator")
+    command.add_argument("--worker", action="store_true", help="work on a coordinator's queue")
+    command.add_argument("--queue", help="work queue database for --coordinator/--worker")
+    command.set_defaults(run=crawl)
+
+    command = commands.add_parser("parse", help="reparse the stored trim pages, no fetching")
+    command.set_defaults(run=parse)
+
+    command = commands.add_parser("export", help="write the CSV and Parquet files from the parsed specifications")
+    command.set_defaults(run=export)
+
+    for name, run, script in [("clean", clean, "data_cleaning.py"), ("impute", impute, "imputation.py")]:
+        command = commands.add_parser(name, help="run python/%s" % script)
+        command.add_argument("files", nargs="*", help="input and output file, defaults are the same as the script's")
+        command.add_argument("--incremental", action="store_true", help="only redo rows that changed since last time")
+        command.set_defaults(run=run)
+
+    command = commands.add_parser("features", help="build the feature store for training, if the data changed")
+    command.add_argument("files", nargs="*", help="imputed data and feature store folder, defaults are the same as the script's")
+    command.add_argument("--force", action="store_true", help="rebuild it even if nothing changed")
+    command.set_defaults(run=features)
+
+    command = commands.add_parser("train", help="train the price model on the feature store")
+    command.add_argument("files", nargs="*", help="feature store folder and model file, defaults are the same as the script's")
+    command.add_argument("--boosted", action="store_true", help="gradient boosting (needs scikit-learn) instead of ridge regression")
+    command.set_defaults(run=train)
+
+    command = commands.add_parser("price", help="price raw scraped cars with the trained model")
+    command.add_argument("files", nargs="*", help="input and output file, defaults are the same as the script's")
+    command.add_argument("--model", help="model file from train")
+    command.add_argument("--serve", action="store_true", help="answer POST /price over HTTP instead")
+    command.add_argument("--port", type=int, help="port for --serve (default 8081)")
+    command.set_defaults(run=price)
+
+    return parser
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    args.run(args)
+
+if __name__ == "__main__":
+    main()
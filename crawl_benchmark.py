@@ -0,0 +1,161 @@
+import argparse
+import asyncio
+import collections
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import crawl_progress
+import mock_site
+
+# Runs the whole of scraping.py end to end against mock_site.py instead of the real website, so changes to the
+# crawler can be timed without waiting on (or hammering) thecarconnection.com. Every run starts from an empty
+# scratch directory, so nothing gets read back from the txt_files caches and every page really gets fetched.
+#
+#   python crawl_benchmark.py --makes 10 --latency 0.05 --error-rate 0.01
+#
+# Prints pages/sec, wall time for each stage (first to last page fetched, from the run's crawl_progress.db)
+# and peak memory: scraping.py plus its loky parse workers added up, sampled from /proc while it runs (Linux only),
+# and the largest single process on its own. --keep leaves the scratch directory around to poke at.
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Runs the mock site on its own event loop in a background thread, so scraping.py can be a normal subprocess
+def serve_in_background(site, port):
+    loop = asyncio.new_event_loop()
+    runner = loop.run_until_complete(mock_site.start(site, port=port))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.run_until_complete(runner.cleanup())
+        loop.close()
+    return stop
+
+# ru_maxrss is the peak of the biggest single process that has finished, not a total - kilobytes on Linux,
+# bytes on macOS
+def largest_child_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def rss_kb(pid):
+    try:
+        with open("/proc/%s/status" % pid) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+# pid and everything started under it, going by the parent pid in each /proc/<pid>/stat
+def process_tree(pid):
+    children = collections.defaultdict(list)
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open("/proc/%s/stat" % entry) as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The process name is in brackets and can have spaces in it, the parent pid is the second field after it
+        children[int(stat[stat.rindex(")") + 1:].split()[1])].append(int(entry))
+
+    tree, pending = [], [pid]
+    while pending:
+        tree.append(pending.pop())
+        pending.extend(children[tree[-1]])
+    return tree
+
+# Adds up the RSS of a process and all its children every sample_seconds until it exits, keeping the highest
+# total. Pages shared between processes (libraries mostly) get counted once for each, so it's a bit of an overestimate.
+class TreeMemorySampler:
+
+    sample_seconds = 0.1
+
+    def __init__(self, process):
+        self.process = process
+        self.peak_mb = None
+        self.peak_processes = 0
+        if os.path.isdir("/proc"):
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def run(self):
+        self.peak_mb = 0.0
+        while self.process.poll() is None:
+            tree = process_tree(self.process.pid)
+            total = sum(rss_kb(pid) for pid in tree) / 1024
+            if total > self.peak_mb:
+                self.peak_mb, self.peak_processes = total, len(tree)
+            time.sleep(self.sample_seconds)
+
+def stage_timings(db_file):
+    conn = sqlite3.connect(db_file)
+    rows = conn.execute("""SELECT stage, COUNT(*), SUM(status = ?), MIN(fetched_at), MAX(fetched_at)
+                           FROM pages GROUP BY stage ORDER BY MIN(fetched_at)""", (crawl_progress.STATUS_DONE,)).fetchall()
+    conn.close()
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time scraping.py end to end against a local mock site")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory the run used")
+    mock_site.add_site_arguments(parser)
+    args = parser.parse_args()
+
+    site = mock_site.site_from_arguments(args)
+    stop_site = serve_in_background(site, args.port)
+
+    scratch = tempfile.mkdtemp(prefix="crawl_benchmark_")
+    os.makedirs(os.path.join(scratch, "txt_files"))
+    os.makedirs(os.path.join(scratch, "csv_files"))
+
+    env = dict(os.environ, SCRAPER_WEBSITE="http://127.0.0.1:%s" % args.port)
+    print("Crawling %s mock pages from %s in %s" % (site.total_pages(), env["SCRAPER_WEBSITE"], scratch))
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(here, "scraping.py")], cwd=scratch, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    memory = TreeMemorySampler(process)
+    returncode = process.wait()
+    wall = time.perf_counter() - start
+    stop_site()
+
+    rows = stage_timings(os.path.join(scratch, crawl_progress.progress_db_file))
+    fetched = sum(row[2] for row in rows)
+
+    print()
+    print(f"{'stage':15} {'pages':>7} {'failed':>7} {'wall':>9} {'pages/sec':>10}")
+    for stage, total, done, first, last in rows:
+        took = last - first
+        rate = f"{done / took:10.1f}" if took > 0 else f"{'-':>10}"
+        print(f"{stage:15} {done:7} {total - done:7} {took:8.2f}s {rate}")
+
+    largest = largest_child_rss_mb()
+    total = "%.1f MB across %s processes" % (memory.peak_mb, memory.peak_processes) if memory.peak_mb else "n/a"
+    print()
+    print(f"exit code        {returncode}")
+    print(f"wall time        {wall:.2f}s")
+    print(f"pages fetched    {fetched} of {site.total_pages()}")
+    print(f"pages/sec        {fetched / wall:.1f}")
+    print(f"requests served  {site.requests} ({site.errors_sent} injected errors)")
+    print(f"peak total RSS   {total}")
+    print(f"largest child    {'%.1f MB' % largest if largest is not None else 'n/a'} (peak of the biggest single process)")
+    print(f"log              {os.path.join(scratch, 'log_scraping.log')}" if args.keep else "")
+
+    if not args.keep:
+        shutil.rmtree(scratch, ignore_errors=True)
+    sys.exit(returncode)
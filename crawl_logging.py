@@ -0,0 +1,163 @@
+import atexit
+import collections
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+
+# Logging for the crawl that never holds up the event loop. Every logging call just drops the record on a queue
+# (logging.handlers.QueueHandler) and a background thread (QueueListener) does the actual writing to
+# log_scraping.log and the console, so a slow disk or a terminal being scrolled can't stall the fetching.
+# If the thread falls so far behind that the queue fills up, records get dropped (and counted) rather than waited on.
+# https://docs.python.org/3/howto/logging-cookbook.html#dealing-with-handlers-that-block
+#
+# The log file can be JSON lines, one object per record: time, level, logger, message, process, plus stage / event
+# / url when the call passed them in `extra`. Easy to grep, or load with pd.read_json(..., lines=True).
+#
+# Per URL events (every fetch, retry, parse error...) get passed an `event` name in `extra`, and sampling
+# controls how many of those get through: event -> (fraction kept, max per second for each stage). A make that
+# starts timing out produces a few lines a second instead of thousands, and the next one that does get through
+# says how many were skipped ("suppressed"). Events not in sampling, and records without one, always go through.
+log_queue_size = 10000
+
+class JsonFormatter(logging.Formatter):
+
+    extra_fields = ["stage", "event", "url", "suppressed"]
+
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "process": record.process,
+        }
+        for field in self.extra_fields:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+# Sampling + a token bucket per (event, stage), see the top of the file
+class SampleFilter(logging.Filter):
+
+    def __init__(self, sampling, seed=None):
+        super().__init__()
+        self.sampling = sampling
+        self.buckets = {}                           # (event, stage) -> (tokens, when they were last topped up)
+        self.suppressed = collections.Counter()     # (event, stage) -> records skipped since the last one let through
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        event = getattr(record, "event", None)
+        if event not in self.sampling:
+            return True
+
+        fraction, per_second = self.sampling[event]
+        key = (event, getattr(record, "stage", None))
+        with self.lock:
+            keep = fraction >= 1 or self.random.random() < fraction
+            if keep and per_second is not None:
+                tokens, last = self.buckets.get(key, (per_second, record.created))
+                tokens = min(per_second, tokens + (record.created - last) * per_second)
+                keep = tokens >= 1
+                self.buckets[key] = (tokens - 1 if keep else tokens, record.created)
+
+            if not keep:
+                self.suppressed[key] += 1
+                return False
+            record.suppressed = self.suppressed.pop(key, None)
+        return True
+
+# QueueHandler, except a full queue drops the record instead of raising (or blocking)
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+# QueueListener, except stopping waits for room on the queue for its stop signal - the stock one uses put_nowait,
+# which raises queue.Full if the thread is behind at the very moment it gets stopped
+class BlockingStopQueueListener(logging.handlers.QueueListener):
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+listener = None
+queue_handler = None
+
+# Sends everything from the root logger through the queue to log_file (mode "w", same as before) and the console.
+# json_lines=False keeps the old plain text file.
+def setup(log_file, json_lines=True, file_level=logging.DEBUG, console_level=logging.INFO, sampling=None):
+    global listener, queue_handler
+    stop()
+
+    file_handler = logging.FileHandler(log_file, mode="w", encoding="utf-8")
+    file_handler.setLevel(file_level)
+    if json_lines:
+        file_handler.setFormatter(JsonFormatter())
+    else:
+        file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s', '%m-%d-%yT%H:%M:%S'))
+
+    # Format = DateTime: <message>
+    # http://strftime.org/
+    console = logging.StreamHandler()
+    console.setLevel(console_level)
+    console.setFormatter(logging.Formatter('%(asctime)s: %(message)s', '%m-%d-%y %H:%M:%S'))
+
+    queue_handler = DroppingQueueHandler(queue.Queue(log_queue_size))
+    queue_handler.addFilter(SampleFilter(sampling or {}))
+    listener = BlockingStopQueueListener(queue_handler.queue, file_handler, console, respect_handler_level=True)
+
+    root = logging.getLogger()
+    root.setLevel(min(file_level, console_level))
+    root.addHandler(queue_handler)
+    listener.start()
+    atexit.register(stop)
+
+# Writes out whatever's still on the queue and stops the thread. How many records got dropped goes straight to
+# the handlers afterwards, not through the queue that was too full to take them.
+def stop():
+    global listener, queue_handler
+    if listener is None:
+        return
+    logging.getLogger().removeHandler(queue_handler)
+    listener.stop()
+    if queue_handler.dropped:
+        record = logging.makeLogRecord({"name": "crawl_logging", "levelno": logging.WARNING, "levelname": "WARNING",
+                                        "msg": "Log queue was full, dropped %s records", "args": (queue_handler.dropped,)})
+        for handler in listener.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+    for handler in listener.handlers:
+        handler.close()
+    listener = None
+    queue_handler = None
+
+# joblib's worker processes don't get any logging set up, so their errors would go straight to stderr one by one.
+# This gives them the same sampling (on stderr, warnings and up). Does nothing where setup() has already run.
+worker_handler = None
+
+def setup_worker(sampling=None):
+    global worker_handler
+    if queue_handler is not None or worker_handler is not None:
+        return
+    worker_handler = logging.StreamHandler(sys.stderr)
+    worker_handler.setLevel(logging.WARNING)
+    worker_handler.setFormatter(JsonFormatter())
+    worker_handler.addFilter(SampleFilter(sampling or {}))
+    logging.getLogger().addHandler(worker_handler)
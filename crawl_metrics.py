@@ -0,0 +1,227 @@
+import json
+import time
+
+from bisect import bisect_left
+
+import page_store
+
+# Counters, gauges and histograms for every stage of the crawl, so after a run we can tell whether it was slow
+# because of the website (fetch latency, retries, 429s) or because of us (parse time, queues backing up),
+# instead of subtracting timestamps out of log_scraping.log by hand.
+#
+# Everything gets written out as JSON at the end of each stage (txt_files/crawl_metrics.json), and can also be
+# written in the Prometheus text format for node_exporter's textfile collector or anything else that reads it.
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+metrics_file = "txt_files/crawl_metrics.json"
+prometheus_file = "txt_files/crawl_metrics.prom"
+
+# Histogram buckets (upper bounds, in seconds), same idea as Prometheus' default buckets
+latency_buckets = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+parse_buckets = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last one is everything over the biggest bucket
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    # Rough percentile - the upper bound of the bucket it lands in
+    def quantile(self, q):
+        if not self.count:
+            return None
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= q * self.count:
+                return bound
+        return float("inf")
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.total, 6),
+            "mean": round(self.total / self.count, 6) if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets + ("+Inf",), self.counts)},
+        }
+
+class StageMetrics:
+
+    def __init__(self, name):
+        self.name = name
+        self.started = None
+        self.finished = None
+
+        self.fetch_latency = Histogram(latency_buckets)
+        self.parse_time = Histogram(parse_buckets)
+        self.requests = 0
+        self.statuses = {}      # HTTP status -> count, "error" for requests that never got one
+        self.bytes = 0
+        self.cached_pages = 0   # read back out of the page store instead of fetched
+        self.retries = 0
+        self.failures = {}      # retry_policy kind -> URLs given up on
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.queue_depth_max = 0
+        self.queue_depth_total = 0
+        self.queue_samples = 0
+        self.pages_parsed = 0
+        self.rows = 0
+
+    def touch(self):
+        now = time.time()
+        if self.started is None:
+            self.started = now
+        self.finished = now
+
+    def request_started(self):
+        self.touch()
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    # status is None if the request blew up before we got one
+    def request_finished(self, latency, status, size=0):
+        self.touch()
+        self.in_flight -= 1
+        self.requests += 1
+        self.fetch_latency.observe(latency)
+        key = str(status) if status is not None else "error"
+        self.statuses[key] = self.statuses.get(key, 0) + 1
+        self.bytes += size
+
+    def cached(self):
+        self.touch()
+        self.cached_pages += 1
+
+    def retried(self):
+        self.retries += 1
+
+    def failed(self, kind):
+        self.failures[kind] = self.failures.get(kind, 0) + 1
+
+    def queue_depth(self, depth):
+        self.queue_depth_max = max(self.queue_depth_max, depth)
+        self.queue_depth_total += depth
+        self.queue_samples += 1
+
+    def parsed(self, seconds):
+        self.touch()
+        self.pages_parsed += 1
+        self.parse_time.observe(seconds)
+
+    def to_dict(self):
+        wall = self.finished - self.started if self.started is not None else 0.0
+        return {
+            "wall_seconds": round(wall, 3),
+            "requests": self.requests,
+            "statuses": self.statuses,
+            "bytes": self.bytes,
+            "cached_pages": self.cached_pages,
+            "retries": self.retries,
+            "failures": self.failures,
+            "peak_in_flight": self.peak_in_flight,
+            "queue_depth_max": self.queue_depth_max,
+            "queue_depth_mean": round(self.queue_depth_total / self.queue_samples, 2) if self.queue_samples else None,
+            "pages_parsed": self.pages_parsed,
+            "rows": self.rows,
+            "pages_per_sec": round((self.requests + self.cached_pages) / wall, 2) if wall else None,
+            "fetch_latency_seconds": self.fetch_latency.to_dict(),
+            "parse_seconds": self.parse_time.to_dict(),
+        }
+
+class CrawlMetrics:
+
+    def __init__(self):
+        self.started = time.time()
+        self.stages = {}
+
+    def stage(self, name):
+        if name not in self.stages:
+            self.stages[name] = StageMetrics(name or "unknown")
+        return self.stages[name]
+
+    def to_dict(self):
+        return {
+            "started": self.started,
+            "written": time.time(),
+            "stages": {name: stage.to_dict() for name, stage in self.stages.items()},
+        }
+
+    def write_json(self, file_name=metrics_file):
+        page_store.write_atomic(file_name, json.dumps(self.to_dict(), indent=2).encode("utf-8"))
+
+    def write_prometheus(self, file_name=prometheus_file):
+        page_store.write_atomic(file_name, prometheus_text(self).encode("utf-8"))
+
+    # One line per stage for the log: where the time went
+    def summary_lines(self):
+        for name, stage in self.stages.items():
+            yield ("%s: %s requests (%s cached), %.1f MB, fetch p50 %ss p95 %ss, parse total %.1fs over %s pages, "
+                   "%s rows, %s retries, %s failures, peak in flight %s, max queue %s" %
+                   (name, stage.requests, stage.cached_pages, stage.bytes / 1e6, stage.fetch_latency.quantile(0.5),
+                    stage.fetch_latency.quantile(0.95), stage.parse_time.total, stage.pages_parsed, stage.rows,
+                    stage.retries, sum(stage.failures.values()), stage.peak_in_flight, stage.queue_depth_max))
+
+def prometheus_text(metrics):
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s %s" % (name, kind))
+        for labels, value in samples:
+            label_text = ",".join('%s="%s"' % (key, str(val).replace('"', '\\"')) for key, val in labels)
+            lines.append("%s{%s} %s" % (name, label_text, value))
+
+    def histogram(name, help_text, attribute):
+        lines.append("# HELP %s %s" % (name, help_text))
+        lines.append("# TYPE %s histogram" % name)
+        for stage_name, stage in metrics.stages.items():
+            hist = getattr(stage, attribute)
+            running = 0
+            for bound, count in zip(hist.buckets + ("+Inf",), hist.counts):
+                running += count
+                lines.append('%s_bucket{stage="%s",le="%s"} %s' % (name, stage_name, bound, running))
+            lines.append('%s_sum{stage="%s"} %s' % (name, stage_name, hist.total))
+            lines.append('%s_count{stage="%s"} %s' % (name, stage_name, hist.count))
+
+    stages = metrics.stages.items()
+    histogram("crawl_fetch_latency_seconds", "Time to fetch a page, including reading the body", "fetch_latency")
+    histogram("crawl_parse_seconds", "Time to parse a page in a worker process", "parse_time")
+    metric("crawl_requests_total", "counter", "HTTP requests sent, by response status",
+           [((("stage", name), ("status", status)), count) for name, stage in stages for status, count in stage.statuses.items()])
+    metric("crawl_bytes_total", "counter", "Bytes of page bodies downloaded",
+           [((("stage", name),), stage.bytes) for name, stage in stages])
+    metric("crawl_cached_pages_total", "counter", "Pages read back from the page store instead of fetched",
+           [((("stage", name),), stage.cached_pages) for name, stage in stages])
+    metric("crawl_retries_total", "counter", "Requests retried after a failure",
+           [((("stage", name),), stage.retries) for name, stage in stages])
+    metric("crawl_failures_total", "counter", "URLs given up on, by kind of failure",
+           [((("stage", name), ("kind", kind)), count) for name, stage in stages for kind, count in stage.failures.items()])
+    metric("crawl_pages_parsed_total", "counter", "Pages parsed",
+           [((("stage", name),), stage.pages_parsed) for name, stage in stages])
+    metric("crawl_rows_total", "counter", "Results (URLs or spec records) a stage produced",
+           [((("stage", name),), stage.rows) for name, stage in stages])
+    metric("crawl_in_flight", "gauge", "Requests in flight right now",
+           [((("stage", name),), stage.in_flight) for name, stage in stages])
+    metric("crawl_in_flight_peak", "gauge", "Most requests in flight at once",
+           [((("stage", name),), stage.peak_in_flight) for name, stage in stages])
+    metric("crawl_queue_depth_max", "gauge", "Deepest the page/frontier queue got",
+           [((("stage", name),), stage.queue_depth_max) for name, stage in stages])
+    metric("crawl_stage_wall_seconds", "gauge", "First to last bit of work done for the stage",
+           [((("stage", name),), round(stage.finished - stage.started, 3) if stage.started else 0) for name, stage in stages])
+    return "\n".join(lines) + "\n"
+
+# Runs process_function and times it, in whichever process it ends up in
+def timed(process_function, page):
+    start = time.perf_counter()
+    result = process_function(page)
+    return result, time.perf_counter() - start
@@ -0,0 +1,159 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import time
+
+# Per URL crawl progress, so a crash at page 31,000 of specifications() doesn't cost us the other 31,000 pages.
+# Every fetched URL gets a row in a little SQLite database (status, where the body lives, when we got it)
+# and the page itself gets saved in the page store (see page_store.py), with body_ref being its sha256.
+# On a restart, anything marked "done" is read back out of the store and only the missing or failed URLs
+# actually hit the website again.
+# first_seen is when a URL was first fetched, and sticks when it gets fetched again (see refresh_schedule.py).
+# https://docs.python.org/3/library/sqlite3.html
+progress_db_file = "txt_files/crawl_progress.db"
+
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+def open_progress(db_file=progress_db_file):
+    # Worker processes (see work_queue.py) can all be writing to it at once, so wait a while for the lock.
+    # The CheckpointWriter thread shares the connection with the event loop, which is fine as long as SQLite
+    # was built thread safe (sqlite3.threadsafety == 3, the default)
+    conn = sqlite3.connect(db_file, timeout=60, check_same_thread=False)
+
+    # WAL + synchronous=NORMAL means a commit per URL is cheap, but still survives the process getting killed
+    # https://www.sqlite.org/wal.html
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS pages (
+                        url TEXT PRIMARY KEY,
+                        stage TEXT,
+                        status TEXT NOT NULL,
+                        body_ref TEXT,
+                        error TEXT,
+                        fetched_at REAL NOT NULL,
+                        first_seen REAL)""")
+
+    # Databases from before first_seen was a thing, the pages in there were first seen when they were fetched
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(pages)")]
+    if "first_seen" not in columns:
+        conn.execute("ALTER TABLE pages ADD COLUMN first_seen REAL")
+        conn.execute("UPDATE pages SET first_seen = fetched_at")
+    conn.commit()
+    return conn
+
+def mark_done(conn, store, url, body, stage=None, commit=True):
+    digest = store.put(url, body)
+    now = time.time()
+    conn.execute("""INSERT OR REPLACE INTO pages (url, stage, status, body_ref, error, fetched_at, first_seen)
+                    VALUES (?, ?, ?, ?, NULL, ?, COALESCE((SELECT first_seen FROM pages WHERE url = ?), ?))""",
+                 (url, stage, STATUS_DONE, digest, now, url, now))
+    if commit:
+        conn.commit()
+    return digest
+
+# mark_done for the crawl, done on a thread of its own so compressing the page, writing the blob and the SQLite
+# commit don't hold up the event loop (and every other request in flight) for each page. Commits get grouped:
+# whenever the thread catches up with the pages waiting for it, or every max_batch pages if it never does.
+# A crash can lose the last few rows, those pages just get fetched again next time.
+class CheckpointWriter:
+
+    def __init__(self, conn, store, max_batch=200):
+        self.conn = conn
+        self.store = store
+        self.max_batch = max_batch
+        self.pages = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+
+    # Returns once the page is in the store and its row is written (maybe not committed yet), errors come back here
+    async def mark_done(self, url, body, stage=None):
+        future = asyncio.get_running_loop().create_future()
+        self.pages.put((future, url, body, stage))
+        return await future
+
+    def run(self):
+        uncommitted = 0
+        while True:
+            page = self.pages.get()
+            if page is None:
+                break
+            future, url, body, stage = page
+            try:
+                digest = mark_done(self.conn, self.store, url, body, stage, commit=False)
+                uncommitted += 1
+                if uncommitted >= self.max_batch or self.pages.empty():
+                    self.conn.commit()
+                    uncommitted = 0
+                settle(future, digest)
+            except Exception as e:
+                settle(future, error=e)
+        self.conn.commit()
+
+    # Waits for everything queued up so far to be written and committed
+    def close(self):
+        self.pages.put(None)
+        self.thread.join()
+
+    def closed(self):
+        return not self.thread.is_alive()
+
+def settle(future, result=None, error=None):
+    def set_future():
+        if future.cancelled():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+    try:
+        future.get_loop().call_soon_threadsafe(set_future)
+    except RuntimeError:
+        pass    # The event loop's gone, nobody's waiting on it any more
+
+# A page we already have a good copy of stays done (a failed refresh shouldn't throw away the old copy),
+# it just gets the error noted down
+def mark_failed(conn, url, error, stage=None):
+    kept = conn.execute("UPDATE pages SET error = ? WHERE url = ? AND status = ?", (str(error), url, STATUS_DONE)).rowcount
+    if not kept:
+        now = time.time()
+        conn.execute("""INSERT OR REPLACE INTO pages (url, stage, status, body_ref, error, fetched_at, first_seen)
+                        VALUES (?, ?, ?, NULL, ?, ?, COALESCE((SELECT first_seen FROM pages WHERE url = ?), ?))""",
+                     (url, stage, STATUS_FAILED, str(error), now, url, now))
+    conn.commit()
+
+# Returns the saved page for url, or None if we don't have a good copy of it yet (or only one fetched before
+# fetched_since). If the database says done but the blob is gone, the store hands back None and we just fetch it again.
+def load_body(conn, store, url, fetched_since=None):
+    row = conn.execute("SELECT body_ref FROM pages WHERE url = ? AND status = ? AND fetched_at >= ?",
+                       (url, STATUS_DONE, fetched_since or 0)).fetchone()
+    if row is None:
+        return None
+    try:
+        return store.get_blob(row[0])
+    except Exception:
+        # Blobs only get written if there isn't one there already, so get rid of it or the copy fetched to
+        # replace it would never be saved
+        store.remove_blob(row[0])
+        raise
+
+# Which of these urls still need fetching (never seen, or failed last time)
+def pending_urls(conn, urls):
+    done = {row[0] for row in conn.execute("SELECT url FROM pages WHERE status = ?", (STATUS_DONE,))}
+    return [url for url in urls if url not in done]
+
+# url -> sha256 of the page we have for it, for the urls that are done
+def body_refs(conn, urls):
+    refs = dict(conn.execute("SELECT url, body_ref FROM pages WHERE status = ?", (STATUS_DONE,)))
+    return {url: refs[url] for url in urls if url in refs}
+
+# url -> (fetched_at, first_seen) for the urls that are done
+def fetch_times(conn, urls):
+    times = {row[0]: (row[1], row[2]) for row in
+             conn.execute("SELECT url, fetched_at, first_seen FROM pages WHERE status = ?", (STATUS_DONE,))}
+    return {url: times[url] for url in urls if url in times}
+
+# Quick count of done/failed URLs for a stage, handy for logging
+def stage_summary(conn, stage):
+    return dict(conn.execute("SELECT status, COUNT(*) FROM pages WHERE stage = ? GROUP BY status", (stage,)).fetchall())
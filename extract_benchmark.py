@@ -0,0 +1,59 @@
+import sqlite3
+import sys
+import time
+
+import crawl_progress
+import html_extract
+import page_store
+
+# Checks the lxml extractor gives the exact same results as the original BeautifulSoup code on the pages
+# we've already scraped (from txt_files/page_store), and times the two of them against each other.
+# Run scraping.py first so there are pages to test on, then:
+#   python extract_benchmark.py [pages per stage]
+# tests/test_html_extract.py checks the same thing on mock_site.py's pages, without needing a crawl first.
+sample_size = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+# Which extractor method parses the pages fetched by each scraping.py stage
+stage_methods = {
+    "all_models": "model_links",
+    "all_years": "year_links",
+    "all_specs": "spec_links",
+    "all_trims": "trim_links",
+    "specifications": "specifications",
+}
+
+store = page_store.PageStore()
+conn = sqlite3.connect(crawl_progress.progress_db_file)
+backends = [html_extract.get_extractor("bs4"), html_extract.get_extractor("lxml")]
+
+if backends[1].name != "lxml":
+    sys.exit("lxml isn't installed, nothing to compare against")
+
+all_matched = True
+for stage, method in stage_methods.items():
+    urls = [row[0] for row in conn.execute("SELECT url FROM pages WHERE stage = ? AND status = ? LIMIT ?",
+                                           (stage, crawl_progress.STATUS_DONE, sample_size))]
+    # Keep each page with its URL, so a missing page can't shift which URL a mismatch gets reported under
+    saved = [(url, page) for url, page in zip(urls, store.iter_pages(urls)) if page]
+    pages = [page for _, page in saved]
+    if not pages:
+        print(f"{stage:15} no pages saved, skipping")
+        continue
+
+    timings = []
+    results = []
+    for backend in backends:
+        extract = getattr(backend, method)
+        start = time.perf_counter()
+        results.append([extract(page) for page in pages])
+        timings.append(time.perf_counter() - start)
+
+    mismatches = [url for url, a, b in zip([url for url, _ in saved], results[0], results[1]) if a != b]
+    all_matched = all_matched and not mismatches
+
+    print(f"{stage:15} {len(pages):6} pages   bs4 {timings[0]:8.3f}s   lxml {timings[1]:8.3f}s   "
+          f"speedup {timings[0] / timings[1]:5.1f}x   mismatches {len(mismatches)}")
+    for url in mismatches[:5]:
+        print("    mismatch:", url)
+
+sys.exit(0 if all_matched else 1)
@@ -0,0 +1,148 @@
+import logging
+
+from bs4 import BeautifulSoup
+
+# lxml is optional - if it isn't installed we just fall back to the BeautifulSoup extractor
+# https://lxml.de/xpathxslt.html#the-xpath-class
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# The process*Urls functions in scraping.py only ever need a handful of links or spec rows out of each page,
+# but building a whole BeautifulSoup tree for every one of the ~40,000 pages is what makes parsing CPU bound.
+# The extractors in here pull out exactly those bits. Both return the same things, so they can be swapped
+# with parser_backend in scraping.py, and extract_benchmark.py checks they agree and times them.
+#
+#   model_links(page)     -> ["/cars/toyota_corolla", ...]
+#   year_links(page)      -> ["/overview/toyota_corolla_2019", ...]
+#   spec_links(page)      -> ["/specifications/toyota_corolla_2019", ...]
+#   trim_links(page)      -> ["/specifications/toyota_corolla_2019_le-cvt", ...] (None if the page has no trim list)
+#   specifications(page)  -> ("2019 Toyota Corolla LE CVT", [("MSRP", "$19,500"), ("Passenger Doors", "4"), ...])
+
+# The original BeautifulSoup code, moved out of scraping.py
+class Bs4Extractor:
+
+    name = "bs4"
+
+    def model_links(self, page):
+        soup = BeautifulSoup(page, 'html.parser')
+        links = []
+        for div in soup.find_all("div", {"class": "name"}):
+            a = div.find("a")
+            if a is not None and a.has_attr('href'):
+                links.append(a['href'])
+        return links
+
+    def year_links(self, page):
+        soup = BeautifulSoup(page, 'html.parser')
+        # Current model year first, then every additional model year
+        links = [a['href'] for a in soup.find_all("a", {"class": "btn avail-now first-item"}) if a.has_attr('href')]
+        links += [a['href'] for a in soup.find_all("a", {"class": "btn 1"}) if a.has_attr('href')]
+        return links
+
+    def spec_links(self, page):
+        soup = BeautifulSoup(page, 'html.parser')
+        return [a['href'] for a in soup.find_all("a", {"id": "ymm-nav-specs-btn"}) if a.has_attr('href')]
+
+    def trim_links(self, page):
+        soup = BeautifulSoup(page, 'html.parser')
+        divs = soup.find_all("div", {"class": "block-inner"})
+        if not divs:
+            return None
+        return [a['href'] for a in divs[-1].find_all("a") if a.has_attr('href')]
+
+    def specifications(self, page):
+        soup = BeautifulSoup(page, 'html.parser')
+        name = soup.find_all("title")[0].text[:-15]
+        rows = []
+
+        msrp_text = soup.find_all("div", {"class": "price"})
+        if msrp_text and len(msrp_text[0].find_all("a")) >= 1:
+            rows.append(("MSRP", msrp_text[0].find_all("a")[0].text))
+
+        for div in soup.find_all("div", {"class": "specs-set-item"}):
+            spans = div.find_all("span")
+            rows.append((spans[0].text, spans[1].text))
+        return name, rows
+
+# Matches an element having css_class as one of its classes, the same way BeautifulSoup's {"class": ...} does
+def has_class(css_class):
+    return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" % css_class
+
+# Same results as Bs4Extractor, but using lxml's C parser and XPath expressions compiled once up front
+class LxmlExtractor:
+
+    name = "lxml"
+
+    def __init__(self):
+        self.parser = etree.HTMLParser(encoding="utf-8")
+        self.model_xpath = etree.XPath("//div[%s]/descendant::a[1]/@href" % has_class("name"))
+        # BeautifulSoup matches a multi class string like "btn 1" against the classes joined by single spaces,
+        # which is what lets it find the site's class="btn  1" (two spaces), so normalize-space the same way
+        self.current_year_xpath = etree.XPath("//a[normalize-space(@class)='btn avail-now first-item']/@href")
+        self.other_years_xpath = etree.XPath("//a[normalize-space(@class)='btn 1']/@href")
+        self.spec_xpath = etree.XPath("//a[@id='ymm-nav-specs-btn']/@href")
+        self.trim_div_xpath = etree.XPath("//div[%s]" % has_class("block-inner"))
+        self.trim_link_xpath = etree.XPath(".//a/@href")
+        self.title_xpath = etree.XPath("//title")
+        self.msrp_xpath = etree.XPath("(//div[%s])[1]/descendant::a[1]" % has_class("price"))
+        self.spec_item_xpath = etree.XPath("//div[%s]" % has_class("specs-set-item"))
+        self.span_xpath = etree.XPath(".//span")
+
+    # Extractors get shipped off to Joblib's worker processes, and compiled XPaths can't be pickled,
+    # so just rebuild them on the other side
+    def __getstate__(self):
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
+
+    def parse(self, page):
+        # Handing lxml bytes + an explicit encoding, since it refuses str pages with an encoding declaration
+        return etree.fromstring(page.encode("utf-8"), self.parser)
+
+    def model_links(self, page):
+        return [str(href) for href in self.model_xpath(self.parse(page))]
+
+    def year_links(self, page):
+        tree = self.parse(page)
+        return [str(href) for href in self.current_year_xpath(tree) + self.other_years_xpath(tree)]
+
+    def spec_links(self, page):
+        return [str(href) for href in self.spec_xpath(self.parse(page))]
+
+    def trim_links(self, page):
+        divs = self.trim_div_xpath(self.parse(page))
+        if not divs:
+            return None
+        return [str(href) for href in self.trim_link_xpath(divs[-1])]
+
+    def specifications(self, page):
+        tree = self.parse(page)
+        name = text_of(self.title_xpath(tree)[0])[:-15]
+        rows = []
+
+        msrp = self.msrp_xpath(tree)
+        if msrp:
+            rows.append(("MSRP", text_of(msrp[0])))
+
+        for div in self.spec_item_xpath(tree):
+            spans = self.span_xpath(div)
+            rows.append((text_of(spans[0]), text_of(spans[1])))
+        return name, rows
+
+# Same as BeautifulSoup's .text - every bit of text under the element, joined together
+def text_of(element):
+    return "".join(element.itertext())
+
+extractors = {
+    "bs4": Bs4Extractor,
+    "lxml": LxmlExtractor,
+}
+
+def get_extractor(backend):
+    if backend == "lxml" and etree is None:
+        logging.warning("lxml isn't installed, falling back to the bs4 extractor. pip install lxml for faster parsing")
+        backend = "bs4"
+    return extractors[backend]()
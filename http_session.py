@@ -0,0 +1,41 @@
+import aiohttp
+
+# Every stage used to open its own aiohttp.ClientSession() with the default settings, so each one started
+# from scratch with no open connections and no DNS cache. With 40k+ requests to the same host that's a lot of
+# TCP + TLS handshakes, so the whole crawl now shares one long lived session built here.
+# https://docs.aiohttp.org/en/stable/client_advanced.html#limiting-connection-pool-size
+# https://docs.aiohttp.org/en/stable/client_reference.html#tcpconnector
+
+# aiohttp can only decode brotli responses if one of these is installed, so only ask for it if it is
+def accept_encoding():
+    try:
+        import brotli  # noqa: F401
+        return "gzip, deflate, br"
+    except ImportError:
+        pass
+
+    try:
+        import brotlicffi  # noqa: F401
+        return "gzip, deflate, br"
+    except ImportError:
+        return "gzip, deflate"
+
+# Has to be called from inside the event loop the session will be used on
+def make_session(limit=100, limit_per_host=0, dns_cache_seconds=300, keepalive_seconds=30, timeout_seconds=60,
+                 connect_timeout_seconds=15, user_agent=None):
+    # limit is a ceiling on open sockets, the stage limiters decide how many requests are actually in flight.
+    # keepalive_timeout keeps idle connections around between requests (and between stages) so they get reused.
+    connector = aiohttp.TCPConnector(limit=limit,
+                                     limit_per_host=limit_per_host,
+                                     use_dns_cache=True,
+                                     ttl_dns_cache=dns_cache_seconds,
+                                     keepalive_timeout=keepalive_seconds)
+
+    # total covers the whole request including reading the body, sock_connect just the connection
+    timeout = aiohttp.ClientTimeout(total=timeout_seconds, sock_connect=connect_timeout_seconds)
+
+    headers = {"Accept-Encoding": accept_encoding()}
+    if user_agent:
+        headers["User-Agent"] = user_agent
+
+    return aiohttp.ClientSession(connector=connector, timeout=timeout, headers=headers)
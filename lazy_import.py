@@ -0,0 +1,21 @@
+import importlib.util
+import sys
+
+# pandas, joblib, aiohttp, bs4 and lxml take the best part of a second to import between them, which is most of
+# the startup time for something like `python cli.py --help` that never touches them. lazy_import("pandas")
+# hands back the module straight away, and only actually imports it the first time something on it gets used.
+# Anything that's already been imported is just returned as is.
+# https://docs.python.org/3/library/importlib.html#implementing-lazy-imports
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError("No module named %r" % name, name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
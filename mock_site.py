@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import random
+import zlib
+
+from aiohttp import web
+
+# A local stand in for thecarconnection.com, so scraping.py can be run (and timed) without hitting the real
+# website or even needing a network connection. Serves a made up site with the same URL layout and the same
+# markup the extractors in html_extract.py look for:
+#
+#   /new-cars                                     <a class="add-zip" href="/make/new,acme">
+#   /make/new,acme                                <div class="name"><a href="/cars/acme_model-1">
+#   /cars/acme_model-1                            <a class="btn avail-now first-item" ...> + <a class="btn  1" ...>
+#   /overview/acme_model-1_2019                   <a id="ymm-nav-specs-btn" href="/specifications/acme_model-1_2019">
+#   /specifications/acme_model-1_2019             last <div class="block-inner"> has a link for every trim
+#   /specifications/acme_model-1_2019_trim-1      <title>, <div class="price"> and ~100 <div class="specs-set-item">
+#
+# Everything is generated from the URL, so the same URL always gets the same page.
+# Latency, errors (500s) and throttling (429s) can be injected to see how the crawler copes.
+#
+#   python mock_site.py --port 8080 --latency 0.05 --error-rate 0.01
+#   then point scraping.py at it: SCRAPER_WEBSITE=http://127.0.0.1:8080 python scraping.py
+
+# Spec name -> function that makes up a value for it, in the format the real site shows it (and that
+# python/data_cleaning.py expects)
+def spec_values(rng):
+    cylinders = rng.choice([4, 4, 6, 8])
+    gears = rng.choice([5, 6, 8, 9, 10])
+    wheel = rng.choice([16, 17, 18, 19, 20])
+    tire = "P%s/%s%sR%s" % (rng.choice([205, 215, 225, 235, 245]), rng.choice([45, 50, 55, 60, 65]), rng.choice("HVWY"), wheel)
+    money = lambda low, high: "{:,}".format(rng.randrange(low, high, 50))
+    number = lambda low, high, places=1: "%.*f" % (places, rng.uniform(low, high))
+    yes_no = lambda: rng.choice(["Yes", "Yes", "-"])
+
+    return {
+        "Gas Mileage": "%s MPG City/%s MPG Hwy" % (rng.randint(15, 35), rng.randint(20, 45)),
+        "Engine": "Gas %s" % cylinders,
+        "Engine Type": rng.choice(["Regular Unleaded", "Premium Unleaded", "Intercooled Turbo Premium Unleaded"]) +
+                       " %s-%s" % ("I" if cylinders == 4 else "V", cylinders),
+        "Displacement": "%s L/%s" % (number(1.4, 6.2), rng.randint(85, 380)),
+        "SAE Net Horsepower @ RPM": "%s @ %s" % (rng.randint(120, 650), rng.randrange(4800, 7200, 100)),
+        "SAE Net Torque @ RPM": "%s @ %s" % (rng.randint(110, 650), rng.randrange(1500, 5200, 100)),
+        "Fuel System": rng.choice(["Sequential MPI", "Direct Injection", "SMPI", "EFI", "Electronic Fuel Injection"]),
+        "Transmission": rng.choice(["%s-Speed Automatic" % gears, "%s-Speed Automatic w/OD" % gears,
+                                    "%s-Speed Manual" % gears, "Continuously Variable"]),
+        "Trans Type": str(gears),
+        "Trans Description Cont.": rng.choice(["Automatic w/OD", "Manual", "-"]),
+        "First Gear Ratio (:1)": number(3.0, 5.0, 2),
+        "Second Gear Ratio (:1)": number(1.8, 3.0, 2),
+        "Third Gear Ratio (:1)": number(1.2, 1.8, 2),
+        "Fourth Gear Ratio (:1)": number(0.9, 1.2, 2),
+        "Fifth Gear Ratio (:1)": number(0.7, 0.9, 2),
+        "Sixth Gear Ratio (:1)": number(0.5, 0.7, 2),
+        "Reverse Ratio (:1)": number(2.8, 4.0, 2),
+        "Final Drive Axle Ratio (:1)": number(2.5, 4.1, 2),
+        "Drivetrain": rng.choice(["Front Wheel Drive", "Rear Wheel Drive", "All Wheel Drive", "Four Wheel Drive",
+                                  "4-Wheel Drive"]),
+        "Body Style": rng.choice(["4dr Car", "2dr Car", "Sport Utility", "Convertible", "Station Wagon",
+                                  "Crew Cab Pickup - Short Bed", "Mini-van, Passenger"]),
+        "EPA Classification": rng.choice(["Compact Cars", "Midsize Cars", "Large Cars", "Two Seaters",
+                                          "Small Sport Utility Vehicles 4WD", "Standard Pickup Trucks 4WD"]),
+        "EPA Class": rng.choice(["Compact", "Midsize", "Large"]),
+        "Passenger Capacity": str(rng.choice([2, 4, 5, 5, 7, 8])),
+        "Passenger Doors": str(rng.choice([2, 4, 4])),
+        "Base Curb Weight (lbs)": str(rng.randint(2300, 6000)),
+        "Passenger Volume": "%s (%s)" % (number(80, 160), rng.randint(2000, 4500)),
+        "Wheelbase (in)": number(95, 160),
+        "Height, Overall (in)": number(48, 80),
+        "Width, Max w/o mirrors (in)": number(68, 82),
+        "Track Width, Front (in)": number(58, 70),
+        "Track Width, Rear (in)": number(58, 70),
+        "Front Head Room (in)": number(36, 42),
+        "Front Leg Room (in)": number(40, 45),
+        "Front Hip Room (in)": number(50, 60),
+        "Front Shoulder Room (in)": number(53, 66),
+        "Second Head Room (in)": number(34, 40),
+        "Second Leg Room (in)": number(30, 42),
+        "Second Hip Room (in)": number(48, 60),
+        "Second Shoulder Room (in)": number(52, 65),
+        "Fuel Tank Capacity, Approx (gal)": number(11, 36),
+        "EPA Fuel Economy Est - City (MPG)": str(rng.randint(12, 40)),
+        "EPA Fuel Economy Est - Hwy (MPG)": str(rng.randint(17, 45)),
+        "Fuel Economy Est-Combined (MPG)": str(rng.randint(14, 42)),
+        "Turning Diameter - Curb to Curb": number(33, 48),
+        "Front Tire Size": tire,
+        "Rear Tire Size": tire,
+        "Spare Tire Size": rng.choice(["Compact", "Full-Size", "-"]),
+        "Front Wheel Size (in)": "%s x %s" % (wheel, rng.choice([6.5, 7, 7.5, 8])),
+        "Rear Wheel Size (in)": "%s x %s" % (wheel, rng.choice([6.5, 7, 7.5, 8])),
+        "Spare Wheel Size (in)": "%s x 4" % rng.choice([16, 17]),
+        "Front Wheel Material": rng.choice(["Aluminum", "Steel", "Alloy"]),
+        "Rear Wheel Material": rng.choice(["Aluminum", "Steel", "Alloy"]),
+        "Spare Wheel Material": rng.choice(["Steel", "-"]),
+        "Steering Type": rng.choice(["Rack-Pinion", "Recirculating Ball"]),
+        "Suspension Type - Front": rng.choice(["Strut", "Short and Long Arm", "Double Wishbone"]),
+        "Suspension Type - Front (Cont.)": rng.choice(["Coil Springs", "-"]),
+        "Suspension Type - Rear": rng.choice(["Multi-Link", "Torsion Beam", "Leaf"]),
+        "Suspension Type - Rear (Cont.)": rng.choice(["Coil Springs", "-"]),
+        "Brake Type": "Pwr",
+        "Brake ABS System": "4-Wheel",
+        "Disc - Front (Yes or   )": "Yes",
+        "Disc - Rear (Yes or   )": yes_no(),
+        "Front Brake Rotor Diam x Thickness (in)": number(10, 15),
+        "Rear Brake Rotor Diam x Thickness (in)": number(10, 14),
+        "Basic Miles/km": rng.choice(["36,000", "50,000", "49999", "Unlimited"]),
+        "Basic Years": str(rng.choice([3, 4, 5])),
+        "Corrosion Years": str(rng.choice([5, 6, 7, 12])),
+        "Drivetrain Miles/km": rng.choice(["60,000", "100,000", "Unlimited"]),
+        "Drivetrain Years": str(rng.choice([5, 6, 10])),
+        "Roadside Assistance Miles/km": rng.choice(["36,000", "60,000", "Unlimited"]),
+        "Roadside Assistance Years": str(rng.choice([2, 3, 4, 5])),
+        "Air Bag-Frontal-Driver": "Yes",
+        "Air Bag-Frontal-Passenger": "Yes",
+        "Air Bag-Passenger Switch (On/Off)": yes_no(),
+        "Air Bag-Side Body-Front": yes_no(),
+        "Air Bag-Side Body-Rear": yes_no(),
+        "Air Bag-Side Head-Front": yes_no(),
+        "Air Bag-Side Head-Rear": yes_no(),
+        "Brakes-ABS": "Yes",
+        "Child Safety Rear Door Locks": yes_no(),
+        "Daytime Running Lights": yes_no(),
+        "Traction Control": yes_no(),
+        "Night Vision": rng.choice(["-", "-", "Yes"]),
+        "Rollover Protection Bars": rng.choice(["-", "-", "Yes"]),
+        "Fog Lamps": yes_no(),
+        "Parking Aid": yes_no(),
+        "Tire Pressure Monitor": yes_no(),
+        "Back-Up Camera": yes_no(),
+        "Stability Control": yes_no(),
+        "MSRP price": "$%s" % money(15000, 120000),
+    }
+
+class MockSite:
+
+    def __init__(self, makes=5, models=4, years=3, trims=4, first_year=2019, latency=0.0, error_rate=0.0,
+                 throttle_rate=0.0, padding_kb=40, seed=0):
+        self.makes = makes
+        self.models = models
+        self.years = years
+        self.trims = trims
+        self.first_year = first_year
+        self.latency = latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.seed = seed
+        self.requests = 0
+        self.errors_sent = 0
+
+        # Real pages are mostly scripts, nav and ads around the bits we care about, so pad every page out
+        # to roughly the same size to keep parsing honest
+        self.padding = "<div class=\"boilerplate\">%s</div>" % ("<p>Lorem ipsum dolor sit amet</p>" * (padding_kb * 1024 // 32))
+
+        # Only used for injecting latency/errors, the pages themselves only depend on the URL
+        self.rng = random.Random(seed)
+
+    # Same URL always gets the same made up values
+    def rng_for(self, path):
+        return random.Random(zlib.crc32(path.encode("utf-8")) ^ self.seed)
+
+    def wrap(self, title, body):
+        return ("<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>%s</title></head><body>%s%s</body></html>"
+                % (title, body, self.padding))
+
+    def new_cars(self):
+        links = "".join("<a class=\"add-zip \" href=\"/make/new,make-%s\" title=\"Make %s\">Make %s</a>" % (m, m, m)
+                        for m in range(1, self.makes + 1))
+        return self.wrap("New Cars", links)
+
+    def make_page(self, make):
+        links = "".join("<div class=\"name\"><a href=\"/cars/%s_model-%s\">%s Model %s</a></div>" % (make, m, make, m)
+                        for m in range(1, self.models + 1))
+        return self.wrap(make, links)
+
+    def model_page(self, make_model):
+        years = [self.first_year - y for y in range(self.years)]
+        links = "<a class=\"btn avail-now first-item\" href=\"/overview/%s_%s\">%s</a>" % (make_model, years[0], years[0])
+        links += "".join("<a class=\"btn  1\" href=\"/overview/%s_%s\">%s</a>" % (make_model, y, y) for y in years[1:])
+        return self.wrap(make_model, links)
+
+    def overview_page(self, make_model_year):
+        return self.wrap(make_model_year, "<a id=\"ymm-nav-specs-btn\" href=\"/specifications/%s\">Specs</a>" % make_model_year)
+
+    def year_specs_page(self, make_model_year):
+        links = "".join("<a href=\"/specifications/%s_trim-%s\">Trim %s</a>" % (make_model_year, t, t)
+                        for t in range(1, self.trims + 1))
+        return self.wrap(make_model_year, "<div class=\"block-inner\">nav</div><div class=\"block-inner\">%s</div>" % links)
+
+    def trim_page(self, path, make_model_year_trim):
+        make, model, year, trim = make_model_year_trim.split("_")
+        values = spec_values(self.rng_for(path))
+        msrp = values.pop("MSRP price")
+        title = "%s %s %s %s Specifications" % (year, make.title(), model.title(), trim.title())
+
+        specs = "".join("<div class=\"specs-set-item\"><span class=\"key\">%s</span><span class=\"value\">%s</span></div>"
+                        % (name, value) for name, value in values.items())
+        return self.wrap(title, "<div class=\"price\">Starting at <a href=\"#\">%s</a></div>%s" % (msrp, specs))
+
+    def page_for(self, path):
+        parts = path.strip("/").split("/")
+        if path == "/new-cars":
+            return self.new_cars()
+        if len(parts) == 2 and parts[0] == "make" and parts[1].startswith("new,"):
+            return self.make_page(parts[1][4:])
+        if len(parts) == 2 and parts[0] == "cars":
+            return self.model_page(parts[1])
+        if len(parts) == 2 and parts[0] == "overview":
+            return self.overview_page(parts[1])
+        if len(parts) == 2 and parts[0] == "specifications":
+            pieces = parts[1].count("_")
+            if pieces == 2:
+                return self.year_specs_page(parts[1])
+            if pieces == 3:
+                return self.trim_page(path, parts[1])
+        return None
+
+    async def handle(self, request):
+        self.requests += 1
+        if self.latency:
+            # Somewhere between half and one and a half times the latency, so requests don't all line up
+            await asyncio.sleep(self.latency * (0.5 + self.rng.random()))
+
+        if self.throttle_rate and self.rng.random() < self.throttle_rate:
+            self.errors_sent += 1
+            return web.Response(status=429, headers={"Retry-After": "1"})
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors_sent += 1
+            return web.Response(status=500)
+
+        page = self.page_for(request.path)
+        if page is None:
+            raise web.HTTPNotFound()
+        return web.Response(text=page, content_type="text/html")
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get("/{path:.*}", self.handle)
+        return app
+
+    def total_pages(self):
+        years = self.makes * self.models * self.years
+        return 1 + self.makes + self.makes * self.models + years * 2 + years * self.trims
+
+# Starts serving site on the current event loop, returns the runner so it can be cleaned up later
+async def start(site, host="127.0.0.1", port=8080):
+    runner = web.AppRunner(site.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+def add_site_arguments(parser):
+    parser.add_argument("--makes", type=int, default=5, help="number of makes (default 5)")
+    parser.add_argument("--models", type=int, default=4, help="models per make (default 4)")
+    parser.add_argument("--years", type=int, default=3, help="model years per model (default 3)")
+    parser.add_argument("--trims", type=int, default=4, help="trims per model year (default 4)")
+    parser.add_argument("--latency", type=float, default=0.0, help="average seconds to wait before answering")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that get a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of requests that get a 429")
+    parser.add_argument("--padding-kb", type=int, default=40, help="boilerplate added to every page, in KB")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the made up data")
+
+def site_from_arguments(args):
+    return MockSite(makes=args.makes, models=args.models, years=args.years, trims=args.trims, latency=args.latency,
+                    error_rate=args.error_rate, throttle_rate=args.throttle_rate, padding_kb=args.padding_kb,
+                    seed=args.seed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake thecarconnection.com for testing scraping.py offline")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    site = site_from_arguments(args)
+    print("Serving %s pages on http://%s:%s" % (site.total_pages(), args.host, args.port))
+    web.run_app(site.app(), host=args.host, port=args.port, access_log=None)
@@ -0,0 +1,204 @@
+import collections
+import hashlib
+import os
+import re
+import zlib
+
+# On disk store for the raw HTML pages, replacing the giant pickled list that used to live in
+# txt_files/all_data_file.txt (which had to be unpickled in one go before we could even start processing).
+#
+# Layout:
+#   txt_files/page_store/index.tsv          url <tab> sha256 of the page, one line per page (last line wins)
+#   txt_files/page_store/zdict.bin          shared zlib dictionary, trained on a sample of spec pages
+#   txt_files/page_store/blobs/ab/abcd...z  zlib compressed page, named after the sha256 of its contents
+#
+# Pages are content addressed, so two trims with the exact same page are only stored once. The rest of the
+# trim pages are 95% the same boilerplate, so compressing each one against a shared dictionary means every
+# blob only really has to store what's different about that car.
+# https://docs.python.org/3/library/zlib.html#zlib.compressobj
+#
+# The dictionary is built from the first zdict_sample_pages /specifications/ pages (trims and model years,
+# nearly every page in a crawl) rather than whatever page happens to come first, which is the makes page and
+# looks nothing like them. Pages stored before that are compressed without one. zlib writes the dictionary's
+# adler32 into the header of every blob that used one, so get_blob knows which blobs need it.
+page_store_dir = "txt_files/page_store"
+
+# zlib can only look back 32KB, so there's no point in a bigger dictionary than that
+ZDICT_SIZE = 32 * 1024
+
+zdict_sample_url = "/specifications/"
+zdict_sample_pages = 20
+
+# zlib's own default. On the crawl's spec pages (against the dictionary) level 9 came out under 1% smaller
+# and took about 3 times as long, and every page goes through here
+compression_level = 6
+
+class PageStore:
+
+    def __init__(self, root=page_store_dir):
+        self.root = root
+        self.index_file = os.path.join(root, "index.tsv")
+        self.zdict_file = os.path.join(root, "zdict.bin")
+        os.makedirs(os.path.join(root, "blobs"), exist_ok=True)
+
+        # url -> sha256, small enough (~32k entries) to just keep in memory
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file, encoding="utf-8") as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    # A crash mid write can leave half a line at the end, just skip it
+                    if len(parts) == 2 and len(parts[1]) == 64:
+                        self.index[parts[0]] = parts[1]
+
+        self.zdict = None
+        self.zdict_samples = []
+        self.load_zdict()
+
+        self.index_handle = open(self.index_file, "a", encoding="utf-8")
+
+    def load_zdict(self):
+        if self.zdict is None and os.path.exists(self.zdict_file):
+            with open(self.zdict_file, "rb") as f:
+                self.zdict = f.read()
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, "blobs", digest[:2], digest + ".z")
+
+    # Save a page, returns the sha256 it was stored under
+    def put(self, url, body):
+        data = body.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest)
+
+        if not os.path.exists(path):
+            if self.zdict is None:
+                self.sample_for_zdict(url, data)
+
+            if self.zdict is not None:
+                compressor = zlib.compressobj(level=compression_level, zdict=self.zdict)
+            else:
+                compressor = zlib.compressobj(level=compression_level)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            write_atomic(path, compressor.compress(data) + compressor.flush())
+
+        if self.index.get(url) != digest:
+            self.index[url] = digest
+            self.index_handle.write("%s\t%s\n" % (url, digest))
+            self.index_handle.flush()
+
+        return digest
+
+    # Holds on to spec pages until there's enough of them to train the dictionary on. Another process sharing the
+    # store may have got there first, in which case we just use theirs.
+    def sample_for_zdict(self, url, data):
+        self.load_zdict()
+        if self.zdict is not None:
+            self.zdict_samples = []
+            return
+
+        if zdict_sample_url in url:
+            self.zdict_samples.append(data)
+        if len(self.zdict_samples) >= zdict_sample_pages:
+            self.zdict = claim_file(self.zdict_file, train_zdict(self.zdict_samples))
+            self.zdict_samples = []
+
+    # Read back a single page by its sha256, without touching any of the others
+    def get_blob(self, digest):
+        try:
+            with open(self.blob_path(digest), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+
+        dict_id = zdict_id(data)
+        if dict_id is None:
+            decompressor = zlib.decompressobj()
+        else:
+            # Another process sharing the store might have set the dictionary up since we started
+            self.load_zdict()
+            if self.zdict is None:
+                raise FileNotFoundError("%s is missing, page %s was compressed against it and can't be read without it"
+                                        % (self.zdict_file, digest))
+            if zlib.adler32(self.zdict) != dict_id:
+                raise ValueError("Page %s was compressed against a different dictionary than %s"
+                                 % (digest, self.zdict_file))
+            decompressor = zlib.decompressobj(zdict=self.zdict)
+        return (decompressor.decompress(data) + decompressor.flush()).decode("utf-8")
+
+    def remove_blob(self, digest):
+        try:
+            os.remove(self.blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+    # Read back a single page by its url, None if we don't have it
+    def get(self, url):
+        digest = self.index.get(url)
+        if digest is None:
+            return None
+        return self.get_blob(digest)
+
+    def __contains__(self, url):
+        return url in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    # Lazily yields the pages for urls in order, so only one page is in memory at a time
+    def iter_pages(self, urls):
+        for url in urls:
+            yield self.get(url)
+
+    def close(self):
+        self.index_handle.close()
+
+# The adler32 of the dictionary a zlib blob was compressed against, None if it didn't use one. It's in the two
+# byte header's FDICT flag, followed by the 4 byte id. https://www.rfc-editor.org/rfc/rfc1950#section-2.2
+def zdict_id(data):
+    if len(data) >= 6 and data[1] & 0x20:
+        return int.from_bytes(data[2:6], "big")
+    return None
+
+# Builds a dictionary out of the markup (split after every ">") that at least half of the sample pages share,
+# in the order it shows up on the first page so neighbouring tags stay together. Anything repeated on the page
+# (the boilerplate filler, rows of identical tags) only goes in once. If it's too big the start gets cut off,
+# since zlib finds matches near the end of the dictionary for the fewest bits.
+def train_zdict(samples, size=ZDICT_SIZE):
+    pieces = [re.split(rb"(?<=>)", data) for data in samples]
+    counts = collections.Counter()
+    for page_pieces in pieces:
+        counts.update(set(page_pieces))
+
+    common = []
+    seen = set()
+    for piece in pieces[0]:
+        if piece and piece not in seen and counts[piece] * 2 >= len(samples):
+            seen.add(piece)
+            common.append(piece)
+    return b"".join(common)[-size:]
+
+# Write to a temp file and rename it over, so a crash mid write never leaves half a file behind. The temp file
+# is named after the process, so workers sharing the store can't trip over each other's half written files.
+# https://stackoverflow.com/a/2333979
+def write_atomic(path, data):
+    tmp = "%s.%s.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+# Writes data to path unless it's already there, and returns whatever path ends up holding. With several worker
+# processes storing their first page at the same time only one of them gets to pick the dictionary, everyone
+# else has to use that one (os.link fails if path exists, where a rename would just replace it).
+def claim_file(path, data):
+    tmp = "%s.%s.tmp" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(data)
+    try:
+        os.link(tmp, path)
+        return data
+    except FileExistsError:
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(tmp)
@@ -0,0 +1,280 @@
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+# The cleaning steps data_cleaning.py used to do as dozens of .str.replace calls one after the other (15 of
+# them just for Gears), plus a whole frame .replace("NA", np.nan) every few lines, written out as a table of
+# rules instead. Each rule says which column it reads, the steps that turn one raw value into a clean one,
+# and what type comes out the other end.
+#
+# Every column only goes through one pass: the distinct values in it get cleaned once each (most spec columns
+# only have a few hundred distinct values across 32,000 cars) and the results are mapped back onto every row.
+# clean() also times each rule and counts the values that were there but didn't survive parsing.
+#
+# The steps do exactly what the old chained replaces did, quirks and all (same output on the same data),
+# so python/data_cleaning.py and anything scoring raw spec records share the one set of rules.
+#
+# Steps, each one is skipped once a value is missing:
+#   ("extract", pattern)      regex search, keeps the named group "value" (missing if there's no match)
+#   ("sub", pattern, repl)    regex substitution
+#   ("replace", old, new)     plain text substitution
+#   ("map", {old: new})       swaps whole values, None means missing
+#   ("lower",) ("strip",)     same as the str methods
+#   ("digits",)               drops everything but digits and dots
+#
+# Kinds:
+#   "text"     cleaned strings
+#   "float"    each value turned into a float, anything that won't parse is missing
+#   "numeric"  pd.to_numeric(errors="coerce") over the cleaned strings (ints stay ints)
+
+# What the site shows for a spec it doesn't have, blanked out in every column before anything else happens.
+# The old script blanked empty strings in every column too (part way through, but before anything could make a new one).
+missing_values = ["NA", "- TBD -", "- TBD –", ""]
+
+# Rules read the car names (the index) instead of a column when their source is this
+INDEX = None
+
+non_digits = re.compile(r"[^\d.]+")
+
+class Rule:
+
+    def __init__(self, column, source, steps=(), kind="text", clip_lower=None):
+        self.column = column
+        self.source = source
+        self.steps = [compile_step(step) for step in steps]
+        self.kind = kind
+        self.clip_lower = clip_lower
+
+    def __repr__(self):
+        return "<Rule %s <- %s (%s)>" % (self.column, "index" if self.source is INDEX else self.source, self.kind)
+
+    def clean_value(self, value):
+        for step in self.steps:
+            value = step(value)
+            if value is None:
+                return None
+        return value
+
+    # Cleans every distinct value once, then maps the results back onto the rows
+    def apply(self, values):
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        cleaned = [self.clean_value(str(value)) for value in uniques]
+
+        if self.kind == "float":
+            parsed = np.array([to_float(value) for value in cleaned] + [np.nan], dtype="float64")
+            result = pd.Series(parsed[codes], index=values.index, name=self.column)
+        else:
+            cleaned = np.array(cleaned + [None], dtype=object)
+            result = pd.Series(cleaned[codes], index=values.index, name=self.column)
+            if self.kind == "numeric":
+                result = pd.to_numeric(result, errors="coerce")
+            else:
+                result = result.fillna(np.nan)
+
+        if self.clip_lower is not None:
+            result = result.clip(lower=self.clip_lower)
+        return result
+
+# Rear Tire Width / Front Tire Width and friends
+class Ratio:
+
+    kind = "float"
+
+    def __init__(self, column, numerator, denominator):
+        self.column = column
+        self.numerator = numerator
+        self.denominator = denominator
+
+    def __repr__(self):
+        return "<Ratio %s = %s / %s>" % (self.column, self.numerator, self.denominator)
+
+def compile_step(step):
+    name, args = step[0], step[1:]
+    if name == "extract":
+        pattern = re.compile(args[0], re.DOTALL)
+        def extract(value):
+            match = pattern.search(value)
+            return match.group("value") if match else None
+        return extract
+    if name == "sub":
+        pattern = re.compile(args[0])
+        return lambda value: pattern.sub(args[1], value)
+    if name == "replace":
+        return lambda value: value.replace(args[0], args[1])
+    if name == "map":
+        mapping = args[0]
+        return lambda value: mapping.get(value, value)
+    if name == "lower":
+        return str.lower
+    if name == "strip":
+        return str.strip
+    if name == "digits":
+        return lambda value: non_digits.sub("", value)
+    raise ValueError("Unknown cleaning step %r" % (step,))
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+# Number of gears from the text before "-speed" - the last two characters of it, which leaves words like
+# "variable" (CVTs count as 1 gear) or "automatic" when there's no number
+gears_map = {"le": "1", "ed": None, "ic": None, "es": None, "er": None, "ls": None, "ve": None, "to": None,
+             "de": None, "ch": None, "ct": None, "rs": None, "ft": None, "al": None, "s,": None}
+
+# In the order the old script did them. In place rules keep their column where it was, new ones get added
+# on the end in this order.
+rules = [
+    Rule("EPA Fuel Economy Est - City (MPG)", "EPA Fuel Economy Est - City (MPG)", [("sub", r"\(.*\)", "")], "numeric"),
+    Rule("Passenger Volume", "Passenger Volume", [("sub", r"\(.*\)", "")], "numeric"),
+    Rule("MSRP", "MSRP", [("replace", "$", ""), ("replace", ",", "")], "float"),
+    Rule("Basic Miles/km", "Basic Miles/km",
+         [("replace", ",", ""), ("sub", "Unlimited", "150000"), ("sub", "49999", "50000")], "float"),
+    Rule("Drivetrain Miles/km", "Drivetrain Miles/km", [("replace", ",", ""), ("sub", "Unlimited", "150000")], "float"),
+    Rule("Roadside Assistance Miles/km", "Roadside Assistance Miles/km",
+         [("replace", ",", ""), ("sub", "Unlimited", "100000")], "float"),
+    Rule("Gears", "Transmission",
+         [("lower",), ("extract", r"^(?P<value>.*?)(?:-speed|\Z)"), ("extract", r"(?P<value>.{0,2})\Z"), ("strip",),
+          ("map", gears_map), ("digits",)], "float"),
+    Rule("Net Horsepower", "SAE Net Horsepower @ RPM", [("extract", r"^(?P<value>[^@]*)"), ("digits",)], "float"),
+    Rule("Net Horsepower RPM", "SAE Net Horsepower @ RPM", [("extract", r"^[^@]*@(?P<value>[^@]*)"), ("digits",)], "float"),
+    Rule("Net Torque", "SAE Net Torque @ RPM", [("extract", r"^(?P<value>[^@]*)"), ("digits",)], "float"),
+    # Last four characters of the last word, so "280 @ 1750-4500" is 4500
+    Rule("Net Torque RPM", "SAE Net Torque @ RPM", [("extract", r"(?P<value>\S{1,4})\s*\Z"), ("digits",)], "float",
+         clip_lower=1000),
+    Rule("Cylinders", "Engine Type",
+         [("extract", r"^[^-]*-(?P<value>[^-]*)"), ("sub", "Cyl", "4"), ("sub", "in Electric I4", "4"), ("digits",)], "float"),
+    # First letter of the last word: I(nline), V, H, W...
+    Rule("Engine Configuration", "Engine Type",
+         [("extract", r"(?:^| )(?P<value>[^ ])[^ ]*\Z"), ("map", {"4": None, "T": None, "D": None, "G": None})]),
+    Rule("Engine Class", "Engine Type",
+         [("extract", r"^(?P<value>[^ ]*)"),
+          ("map", {"Turbo": "Turbocharged", "Electric/Gas": "Electric", "Turbo/Supercharger": "Supercharger",
+                   "Supercharged": "Supercharger"})]),
+    Rule("Displacement (L)", "Displacement", [("extract", r"^(?P<value>[^/]{0,3})"), ("sub", "39.", "3.9"), ("digits",)], "float"),
+    Rule("Displacement (cc)", "Displacement", [("extract", r"^[^/]*/(?P<value>[^/]*)"), ("digits",)], "float"),
+    # Last three characters before the first "/", so "P215/55HR17" is 215
+    Rule("Rear Tire Width", "Rear Tire Size",
+         [("extract", r"^[^/]*?(?P<value>[^/]{0,3})(?:/|\Z)"), ("strip",), ("map", {"R20": None}), ("digits",)], "float"),
+    Rule("Front Tire Width", "Front Tire Size",
+         [("extract", r"^[^/]*?(?P<value>[^/]{0,3})(?:/|\Z)"), ("strip",), ("map", {"R20": None}), ("digits",)], "float"),
+    Rule("Rear Wheel Size", "Rear Wheel Size (in)", [("digits",), ("extract", r"^(?P<value>.{0,2})")], "float"),
+    Rule("Front Wheel Size", "Front Wheel Size (in)", [("digits",), ("extract", r"^(?P<value>.{0,2})")], "float"),
+    # Speed rating, the letter before the rim size: "P215/55HR17" is H
+    Rule("Tire Rating", "Front Tire Size",
+         [("extract", r"(?P<value>[^/])[^/]{3}\Z"), ("map", {"5": None, "0": None, "1": None, "2": None})]),
+    Ratio("Tire Width Ratio", "Rear Tire Width", "Front Tire Width"),
+    Ratio("Wheel Size Ratio", "Rear Wheel Size", "Front Wheel Size"),
+    Rule("Tire Ratio", "Front Tire Size", [("extract", r"^[^/]*/(?P<value>[^/])"), ("map", {"Y": None})], "float"),
+    Rule("Year", INDEX, [("extract", r"^(?P<value>.{0,4})")], "float"),
+    Rule("Drivetrain", "Drivetrain",
+         [("sub", "4-Wheel Drive", "Four Wheel Drive"), ("sub", "Front wheel drive", "Front Wheel Drive"),
+          ("sub", "Four-Wheel Drive", "Four Wheel Drive")]),
+    Rule("Fuel System", "Fuel System",
+         [("sub", "Turbocharged EFI", "Electronic Fuel Injection"), ("sub", "Electric", "Electronic Fuel Injection"),
+          ("sub", "Sequential MPI (injection)", "Sequential MPI"), ("sub", "SMPI", "Sequential MPI"),
+          ("sub", "EFI", "Electronic Fuel Injection"), ("sub", "Direct Gasoline Injection", "Direct Injection")]),
+]
+
+# Everything in here gets pd.to_numeric(errors="coerce") once the rules are done
+specs_to_numeric = ['MSRP', 'Passenger Capacity', 'Passenger Doors',
+                    'Base Curb Weight (lbs)', 'Second Shoulder Room (in)',
+                    'Second Head Room (in)', 'Front Shoulder Room (in)',
+                    'Second Hip Room (in)', 'Front Head Room (in)', 'Second Leg Room (in)', 'Front Hip Room (in)',
+                    'Front Leg Room (in)', 'Width, Max w/o mirrors (in)', 'Track Width, Rear (in)',
+                    'Height, Overall (in)', 'Wheelbase (in)', 'Track Width, Front (in)',
+                    'Fuel Tank Capacity, Approx (gal)', 'EPA Fuel Economy Est - City (MPG)',
+                    'EPA Fuel Economy Est - Hwy (MPG)',
+                    'Fuel Economy Est-Combined (MPG)', 'Fourth Gear Ratio (:1)',
+                    'Second Gear Ratio (:1)', 'Reverse Ratio (:1)', 'Fifth Gear Ratio (:1)',
+                    'Third Gear Ratio (:1)', 'Final Drive Axle Ratio (:1)', 'First Gear Ratio (:1)',
+                    'Sixth Gear Ratio (:1)', 'Passenger Volume',
+                    'Front Brake Rotor Diam x Thickness (in)', 'Disc - Front (Yes or   )',
+                    'Rear Brake Rotor Diam x Thickness (in)', 'Rear Wheel Size (in)',
+                    'Rear Wheel Material', 'Spare Wheel Size (in)', 'Front Wheel Size (in)', 'Basic Miles/km',
+                    'Basic Years', 'Corrosion Years', 'Drivetrain Miles/km', 'Drivetrain Years',
+                    'Roadside Assistance Miles/km', 'Roadside Assistance Years', 'Year', 'Tire Ratio',
+                    'Front Tire Width', 'Rear Tire Width', 'Displacement (cc)', 'Displacement (L)', 'Net Torque RPM',
+                    'Net Torque', 'Gears', 'Net Horsepower', 'Net Horsepower RPM', 'Cylinders']
+
+# Raw specs that have been turned into something more useful above (or just aren't)
+specs_to_delete = ['Gas Mileage', 'Engine', 'Engine Type', 'SAE Net Horsepower @ RPM', 'SAE Net Torque @ RPM',
+                   'Displacement', 'Trans Description Cont.', 'Rear Tire Size', 'Front Tire Size', 'Rear Wheel Size (in)',
+                   'Front Wheel Size (in)', 'Transmission', 'EPA Class', 'Brake ABS System', 'Disc - Front (Yes or   )',
+                   'Brake Type', 'Disc - Rear (Yes or   )', 'Spare Tire Size', 'Spare Wheel Size (in)', 'Spare Wheel Material']
+
+# Columns with at least this fraction of missing values get dropped at the end
+max_missing = 0.5
+
+# "Turning Diameter - Curb to Curb (ft)" -> "Turning Diameter - Curb to Curb"
+def rename_column(name):
+    return name.split(" (ft")[0]
+
+# Blanks out the site's placeholders, same for every column
+def blank_missing(values):
+    return values.where(~values.isin(missing_values))
+
+# Raw specs (one row per car, car names as the index, every value a string) -> cleaned table.
+# Returns the table and a report with one row per rule: how long it took, how many values it was given and
+# how many of those didn't make it through (couldn't be parsed, or were mapped to missing on purpose).
+# keep_sparse_columns=True skips dropping the mostly empty columns, for cleaning a handful of rows at a time.
+def clean(raw, keep_sparse_columns=False):
+    report = []
+
+    # values_in is None for ratios, which don't have a single source column
+    def record(name, started, values_in, values_out):
+        present = values_in.notna() if values_in is not None else pd.Series(True, index=values_out.index)
+        report.append({
+            "rule": name,
+            "seconds": time.perf_counter() - started,
+            "values": int(present.sum()),
+            "failed": int((present & values_out.isna()).sum()),
+        })
+
+    started = time.perf_counter()
+    raw = raw.rename(columns=rename_column)
+    raw = pd.DataFrame({column: blank_missing(raw[column]) for column in raw.columns}, index=raw.index)
+    report.append({"rule": "blank missing values", "seconds": time.perf_counter() - started,
+                   "values": int(raw.notna().sum().sum()), "failed": 0})
+
+    # Column name -> values, in output order. In place rules overwrite, new ones get appended.
+    columns = {column: raw[column] for column in raw.columns}
+
+    for rule in rules:
+        if isinstance(rule, Ratio):
+            if rule.numerator not in columns or rule.denominator not in columns:
+                continue
+            source = None
+        elif rule.source is not INDEX and rule.source not in raw.columns:
+            continue
+        else:
+            source = raw[rule.source] if rule.source is not INDEX else pd.Series(raw.index, index=raw.index)
+
+        started = time.perf_counter()
+        if isinstance(rule, Ratio):
+            columns[rule.column] = columns[rule.numerator] / columns[rule.denominator]
+        else:
+            columns[rule.column] = rule.apply(source)
+        record(rule.column, started, source, columns[rule.column])
+
+    for column in specs_to_numeric:
+        # No point converting the ones that are about to be deleted
+        if column in columns and column not in specs_to_delete and not pd.api.types.is_numeric_dtype(columns[column]):
+            started = time.perf_counter()
+            before = columns[column]
+            columns[column] = pd.to_numeric(before, errors="coerce")
+            record("to_numeric " + column, started, before, columns[column])
+
+    cleaned = pd.DataFrame(columns, index=raw.index)
+    cleaned = cleaned.drop(columns=[column for column in specs_to_delete if column in cleaned.columns])
+
+    if not keep_sparse_columns:
+        cleaned = drop_sparse_columns(cleaned)
+
+    return cleaned, pd.DataFrame(report)
+
+def drop_sparse_columns(cleaned):
+    return cleaned.drop(columns=cleaned.columns[cleaned.isna().sum() >= max_missing * len(cleaned)])
@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# After cleaning, every text column is a Python object per value and every number is a float64, even Doors,
+# Cylinders, Gears and Year, so the table takes several times the memory it needs to. This picks the smallest
+# type that holds each column without changing any value:
+#   - text with few distinct values (Drivetrain, Body Style, Fuel System, ...) -> category
+#   - whole numbers -> the smallest int that fits (int8, int16, ...), or Int8, Int16, ... if there are gaps
+#   - other numbers -> float32 when every value comes back exactly the same, otherwise left as float64
+# https://pandas.pydata.org/docs/user_guide/scale.html#use-efficient-datatypes
+#
+# data_cleaning.py compacts the table before writing it, and read_table() compacts whatever it loads (CSV
+# doesn't keep dtypes, Parquet does).
+
+# Text columns with fewer distinct values than this fraction of the rows become categoricals, same as spec_table.py
+category_ratio = 0.5
+
+integer_types = [("int8", "Int8"), ("int16", "Int16"), ("int32", "Int32"), ("int64", "Int64")]
+
+def smallest_integer(values):
+    present = values.dropna()
+    low, high = (present.min(), present.max()) if len(present) else (0, 0)
+    for numpy_type, nullable_type in integer_types:
+        limits = np.iinfo(numpy_type)
+        if limits.min <= low and high <= limits.max:
+            return numpy_type if len(present) == len(values) else nullable_type
+    return None
+
+def compact_column(values):
+    if isinstance(values.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(values):
+        return values
+
+    if pd.api.types.is_numeric_dtype(values):
+        present = values.dropna()
+        if (present % 1 == 0).all():
+            integer_type = smallest_integer(values)
+            if integer_type is not None:
+                return values.astype(integer_type)
+        if pd.api.types.is_float_dtype(values) and values.dtype != "float32":
+            narrow = values.astype("float32")
+            if narrow.astype(values.dtype).equals(values):
+                return narrow
+        return values
+
+    if values.nunique() < category_ratio * len(values):
+        return values.astype("category")
+    return values
+
+# Returns the compacted copy and a report of every column's type and memory before and after
+def compact(frame):
+    columns, report = {}, []
+    for column in frame.columns:
+        before = frame[column]
+        after = compact_column(before)
+        columns[column] = after
+        report.append({
+            "column": column,
+            "dtype before": str(before.dtype),
+            "dtype after": str(after.dtype),
+            "MB before": before.memory_usage(index=False, deep=True) / 2**20,
+            "MB after": after.memory_usage(index=False, deep=True) / 2**20,
+        })
+    return pd.DataFrame(columns, index=frame.index), pd.DataFrame(report)
+
+def print_report(report):
+    print(report.to_string(index=False, formatters={"MB before": "{:.3f}".format, "MB after": "{:.3f}".format}))
+    before, after = report["MB before"].sum(), report["MB after"].sum()
+    print("%.1f MB -> %.1f MB (%.1fx smaller)" % (before, after, before / after if after else float("nan")))
+
+# Reads a table written by data_cleaning.py / imputation.py (the car names are the first column of a CSV,
+# the index of a Parquet file) and compacts it
+def read_table(file_name, report=False):
+    if file_name.endswith(".parquet"):
+        frame = pd.read_parquet(file_name)
+    else:
+        frame = pd.read_csv(file_name, index_col=0, low_memory=False)
+    frame, memory = compact(frame)
+    if report:
+        print_report(memory)
+    return frame
+
+def write_table(frame, file_name):
+    if file_name.endswith(".parquet"):
+        frame.to_parquet(file_name)
+    else:
+        frame.to_csv(file_name)
@@ -1,23 +1,37 @@
+import sys
+
 import pandas as pd
+
+import compact_dtypes
+import dummy_encoding
 pd.options.display.max_rows = 999
 
-df = pd.read_csv("", index_col=0)
+# One sparse pass over all the specs now instead of a get_dummies + concat per spec, see dummy_encoding.py.
+#   python creating_dummies.py [--update-vocabulary] [input csv] [output csv]
+# The categories (and so the columns) come from dummy_vocabulary.json, made from the data on the first run.
+# --update-vocabulary adds any categories that aren't in it yet - existing columns stay where they are.
+vocabulary_file = "dummy_vocabulary.json"
+update_vocabulary = "--update-vocabulary" in sys.argv
+arguments = [argument for argument in sys.argv[1:] if argument != "--update-vocabulary"]
+input_file = arguments[0] if len(arguments) > 0 else "car_data_imputed.csv"
+output_file = arguments[1] if len(arguments) > 1 else "car_data_dummies.csv"
+
+df = compact_dtypes.read_table(input_file)
+
+specs_to_dummies = dummy_encoding.specs_to_dummies
 
-specs_to_dummies = ['Drivetrain', 'Body Style', 'EPA Classification', 'Fuel System', 'Trans Type', 'Steering Type',
-                    'Front Wheel Material', 'Suspension Type - Rear', 'Suspension Type - Front (Cont.)', 'Suspension Type - Front',
-                    'Suspension Type - Rear (Cont.)', 'Air Bag-Frontal-Driver', 'Air Bag-Frontal-Passenger',
-                    'Air Bag-Passenger Switch (On/Off)', 'Air Bag-Side Body-Front', 'Air Bag-Side Body-Rear',
-                    'Air Bag-Side Head-Front', 'Air Bag-Side Head-Rear', 'Brakes-ABS', 'Child Safety Rear Door Locks',
-                    'Daytime Running Lights', 'Traction Control', 'Night Vision', 'Rollover Protection Bars', 'Fog Lamps',
-                    'Parking Aid', 'Tire Pressure Monitor', 'Back-Up Camera', 'Stability Control', 'Engine Configuration',
-                    'Engine Class','Tire Rating', 'Tire Ratio']
+vocabulary = dummy_encoding.load_vocabulary(vocabulary_file)
+if vocabulary is None or update_vocabulary:
+    vocabulary = dummy_encoding.build_vocabulary(df, specs_to_dummies, vocabulary)
+    dummy_encoding.save_vocabulary(vocabulary, vocabulary_file)
 
-for item in specs_to_dummies:
-    dummies = pd.get_dummies(df[item], prefix_sep=': ', prefix=item)
-    df = pd.concat([df, dummies], sort=False, axis=1)
+df, unknown = dummy_encoding.with_dummies(df, vocabulary)
 
-df = df.drop(specs_to_dummies, axis=1)
+# Values the vocabulary doesn't know about, rerun with --update-vocabulary to give them columns
+for spec, count in unknown.items():
+    print("%s: %s values not in %s" % (spec, count, vocabulary_file))
 
 # -------- export and inspect
 
-df.to_csv(r'')
+print("%s cars, %s columns (%.1f MB in memory)" % (len(df), len(df.columns), df.memory_usage(deep=True).sum() / 2**20))
+df.to_csv(output_file)
@@ -0,0 +1,42 @@
+import sys
+import time
+
+import compact_dtypes
+import dummy_encoding
+import feature_store
+
+# Builds the feature store training reads from (see feature_store.py), but only if the imputed data or the dummy
+# vocabulary changed since it was last built.
+#   python creating_features.py [--force] [input csv] [feature store folder]
+# The dummy columns come from the same dummy_vocabulary.json as creating_dummies.py (made from the data if
+# there isn't one yet). --force rebuilds it even if nothing changed.
+vocabulary_file = "dummy_vocabulary.json"
+force = "--force" in sys.argv
+arguments = [argument for argument in sys.argv[1:] if argument != "--force"]
+input_file = arguments[0] if len(arguments) > 0 else "car_data_imputed.csv"
+store_dir = arguments[1] if len(arguments) > 1 else feature_store.store_dir
+
+vocabulary = dummy_encoding.load_vocabulary(vocabulary_file)
+df = None
+if vocabulary is None:
+    df = compact_dtypes.read_table(input_file)
+    vocabulary = dummy_encoding.build_vocabulary(df, dummy_encoding.specs_to_dummies)
+    dummy_encoding.save_vocabulary(vocabulary, vocabulary_file)
+
+upstream = feature_store.upstream_hash(input_file, vocabulary)
+if not force and feature_store.is_current(upstream, store_dir):
+    print("%s is already up to date with %s" % (store_dir, input_file))
+    sys.exit(0)
+
+start = time.perf_counter()
+if df is None:
+    df = compact_dtypes.read_table(input_file)
+manifest = feature_store.build(df, vocabulary, upstream, store_dir)
+
+for spec, count in manifest["unknown_categories"].items():
+    print("%s: %s values not in %s" % (spec, count, vocabulary_file))
+if manifest["skipped_columns"]:
+    print("Not used as features: %s" % manifest["skipped_columns"])
+print("%s cars x %s features (%s numeric) written to %s in %.1fs" % (manifest["rows"], len(manifest["columns"]),
+                                                                      manifest["numeric_columns"], store_dir,
+                                                                      time.perf_counter() - start))
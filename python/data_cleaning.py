@@ -1,296 +1,49 @@
-import pandas as pd
-import numpy as np
-
-# Added low_memory=False to disable the "columns have mixed types" error. Obviously they have mixed
-# types, that's why we're going to clean up the data LOL.
-raw_data = pd.read_csv("car_data_process.csv", delimiter=',', encoding="utf-8-sig", nrows=110, index_col=0, low_memory=False).transpose()
-
-# -------- replace na and tbd with np nan
-raw_data.replace("NA", np.nan)
-raw_data = raw_data.replace("- TBD –", 'NA')
-raw_data = raw_data.replace("- TBD -", 'NA')
-raw_data['EPA Fuel Economy Est - City (MPG)'] = raw_data['EPA Fuel Economy Est - City (MPG)'].str.replace(r"\(.*\)","")
-raw_data = raw_data.replace("NA", np.nan)
-
-# -------- cols with forbidden characters
-raw_data = raw_data.rename(columns=lambda x: x.split(" (ft")[0])
-raw_data['Passenger Volume'] = raw_data['Passenger Volume'].str.replace(r"\(.*\)","")
-
-# -------- Clean MSRP and convert to float
-raw_data.MSRP = raw_data.MSRP.str.replace("$", "")
-raw_data.MSRP = raw_data.MSRP.str.replace(",", "")
-
-# -------- Clean basic miles and convert to float
-raw_data['Basic Miles/km'] = raw_data['Basic Miles/km'].str.replace(",", "")
-raw_data['Basic Miles/km'] = raw_data['Basic Miles/km'].str.replace("Unlimited", "150000")
-raw_data['Basic Miles/km'] = raw_data['Basic Miles/km'].str.replace("49999", "50000")
-
-# -------- Clean Drivetrain Miles and convert to float
-
-raw_data['Drivetrain Miles/km'] = raw_data['Drivetrain Miles/km'].str.replace(",", "")
-raw_data['Drivetrain Miles/km'] = raw_data['Drivetrain Miles/km'].str.replace("Unlimited", "150000")
-
-# -------- get Roadside Assistance Miles/km miles  as integer
-raw_data['Roadside Assistance Miles/km'] = raw_data['Roadside Assistance Miles/km'].str.replace(",", "")
-raw_data['Roadside Assistance Miles/km'] = raw_data['Roadside Assistance Miles/km'].str.replace("Unlimited", "100000")
-
-# -------- get number of gears
-raw_data['Transmission'] = raw_data['Transmission'].str.lower()
-raw_data['Gears'] = raw_data['Transmission'].str.split("-speed", expand=True, n = 1)[0].str[-2:].str.strip()
-raw_data.Gears = raw_data['Gears'].str.replace("le", "1")
-raw_data.Gears = raw_data['Gears'].str.replace("ed", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("ic", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("es", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("er", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("ls", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("ve", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("to", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("de", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("ch", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("ct", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("rs", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("ft", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("al", "NA")
-raw_data.Gears = raw_data['Gears'].str.replace("s,", "NA")
-
-# -------- get max horsepower
-raw_data['Net Horsepower'] = raw_data['SAE Net Horsepower @ RPM'].str.split("@",expand=True)[0]
-
-try:
-    # Removed ANY characters to stop the float conversion from failing.
-    # https://stackoverflow.com/a/53407967
-    raw_data['Net Horsepower'] = raw_data['Net Horsepower'].str.replace(r'[^\d.]+', '')
-    raw_data['Net Horsepower'] = raw_data['Net Horsepower'].astype(float)
-except Exception as e:
-    print("Net Horsepower failed: ", e)
-
-raw_data.replace("NA", np.nan, inplace=True)
-
-# -------- get max horsepower rpm
-raw_data['Net Horsepower RPM'] = raw_data['SAE Net Horsepower @ RPM'].str.split("@",expand=True)[1].str.strip()
-raw_data['Net Horsepower RPM'] = raw_data['Net Horsepower RPM'].str.replace("- TBD -", "NA")
-
-# -------- get max torque
-
-raw_data['Net Torque'] = raw_data['SAE Net Torque @ RPM'].str.split("@", expand=True)[0]
-raw_data.replace("NA", np.nan, inplace=True)
-
-try:
-    # Removed ANY characters to stop the float conversion from failing.
-    raw_data['Net Torque'] = raw_data['Net Torque'].str.replace(r'[^\d.]+', '')
-    raw_data['Net Torque'] = raw_data['Net Torque'].astype(float)
-except Exception as e:
-    print("Net Torque failed: ", e)
-
-# -------- get max torque rpm
-raw_data['Net Torque RPM'] = raw_data['SAE Net Torque @ RPM'].str.split().str.get(-1).str[-4:].str.strip()
-raw_data['Net Torque RPM'] = raw_data['Net Torque RPM'].str.replace("- TBD -", "NA").str.replace('-', 'NA')
-raw_data.replace("NA", np.nan, inplace=True)
-
-try:
-    # Removed ANY characters to stop the float conversion from failing.
-    raw_data['Net Torque RPM'] = raw_data['Net Torque RPM'].str.replace(r'[^\d.]+', '')
-    raw_data.replace("", np.nan, inplace=True)
-    raw_data['Net Torque RPM'] = raw_data['Net Torque RPM'].astype(float)
-except Exception as e:
-    print("Net Torque RPM failed: ", e)
-    
-raw_data['Net Torque RPM'] = raw_data['Net Torque RPM'].clip(lower=1000)
-
-# -------- number of cylinders
-raw_data['Cylinders'] = raw_data['Engine Type'].str.split("-", expand=True)[1]
-raw_data['Cylinders'] = raw_data['Cylinders'].str.replace("Cyl", "4")
-raw_data['Cylinders'] = raw_data['Cylinders'].str.replace("in Electric I4", "4")
-
-# -------- engine configuration
-raw_data['Engine Configuration'] = raw_data['Engine Type'].str.split(" ").str.get(-1).str[0]
-raw_data['Engine Configuration'] = raw_data['Engine Configuration'].str.replace("4", "NA")
-raw_data['Engine Configuration'] = raw_data['Engine Configuration'].str.replace("T", "NA")
-raw_data['Engine Configuration'] = raw_data['Engine Configuration'].str.replace("D", "NA")
-raw_data['Engine Configuration'] = raw_data['Engine Configuration'].str.replace("G", "NA")
-
-# -------- engine class
-raw_data["Engine Class"] = raw_data["Engine Type"].str.split(' ').str.get(0)
-raw_data["Engine Class"] = raw_data["Engine Class"].replace('Turbo', 'Turbocharged')
-raw_data["Engine Class"] = raw_data["Engine Class"].replace('Electric/Gas', 'Electric')
-raw_data["Engine Class"] = raw_data["Engine Class"].replace('Turbo/Supercharger', 'Supercharger')
-raw_data["Engine Class"] = raw_data["Engine Class"].replace('Electric/Gas', 'Electric')
-raw_data["Engine Class"] = raw_data["Engine Class"].replace('Supercharged', 'Supercharger')
-
-# -------- displacement - liters
-raw_data['Displacement (L)'] = raw_data['Displacement'].str.split("/", expand=True)[0].str[:3]
-raw_data['Displacement (L)'] = raw_data['Displacement (L)'].str.replace('39.', '3.9')
-
-# -------- displacement - cc
-raw_data['Displacement (cc)'] = raw_data['Displacement'].str.split("/", expand=True)[1]
-raw_data['Displacement (cc)'] = raw_data['Displacement (cc)'].str.replace('- TBD -', 'NA')
-raw_data['Displacement (cc)'] = raw_data['Displacement (cc)'].str.replace('- TBD –', 'NA')
-# raw_data.loc['2018 Buick Envision Specs: AWD 4-Door Essence':'2018 Buick Envision Specs: AWD 4-Door Preferred',
-# "Displacement (cc)"] = 'NA'
-
-# -------- get rear tire width
-raw_data["Rear Tire Width"] = raw_data["Rear Tire Size"].str.split("/").str.get(0).str[-3:].str.strip()
-raw_data["Rear Tire Width"] = raw_data["Rear Tire Width"].replace('R20', 'NA')
-raw_data.replace("NA", np.nan, inplace=True)
-
-try:
-    # Removed ANY characters to stop the float conversion from failing.
-    raw_data["Rear Tire Width"] = raw_data["Rear Tire Width"].str.replace(r'[^\d.]+', '')
-    raw_data["Rear Tire Width"] = raw_data["Rear Tire Width"].astype(float)
-except Exception as e:
-    print("Rear Tire Width failed: ", e)
-    
-
-# -------- get front tire width
-raw_data["Front Tire Width"] = raw_data["Front Tire Size"].str.split("/").str.get(0).str[-3:].str.strip()
-raw_data["Front Tire Width"] = raw_data["Front Tire Width"].replace('R20', 'NA')
-raw_data.replace("NA", np.nan, inplace=True)
-
-try:
-    # Removed ANY characters to stop the float conversion from failing.
-    raw_data["Front Tire Width"] = raw_data["Front Tire Width"].str.replace(r'[^\d.]+', '')
-    raw_data["Front Tire Width"] = raw_data["Front Tire Width"].astype(float)
-except Exception as e:
-    print("Front Tire Width failed: ", e)
-    
-# -------- get rear wheel size
-try:
-        # Removed ANY characters to stop the float conversion from failing.
-    raw_data["Rear Wheel Size (in)"] = raw_data["Rear Wheel Size (in)"].str.replace(r'[^\d.]+', '')
-    raw_data["Rear Wheel Size"] = raw_data["Rear Wheel Size (in)"].str[:2].astype(float)
-except Exception as e:
-    print("Rear Wheel Size (in) failed: ", e)
-
-# -------- get front wheel size
-try:
-        # Removed ANY characters to stop the float conversion from failing.
-    raw_data["Front Wheel Size (in)"] = raw_data["Front Wheel Size (in)"].str.replace(r'[^\d.]+', '')
-    raw_data["Front Wheel Size"] = raw_data["Front Wheel Size (in)"].str[:2].astype(float)
-except Exception as e:
-    print("Front Wheel Size (in) failed: ", e)
-
-# -------- get tire rating
-raw_data["Tire Rating"] = raw_data["Front Tire Size"].str.split("/").str.get(-1).str[-4]
-raw_data["Tire Rating"] = raw_data["Tire Rating"].replace('5', 'NA')
-raw_data["Tire Rating"] = raw_data["Tire Rating"].replace('0', 'NA')
-raw_data["Tire Rating"] = raw_data["Tire Rating"].replace('1', 'NA')
-raw_data["Tire Rating"] = raw_data["Tire Rating"].replace('2', 'NA')
-
-# -------- get width ratio
-raw_data["Tire Width Ratio"] = raw_data["Rear Tire Width"]/raw_data["Front Tire Width"]
-
-# -------- get size ratio
-raw_data["Wheel Size Ratio"] = raw_data["Rear Wheel Size"] / raw_data["Front Wheel Size"]
-
-# -------- get tire ratio
-raw_data["Tire Ratio"] = raw_data["Front Tire Size"].str.split("/").str.get(1).str[0]
-raw_data["Tire Ratio"] = raw_data["Tire Ratio"].replace('Y', 'NA')
-
-# -------- get year
-raw_data["Year"] = raw_data.index.str[:4].astype(float)
-
-# -------- edit drivetrain values
-raw_data['Drivetrain'] = raw_data['Drivetrain'].str.replace('4-Wheel Drive', 'Four Wheel Drive')
-raw_data['Drivetrain'] = raw_data['Drivetrain'].str.replace('Front wheel drive', 'Front Wheel Drive')
-raw_data['Drivetrain'] = raw_data['Drivetrain'].str.replace('Four-Wheel Drive', 'Four Wheel Drive')
-
-# -------- edit fuel system values
-raw_data['Fuel System'] = raw_data['Fuel System'].str.replace('Turbocharged EFI', 'Electronic Fuel Injection')
-raw_data['Fuel System'] = raw_data['Fuel System'].str.replace('Electric', 'Electronic Fuel Injection')
-raw_data['Fuel System'] = raw_data['Fuel System'].str.replace('Sequential MPI (injection)', 'Sequential MPI')
-raw_data['Fuel System'] = raw_data['Fuel System'].str.replace('SMPI', 'Sequential MPI')
-raw_data['Fuel System'] = raw_data['Fuel System'].str.replace('EFI', 'Electronic Fuel Injection')
-raw_data['Fuel System'] = raw_data['Fuel System'].str.replace('Direct Gasoline Injection', 'Direct Injection')
-
-# -------- replace na by npnan
-raw_data.replace("NA", np.nan, inplace=True)
-
-# -------- convert all to float
-raw_data.MSRP = raw_data.MSRP.astype(float)
-raw_data["Tire Ratio"] = raw_data["Tire Ratio"].astype(float)
-
-try:
-    # Removed ANY characters to stop the float conversion from failing.
-    raw_data['Displacement (cc)'] = raw_data['Displacement (cc)'].str.replace(r'[^\d.]+', '')
-    raw_data['Displacement (cc)'] = raw_data['Displacement (cc)'].astype(float)
-except Exception as e:
-    print("Displacement (cc) failed: ", e)
-
-try:
-    # Removed ANY characters to stop the float conversion from failing.
-    raw_data['Displacement (L)'] = raw_data['Displacement (L)'].str.replace(r'[^\d.]+', '')
-    raw_data['Displacement (L)'] = raw_data['Displacement (L)'].astype(float)
-except Exception as e:
-    print("Displacement (L) failed: ", e)
-
-try:
-    # Removed ANY characters to stop the float conversion from failing.
-    raw_data['Cylinders'] = raw_data['Cylinders'].str.replace(r'[^\d.]+', '')
-    raw_data['Cylinders'] = raw_data['Cylinders'].astype(float)
-except Exception as e:
-    print("Cylinders failed: ", e)
-
-# One of these had a dash in it, wtf?
-try:
-    raw_data['Net Horsepower RPM'] = raw_data['Net Horsepower RPM'].str.replace(r'[^\d.]+', '')
-    raw_data['Net Horsepower RPM'] = raw_data['Net Horsepower RPM'].astype(float)
-except Exception as e:
-    print("Net Horsepower RPM failed: ", e)
-
-try:
-    raw_data['Gears'] = raw_data['Gears'].str.replace(r'[^\d.]+', '')
-    raw_data['Gears'] = raw_data['Gears'].astype(float)
-except Exception as e:
-    print("Gears failed: ", e)
-    
-raw_data['Roadside Assistance Miles/km'] = raw_data['Roadside Assistance Miles/km'].astype(float)
-raw_data['Drivetrain Miles/km'] = raw_data['Drivetrain Miles/km'].astype(float)
-raw_data['Basic Miles/km'] = raw_data['Basic Miles/km'].astype(float)
-
-# -------- delete useless specs
-specs_to_numeric = ['MSRP', 'Passenger Capacity', 'Passenger Doors',
-                    'Base Curb Weight (lbs)', 'Second Shoulder Room (in)',
-                    'Second Head Room (in)', 'Front Shoulder Room (in)',
-                    'Second Hip Room (in)', 'Front Head Room (in)', 'Second Leg Room (in)', 'Front Hip Room (in)',
-                    'Front Leg Room (in)', 'Width, Max w/o mirrors (in)', 'Track Width, Rear (in)',
-                    'Height, Overall (in)', 'Wheelbase (in)', 'Track Width, Front (in)',
-                    'Fuel Tank Capacity, Approx (gal)', 'EPA Fuel Economy Est - City (MPG)',
-                    'EPA Fuel Economy Est - Hwy (MPG)',
-                    'Fuel Economy Est-Combined (MPG)', 'Fourth Gear Ratio (:1)',
-                    'Second Gear Ratio (:1)', 'Reverse Ratio (:1)', 'Fifth Gear Ratio (:1)',
-                    'Third Gear Ratio (:1)', 'Final Drive Axle Ratio (:1)', 'First Gear Ratio (:1)',
-                    'Sixth Gear Ratio (:1)', 'Passenger Volume',
-                    'Front Brake Rotor Diam x Thickness (in)', 'Disc - Front (Yes or   )',
-                    'Rear Brake Rotor Diam x Thickness (in)', 'Rear Wheel Size (in)',
-                    'Rear Wheel Material', 'Spare Wheel Size (in)', 'Front Wheel Size (in)', 'Basic Miles/km',
-                    'Basic Years', 'Corrosion Years', 'Drivetrain Miles/km', 'Drivetrain Years',
-                    'Roadside Assistance Miles/km', 'Roadside Assistance Years', 'Year', 'Tire Ratio',
-                    'Front Tire Width', 'Rear Tire Width', 'Displacement (cc)', 'Displacement (L)', 'Net Torque RPM',
-                    'Net Torque', 'Gears', 'Net Horsepower', 'Net Horsepower RPM', 'Cylinders']
-
-for i in specs_to_numeric:
-    try:
-        raw_data[i] = pd.to_numeric(raw_data[i], errors='coerce')
-    except Exception as e:
-        print("ERROR with column: ", e)
-    
-specs_to_delete = ['Gas Mileage', 'Engine', 'Engine Type', 'SAE Net Horsepower @ RPM', 'SAE Net Torque @ RPM',
-                  'Displacement', 'Trans Description Cont.', 'Rear Tire Size', 'Front Tire Size', 'Rear Wheel Size (in)',
-                  'Front Wheel Size (in)', 'Transmission', 'EPA Class', 'Brake ABS System', 'Disc - Front (Yes or   )',
-                  'Brake Type', 'Disc - Rear (Yes or   )', 'Spare Tire Size', 'Spare Wheel Size (in)', 'Spare Wheel Material']
-raw_data.drop(specs_to_delete, axis=1, inplace=True)
-
-# -------- Identifying columns with NaN totalling more than 50% of elements
-col_to_delete = raw_data.columns[raw_data.isna().sum() >= 0.5*len(raw_data)].tolist()
-
-# -------- removing columns with NaNs totalling more than 50% of elements
-raw_data.drop(col_to_delete, axis=1, inplace=True)
-
-# -------- deleting old cars
-# Not doing this, want all the data
-#raw_data = raw_data.loc[raw_data['Year'] >= 2016]
-
-# Write result CSV out to new CSV file for comparsion
-raw_data.to_csv("car_data_processed.csv")
+import sys
 
+import pandas as pd
 
+import cleaning_rules
+import compact_dtypes
+import incremental
+
+# All the actual cleaning lives in cleaning_rules.py now, as a table of rules (one pass per column instead
+# of dozens of chained .str.replace calls over the whole frame). Same output as before.
+#   python data_cleaning.py [--incremental] [input csv or parquet] [output csv]
+# The input can be the wide CSV scraping.py writes, or its row per trim Parquet (much quicker to load).
+# --incremental only cleans the cars that are new or changed since the last --incremental run, see incremental.py
+incremental_run = "--incremental" in sys.argv
+arguments = [argument for argument in sys.argv[1:] if argument != "--incremental"]
+input_file = arguments[0] if len(arguments) > 0 else "car_data_process.csv"
+output_file = arguments[1] if len(arguments) > 1 else "car_data_processed.csv"
+
+# Only the first 110 specs get used
+spec_count = 110
+
+if input_file.endswith(".parquet"):
+    # Already one row per car. The rules work on text, so hand them the values as plain objects
+    raw_data = pd.read_parquet(input_file).set_index("Name")
+    raw_data.index.name = None
+    raw_data = raw_data.iloc[:, :spec_count].astype(object)
+    raw_data = raw_data.where(raw_data.notna(), None)
+else:
+    # Added low_memory=False to disable the "columns have mixed types" error. Obviously they have mixed
+    # types, that's why we're going to clean up the data LOL.
+    raw_data = pd.read_csv(input_file, delimiter=',', encoding="utf-8-sig", nrows=spec_count, index_col=0, low_memory=False).transpose()
+
+if incremental_run:
+    car_count = len(raw_data)
+    raw_data, report, cleaned_count = incremental.clean(raw_data, output_file)
+    print("%s of %s cars are new or changed since the last run" % (cleaned_count, car_count))
+else:
+    raw_data, report = cleaning_rules.clean(raw_data)
+
+# Where the time went, and which rules couldn't make sense of some of their values
+print(report.to_string(index=False, formatters={"seconds": "{:.4f}".format}))
+print("Cleaned %s cars, %s columns in %.3fs" % (len(raw_data), len(raw_data.columns), report.seconds.sum()))
+
+# Categoricals and the smallest numeric types that fit, see compact_dtypes.py
+raw_data, memory = compact_dtypes.compact(raw_data)
+compact_dtypes.print_report(memory)
+
+# Write result CSV (or Parquet, which keeps the compact types) out to new file for comparsion
+compact_dtypes.write_table(raw_data, output_file)
@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# creating_dummies.py used to pd.get_dummies one spec at a time and pd.concat each onto the growing frame
+# (copying the whole thing 33 times), and the columns it came out with depended on whatever values happened
+# to be in that particular dataset. Here every dummy column is built in one go as a scipy sparse matrix (most
+# of the cells are 0), from a vocabulary - the list of categories for each spec - that's saved to a JSON file
+# the first time and reused after that. A refreshed dataset gets exactly the same columns in the same order:
+# a category that isn't there anymore is a column of zeros, and a new one isn't encoded (all zeros for that
+# spec) until the vocabulary is updated, which only ever adds columns on the end.
+# https://docs.scipy.org/doc/scipy/reference/sparse.html
+
+# Column names same as pd.get_dummies(prefix=spec, prefix_sep=': ') gave, e.g. "Drivetrain: Front Wheel Drive"
+prefix_sep = ": "
+
+specs_to_dummies = ['Drivetrain', 'Body Style', 'EPA Classification', 'Fuel System', 'Trans Type', 'Steering Type',
+                    'Front Wheel Material', 'Suspension Type - Rear', 'Suspension Type - Front (Cont.)', 'Suspension Type - Front',
+                    'Suspension Type - Rear (Cont.)', 'Air Bag-Frontal-Driver', 'Air Bag-Frontal-Passenger',
+                    'Air Bag-Passenger Switch (On/Off)', 'Air Bag-Side Body-Front', 'Air Bag-Side Body-Rear',
+                    'Air Bag-Side Head-Front', 'Air Bag-Side Head-Rear', 'Brakes-ABS', 'Child Safety Rear Door Locks',
+                    'Daytime Running Lights', 'Traction Control', 'Night Vision', 'Rollover Protection Bars', 'Fog Lamps',
+                    'Parking Aid', 'Tire Pressure Monitor', 'Back-Up Camera', 'Stability Control', 'Engine Configuration',
+                    'Engine Class','Tire Rating', 'Tire Ratio']
+
+# Categories are kept as text, which is also how they end up in the column names. Whole numbers lose the ".0"
+# so a Tire Ratio of 65 is "65" whether the column got loaded as floats or compacted to ints.
+def text_of(value):
+    if isinstance(value, (int, float, np.number)) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+def as_text(values):
+    return values.map(text_of, na_action="ignore")
+
+# Numbers before text, numbers sorted as numbers (so "9" comes before "10")
+def category_key(category):
+    try:
+        return (0, float(category), category)
+    except ValueError:
+        return (1, 0.0, category)
+
+# Same order get_dummies uses for a column that's all numbers or all text. Everything goes to text first, so a
+# column with both (65 from one file, "65" from another) can still be sorted and only gets one "65".
+def categories_of(values):
+    return sorted({text_of(value) for value in values.dropna().unique()}, key=category_key)
+
+# The vocabulary is a list of [spec, category] pairs, one per dummy column, in column order. Anything already
+# in vocabulary stays put and new categories get added after it, so no existing column ever moves.
+def build_vocabulary(df, specs=specs_to_dummies, vocabulary=None):
+    vocabulary = [list(pair) for pair in (vocabulary or [])]
+    seen = set(map(tuple, vocabulary))
+    for spec in specs:
+        if spec in df.columns:
+            vocabulary += [[spec, category] for category in categories_of(df[spec]) if (spec, category) not in seen]
+    return vocabulary
+
+def load_vocabulary(file_name):
+    if not os.path.exists(file_name):
+        return None
+    with open(file_name, encoding="utf-8") as f:
+        return json.load(f)
+
+# One column per line, so a diff of the file shows exactly which columns got added
+def save_vocabulary(vocabulary, file_name):
+    with open(file_name, "w", encoding="utf-8") as f:
+        f.write("[\n" + ",\n".join(json.dumps(pair, ensure_ascii=False) for pair in vocabulary) + "\n]\n")
+
+def dummy_columns(vocabulary):
+    return [spec + prefix_sep + category for spec, category in vocabulary]
+
+# spec -> (its categories, the column number of each)
+def columns_by_spec(vocabulary):
+    by_spec = {}
+    for number, (spec, category) in enumerate(vocabulary):
+        categories, numbers = by_spec.setdefault(spec, ([], []))
+        categories.append(category)
+        numbers.append(number)
+    return by_spec
+
+# One CSR matrix (rows = cars, a column per category in the vocabulary) in a single pass. Returns the matrix,
+# its column names, and spec -> how many values weren't in the vocabulary (so got no column).
+def encode(df, vocabulary):
+    rows, columns, unknown = [], [], {}
+    for spec, (categories, numbers) in columns_by_spec(vocabulary).items():
+        if spec not in df.columns:
+            continue
+        values = as_text(df[spec])
+        # -1 for missing values and ones that aren't in the vocabulary
+        codes = pd.Index(categories, dtype=object).get_indexer(values.astype(object))
+        present = np.flatnonzero(codes >= 0)
+        rows.append(present)
+        columns.append(np.asarray(numbers, dtype=np.int64)[codes[present]])
+        missed = int((values.notna().to_numpy() & (codes < 0)).sum())
+        if missed:
+            unknown[spec] = missed
+
+    rows = np.concatenate(rows) if rows else np.array([], dtype=np.int64)
+    columns = np.concatenate(columns) if columns else np.array([], dtype=np.int64)
+    matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.uint8), (rows, columns)), shape=(len(df), len(vocabulary)))
+    return matrix, dummy_columns(vocabulary), unknown
+
+# df with the specs replaced by sparse uint8 dummy columns (pandas' Sparse dtype, so only the 1s are stored)
+def with_dummies(df, vocabulary):
+    matrix, names, unknown = encode(df, vocabulary)
+    dummies = pd.DataFrame.sparse.from_spmatrix(matrix, index=df.index, columns=names)
+    kept = df.drop(columns=[spec for spec in columns_by_spec(vocabulary) if spec in df.columns])
+    return pd.concat([kept, dummies], axis=1), unknown
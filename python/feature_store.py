@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Everything a price model trains on, worked out once instead of every training run re-reading
+# car_data_imputed.csv and re-encoding it. A feature store is a folder with:
+#   features.npy    float32 matrix, one row per car: the numeric specs, then the dummy columns from the vocabulary
+#   target.npy      float32 MSRP for each row
+#   index.json      the car each row is
+#   manifest.json   the column names (and which spec each dummy came from), row count, and upstream_hash
+# The .npy files get opened memory mapped (np.load(mmap_mode="r")), so opening the store takes milliseconds
+# and only the pages of the matrix something actually reads get loaded.
+# https://numpy.org/doc/stable/reference/generated/numpy.lib.format.open_memmap.html
+#
+# Opening the store only needs numpy - pandas and dummy_encoding (scipy) are imported by the functions that build
+# it, so a training job doesn't spend half a second importing them just to open the store.
+#
+# upstream_hash is a sha256 over the input file, the dummy vocabulary and format_version. If it still matches,
+# the store is up to date and doesn't get rebuilt - see creating_features.py.
+store_dir = "feature_store"
+target_column = "MSRP"
+format_version = 1
+
+def file_hash(digest, file_name):
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+
+def upstream_hash(input_file, vocabulary):
+    digest = hashlib.sha256(("feature store %s\n" % format_version).encode("utf-8"))
+    file_hash(digest, input_file)
+    digest.update(json.dumps(vocabulary, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+def read_manifest(directory=store_dir):
+    try:
+        with open(os.path.join(directory, "manifest.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+# Is the store in directory already built from exactly this input and vocabulary?
+def is_current(upstream, directory=store_dir):
+    manifest = read_manifest(directory)
+    return manifest is not None and manifest.get("upstream_hash") == upstream
+
+# Numbers (ints, nullable ints, floats, bools) go in as they are, text specs only through their dummy columns
+def numeric_columns(df, vocabulary):
+    import pandas as pd
+    import dummy_encoding
+
+    dummy_specs = dummy_encoding.columns_by_spec(vocabulary)
+    return [column for column in df.columns
+            if column != target_column and column not in dummy_specs
+            and pd.api.types.is_numeric_dtype(df[column]) and not isinstance(df[column].dtype, pd.CategoricalDtype)]
+
+# Writes the store for df (the imputed data, one row per car). Cars with no MSRP are left out, there's nothing
+# to train on. Each file is written next to the old one and renamed over it, and the manifest goes last,
+# so a build that dies part way never leaves a store that looks current.
+def build(df, vocabulary, upstream, directory=store_dir):
+    import dummy_encoding
+
+    os.makedirs(directory, exist_ok=True)
+    manifest_file = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_file):
+        os.remove(manifest_file)
+
+    df = df[df[target_column].notna()]
+    numeric = numeric_columns(df, vocabulary)
+    dummies, dummy_names, unknown = dummy_encoding.encode(df, vocabulary)
+    dummy_specs = dummy_encoding.columns_by_spec(vocabulary)
+    skipped = [column for column in df.columns if column != target_column and column not in numeric and column not in dummy_specs]
+
+    shape = (len(df), len(numeric) + len(dummy_names))
+    features_file = os.path.join(directory, "features.npy")
+    features = np.lib.format.open_memmap(features_file + ".tmp", mode="w+", dtype=np.float32, shape=shape)
+    for i, column in enumerate(numeric):
+        features[:, i] = df[column].to_numpy(dtype=np.float32, na_value=np.nan)
+    features[:, len(numeric):] = dummies.toarray()
+    features.flush()
+    del features
+    os.replace(features_file + ".tmp", features_file)
+
+    target_file = os.path.join(directory, "target.npy")
+    with open(target_file + ".tmp", "wb") as f:
+        np.save(f, df[target_column].to_numpy(dtype=np.float32, na_value=np.nan))
+    os.replace(target_file + ".tmp", target_file)
+
+    write_json(os.path.join(directory, "index.json"), [str(name) for name in df.index])
+
+    manifest = {
+        "format_version": format_version,
+        "upstream_hash": upstream,
+        "rows": shape[0],
+        "target": target_column,
+        "columns": numeric + dummy_names,
+        "numeric_columns": len(numeric),
+        "dummy_specs": [spec for spec, _ in vocabulary],
+        "skipped_columns": skipped,
+        "unknown_categories": unknown,
+    }
+    write_json(manifest_file, manifest)
+    return manifest
+
+def write_json(file_name, data):
+    with open(file_name + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(file_name + ".tmp", file_name)
+
+# (features, target, manifest) - features and target are read only memory maps, nothing gets read up front.
+# Raises FileNotFoundError if the store hasn't been built.
+def open_store(directory=store_dir):
+    manifest = read_manifest(directory)
+    if manifest is None:
+        raise FileNotFoundError("No feature store in %s, run creating_features.py first" % directory)
+    features = np.load(os.path.join(directory, "features.npy"), mmap_mode="r")
+    target = np.load(os.path.join(directory, "target.npy"), mmap_mode="r")
+    return features, target, manifest
+
+# The car names for each row, kept out of the manifest since training doesn't usually need them
+def row_names(directory=store_dir):
+    with open(os.path.join(directory, "index.json"), encoding="utf-8") as f:
+        return json.load(f)
@@ -1,84 +1,41 @@
-import pandas as pd
-from scipy import stats
-import numpy as np
-
-raw_data = pd.read_csv("car_data_processed.csv", index_col=0, low_memory=False)
-imputed_data = raw_data.copy()
-
-# -------- specs to be imputed with mean, and the rest with mode
-specs_to_mean = ['MSRP', 'Base Curb Weight (lbs)', 'Second Shoulder Room (in)', 'Second Head Room (in)', 'Front Shoulder Room (in)',
-                'Front Head Room (in)', 'Second Leg Room (in)', 'Front Hip Room (in)', 'Front Leg Room (in)', 'Width, Max w/o mirrors (in)',
-                'Track Width, Rear (in)', 'Height, Overall (in)', 'Wheelbase (in)', 'Track Width, Front (in)', 'Fuel Tank Capacity, Approx (gal)',
-                'Fourth Gear Ratio (:1)', 'Second Gear Ratio (:1)', 'Reverse Ratio (:1)', 'Fifth Gear Ratio (:1)', 'Third Gear Ratio (:1)',
-                'Final Drive Axle Ratio (:1)', 'First Gear Ratio (:1)', 'Displacement (cc)', 'Displacement (L)', 'Net Torque RPM',
-                'Net Torque', 'Net Horsepower', 'Net Horsepower RPM', 'Passenger Volume', 'Turning Diameter - Curb to Curb']
+import sys
 
-for i in specs_to_mean:
-    try:
-        raw_data[i] = pd.to_numeric(raw_data[i], errors='coerce')
-    except Exception as e:
-        print("ERROR with column: ", e)
-
-list_col = imputed_data.columns.tolist()
-print (list_col)
+import pandas as pd
 
-specs_to_mode = list_col.copy()
+import compact_dtypes
+import imputation_rules
+import incremental
 
-for item in specs_to_mean:
-    try:
-        specs_to_mode.remove(item)
-    except Exception as e:
-        print("failed to remove: ", item)
+# The group means/modes are all worked out up front with groupbys now, see imputation_rules.py
+# (used to re-filter the whole frame for every single missing value, which took hours on 32,000 cars)
+#   python imputation.py [--incremental] [input csv] [output csv]
+# --incremental only fills in the cars that are new or changed since the last --incremental run, and keeps the
+# group statistics between runs, see incremental.py
+incremental_run = "--incremental" in sys.argv
+arguments = [argument for argument in sys.argv[1:] if argument != "--incremental"]
+input_file = arguments[0] if len(arguments) > 0 else "car_data_processed.csv"
+output_file = arguments[1] if len(arguments) > 1 else "car_data_imputed.csv"
 
-# -------- imputer func
-def imputer_mean(x, y):
-    #print ("X: ", x, " Y: ", y)
-    #print ("Model: ", raw_data["Body Style"])
-    temp_list_model = raw_data.loc[raw_data["Body Style"] == raw_data.loc[x, "Body Style"]].loc[:, y].dropna()
-    if len(temp_list_model) > 0:
-        imputed_data.loc[x, y] = np.round(temp_list_model.mean(), 2)
-    else:
-        temp_list_epa = raw_data.loc[raw_data["EPA Classification"] == raw_data.loc[x, "EPA Classification"]].loc[:, y].dropna()
-        if len(temp_list_epa) > 0:
-            imputed_data.loc[x, y] = np.round(temp_list_epa.mean(), 2)
-        else:
-            temp_list_bodystyle = raw_data.loc[raw_data["Body Style"] ==
-                                                    raw_data.loc[x, "Body Style"]].loc[:, y].dropna()
-            if len(temp_list_bodystyle) > 0:
-                imputed_data.loc[x, y] = np.round(temp_list_bodystyle.mean(), 2)
+# Groups to take the mean/mode from, most specific first. Try [["Model"], ["Body Style"], ["EPA Classification"]]
+# to fill from other trims of the same make and model before falling back to the body style
+hierarchy = imputation_rules.default_hierarchy
 
-def imputer_mode(x, y):
-    temp_list_model = pd.Series(raw_data.loc[raw_data["Body Style"] == raw_data.loc[x, "Body Style"]].loc[:, y].dropna())
-    if len(temp_list_model) > 0:
-        imputed_data.loc[x, y] = stats.mode(temp_list_model)[0][0]
-    else:
-        temp_list_epa = raw_data.loc[raw_data["EPA Classification"]
-                                            == raw_data.loc[x, "EPA Classification"]].loc[:, y].dropna()
-        if len(temp_list_epa) > 0:
-            imputed_data.loc[x, y] = stats.mode(temp_list_epa)[0][0]
-        else:
-            temp_list_bodystyle = raw_data.loc[raw_data["Body Style"] ==
-                                                    raw_data.loc[x, "Body Style"]].loc[:, y].dropna()
-            if len(temp_list_bodystyle) > 0:
-                imputed_data.loc[x, y] = stats.mode(temp_list_bodystyle)[0][0]
+raw_data = pd.read_csv(input_file, index_col=0, low_memory=False)
+print(raw_data.columns.tolist())
 
-# -------- iterator - mean
-for col in specs_to_mean:
-    for row in imputed_data.index:
-        #print (row)
-        val = imputed_data.get_value(row, col)
-        if pd.isnull(val):
-            raw_data.set_value(row, col, imputer_mean(row, col))
+if incremental_run:
+    imputed_data, report, imputed_count = incremental.impute(raw_data, output_file, hierarchy)
+    print("%s of %s cars are new or changed since the last run" % (imputed_count, len(raw_data)))
+else:
+    imputed_data, report = imputation_rules.impute(raw_data, hierarchy)
 
-# -------- iterator - mode
-for col in specs_to_mode:
-    for row in imputed_data.index:
-        val = imputed_data.get_value(row, col)
-        if pd.isnull(val):
-            raw_data.set_value(row, col, imputer_mode(row, col))
+# How much each level of the hierarchy filled in
+print(report.groupby("level", sort=False)["filled"].sum().to_string())
 
 # -------- drop missing values
 imputed_data = imputed_data.dropna()
 
 # -------- export 
-imputed_data.to_csv("car_data_imputed.csv")
+imputed_data, memory = compact_dtypes.compact(imputed_data)
+compact_dtypes.print_report(memory)
+compact_dtypes.write_table(imputed_data, output_file)
@@ -0,0 +1,163 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+# imputation.py used to go through every column x every row, and for each missing value filter the whole
+# frame down to the cars with the same Body Style (then the same EPA Classification) to take a mean or mode.
+# That's a full scan of 32,000 rows for every missing cell. Here each group statistic is worked out once,
+# with a groupby, and every missing value in the column gets filled from it in one go.
+#
+# The groups to try are a hierarchy, most specific first - a missing value takes the statistic from the first
+# group that has one. The default is what imputation.py always did:
+#   [["Body Style"], ["EPA Classification"]]
+# Something like [["Model"], ["Body Style"], ["EPA Classification"]] fills from other trims of the same car
+# first. Each level is a list of columns, and "Model" can be used even though it isn't a column, see key_columns.
+# An empty level, [], is every car - [["Body Style"], ["EPA Classification"], []] falls back to the overall
+# mean/mode instead of leaving the value missing (imputation.py then drops the car).
+default_hierarchy = [["Body Style"], ["EPA Classification"]]
+
+# Specs filled with the group mean (rounded to 2 places), everything else gets the group mode
+specs_to_mean = ['MSRP', 'Base Curb Weight (lbs)', 'Second Shoulder Room (in)', 'Second Head Room (in)', 'Front Shoulder Room (in)',
+                 'Front Head Room (in)', 'Second Leg Room (in)', 'Front Hip Room (in)', 'Front Leg Room (in)', 'Width, Max w/o mirrors (in)',
+                 'Track Width, Rear (in)', 'Height, Overall (in)', 'Wheelbase (in)', 'Track Width, Front (in)', 'Fuel Tank Capacity, Approx (gal)',
+                 'Fourth Gear Ratio (:1)', 'Second Gear Ratio (:1)', 'Reverse Ratio (:1)', 'Fifth Gear Ratio (:1)', 'Third Gear Ratio (:1)',
+                 'Final Drive Axle Ratio (:1)', 'First Gear Ratio (:1)', 'Displacement (cc)', 'Displacement (L)', 'Net Torque RPM',
+                 'Net Torque', 'Net Horsepower', 'Net Horsepower RPM', 'Passenger Volume', 'Turning Diameter - Curb to Curb']
+
+# Car names look like "2018 Buick Envision Specs: AWD 4-Door Essence", the make and model is the bit in between
+model_pattern = re.compile(r"^\d{4} (?P<model>.+?) Specs:")
+
+def model_from_name(names):
+    return pd.Series(names, index=names).str.extract(model_pattern, expand=False)
+
+# Group keys that can be used in a hierarchy without being columns, worked out from the car names instead
+key_columns = {
+    "Model": model_from_name,
+}
+
+def group_keys(frame, keys):
+    if not keys:
+        return pd.DataFrame({"__all__": 0}, index=frame.index)
+    return pd.DataFrame({key: frame[key] if key in frame.columns else key_columns[key](frame.index) for key in keys},
+                        index=frame.index)
+
+# Per group sums and counts (for the means) and value counts (for the modes), for every column, at every level
+# of the hierarchy. Kept as counts rather than the finished means/modes so they can be updated as rows are
+# added or taken away, instead of worked out from scratch.
+class GroupStats:
+
+    def __init__(self, hierarchy=None, mean_columns=specs_to_mean):
+        self.hierarchy = [list(level) for level in (hierarchy or default_hierarchy)]
+        self.mean_columns = list(mean_columns)
+        self.sums = [{} for _ in self.hierarchy]      # level -> column -> DataFrame(sum, count) by group
+        self.counts = [{} for _ in self.hierarchy]    # level -> column -> Series of counts by (group, value)
+
+    # Adds (sign=1) or takes away (sign=-1) rows. Mean columns should already be numeric, see numeric_copy
+    def update(self, frame, sign=1):
+        for level, keys in enumerate(self.hierarchy):
+            grouping = group_keys(frame, keys)
+            grouping_columns = list(grouping.columns)
+            for column in frame.columns:
+                if column in keys:
+                    continue
+                values = pd.concat([grouping, frame[column].rename("__value__")], axis=1)
+                if column in self.mean_columns:
+                    stats = values.groupby(grouping_columns)["__value__"].agg(["sum", "count"]) * sign
+                    self.sums[level][column] = add_stats(self.sums[level].get(column), stats)
+                else:
+                    counts = values.groupby(grouping_columns + ["__value__"]).size() * sign
+                    self.counts[level][column] = add_stats(self.counts[level].get(column), counts)
+
+    def means(self, level, column):
+        stats = self.sums[level].get(column)
+        if stats is None:
+            return None
+        stats = stats[stats["count"] > 0]
+        # Sums that had rows added and taken away (incremental.py) pick up float error in the last few bits, which is
+        # enough to round a mean like 63.525 the other way. Rounding the sum first gets rid of it.
+        return np.round(np.round(stats["sum"], 9) / stats["count"], 2)
+
+    # Most common value in each group, the smallest one if there's a tie (same as scipy's stats.mode)
+    def modes(self, level, column):
+        counts = self.counts[level].get(column)
+        if counts is None:
+            return None
+        counts = counts[counts > 0]
+        keys = list(counts.index.names[:-1])
+        table = counts.rename("__count__").reset_index()
+        table = table.sort_values(keys + ["__count__", "__value__"], ascending=[True] * len(keys) + [False, True])
+        table = table.drop_duplicates(keys)
+        return table.set_index(keys)["__value__"]
+
+    def statistic(self, level, column):
+        return self.means(level, column) if column in self.mean_columns else self.modes(level, column)
+
+def add_stats(current, change):
+    if current is None:
+        return change
+    return current.add(change, fill_value=0)
+
+# The statistics are always worked out on a copy with the mean columns forced to numbers (same as before),
+# while the values that get filled in go into the data as it was read
+def numeric_copy(data, mean_columns=specs_to_mean):
+    numeric = data.copy()
+    for column in mean_columns:
+        if column in numeric.columns:
+            numeric[column] = pd.to_numeric(numeric[column], errors="coerce")
+    return numeric
+
+# Old pandas would just turn the column into objects, pandas 3 raises instead
+def can_hold(dtype, values_dtype):
+    if dtype == object or dtype == values_dtype:
+        return True
+    return pd.api.types.is_numeric_dtype(dtype) and pd.api.types.is_numeric_dtype(values_dtype)
+
+# Fills every missing value it can from stats, going down the hierarchy. Returns the filled copy of data
+# and a report of how many values each level filled in for each column.
+def fill_missing(data, stats):
+    imputed = data.copy()
+    report = []
+    groupings = [group_keys(data, keys) for keys in stats.hierarchy]
+
+    # Mean columns first, then the rest, same order imputation.py always went in
+    columns = [column for column in stats.mean_columns if column in data.columns]
+    columns += [column for column in data.columns if column not in stats.mean_columns]
+
+    # Rows go by position rather than car name, names aren't always unique
+    for column in columns:
+        position = imputed.columns.get_loc(column)
+        missing = imputed[column].isna().to_numpy(copy=True)
+        if not missing.any():
+            continue
+
+        for level, keys in enumerate(stats.hierarchy):
+            statistic = stats.statistic(level, column)
+            if statistic is None or statistic.empty or not missing.any():
+                continue
+
+            grouping = groupings[level][missing]
+            if len(grouping.columns) == 1:
+                lookup = pd.Index(grouping.iloc[:, 0])
+            else:
+                lookup = pd.MultiIndex.from_frame(grouping)
+            values = statistic.reindex(lookup).to_numpy()
+            found = pd.notna(values)
+            rows = np.flatnonzero(missing)[found]
+            filled = pd.Series(values[found]).infer_objects()
+
+            if len(filled):
+                # Means going into a text column, or modes into a column that was all missing (so read as floats)
+                if not can_hold(imputed[column].dtype, filled.dtype):
+                    imputed[column] = imputed[column].astype(object)
+                imputed.iloc[rows, position] = filled.to_numpy()
+                missing[rows] = False
+            report.append({"column": column, "level": " / ".join(keys) or "all cars", "filled": len(filled)})
+
+        report.append({"column": column, "level": "still missing", "filled": int(missing.sum())})
+    return imputed, pd.DataFrame(report, columns=["column", "level", "filled"])
+
+def impute(data, hierarchy=None, mean_columns=specs_to_mean):
+    stats = GroupStats(hierarchy, mean_columns)
+    stats.update(numeric_copy(data, mean_columns))
+    return fill_missing(data, stats)
@@ -0,0 +1,146 @@
+import hashlib
+import inspect
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from pandas.util import hash_array
+
+import cleaning_rules
+import imputation_rules
+
+# data_cleaning.py --incremental and imputation.py --incremental only redo the cars that are new or have
+# changed since the last incremental run, instead of the whole 32,000. Cars are matched up by name (the only
+# thing that identifies a trim once it's in the CSV), and each run keeps what it needs next time in a pickle
+# under incremental_state/, one per output file:
+#   cleaning   - a hash of every car's raw specs, and the cleaned rows (before the sparse columns are dropped)
+#   imputation - a hash of every car's cleaned specs, the GroupStats, and the imputed rows
+# A changed car has its old values taken out of the group statistics and its new ones added, see
+# GroupStats.update. Missing values only get filled for the new/changed cars - cars filled in on an earlier run
+# keep the values they got then, even if the group means have moved a bit since. Delete the state file (or
+# leave off --incremental) to redo everything from scratch.
+#
+# The state is thrown away automatically if cleaning_rules.py / imputation_rules.py change.
+state_dir = "incremental_state"
+
+def state_file(output_file, stage):
+    return os.path.join(state_dir, "%s.%s.pkl" % (os.path.basename(output_file), stage))
+
+# Changes whenever the rules do, so a state built with the old rules never gets merged with new output
+def fingerprint(*parts):
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(repr(part).encode("utf-8"))
+    return digest.hexdigest()
+
+def load_state(file_name, expected_fingerprint):
+    try:
+        with open(file_name, "rb") as f:
+            state = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+    if state.get("fingerprint") != expected_fingerprint:
+        print("%s was made with different rules, starting from scratch" % file_name)
+        return None
+    return state
+
+def save_state(file_name, state):
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    with open(file_name + ".tmp", "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(file_name + ".tmp", file_name)
+
+# One 64 bit hash per car over its (spec, value) pairs. Missing values don't count, so a spec showing up for
+# the first time on some other car doesn't make every car look changed.
+def row_hashes(frame):
+    hashes = np.zeros(len(frame), dtype="uint64")
+    for column in frame.columns:
+        values = frame[column]
+        present = values.notna().to_numpy()
+        if not present.any():
+            continue
+        salt = hash_array(np.array([str(column)], dtype=object))[0]
+        value_hashes = hash_array(values.astype(str).to_numpy(dtype=object))
+        hashes += np.where(present, hash_array(value_hashes ^ salt), np.uint64(0))
+    return pd.Series(hashes, index=frame.index)
+
+# Names of the cars that are exactly the same as last time
+def unchanged_rows(hashes, previous_hashes):
+    same = hashes.index.isin(previous_hashes.index)
+    same &= previous_hashes.reindex(hashes.index, fill_value=0).to_numpy() == hashes.to_numpy()
+    return hashes.index[same]
+
+# Duplicate names can't be matched up between runs
+def can_match(frame):
+    if frame.index.is_unique:
+        return True
+    print("Car names aren't unique, doing a full run instead of an incremental one")
+    return False
+
+# Same as cleaning_rules.clean(raw), but only cleans the cars that changed since the last run for output_file.
+# Returns the cleaned table, the report for the cars that did get cleaned, and how many that was.
+def clean(raw, output_file):
+    if not can_match(raw):
+        cleaned, report = cleaning_rules.clean(raw)
+        return cleaned, report, len(raw)
+
+    file_name = state_file(output_file, "cleaning")
+    rules_fingerprint = fingerprint(inspect.getsource(cleaning_rules))
+    state = load_state(file_name, rules_fingerprint)
+    hashes = row_hashes(raw)
+
+    unchanged = unchanged_rows(hashes, state["hashes"]) if state else raw.index[:0]
+    changed = raw.index[~raw.index.isin(unchanged)]
+
+    rows, report = cleaning_rules.clean(raw.loc[changed], keep_sparse_columns=True)
+    if len(unchanged):
+        # Column order a full clean of this raw table would have
+        empty, _ = cleaning_rules.clean(raw.iloc[:0], keep_sparse_columns=True)
+        pieces = [state["rows"].loc[unchanged]] + ([rows] if len(changed) else [])
+        rows = pd.concat(pieces).reindex(index=raw.index, columns=empty.columns)
+
+    save_state(file_name, {"fingerprint": rules_fingerprint, "hashes": hashes, "rows": rows})
+    return cleaning_rules.drop_sparse_columns(rows), report, len(changed)
+
+# Same as imputation_rules.impute(data), but only fills the cars that changed since the last run for output_file,
+# with the cached group statistics updated for them. Returns the imputed table, the report and how many cars.
+def impute(data, output_file, hierarchy=None, mean_columns=imputation_rules.specs_to_mean):
+    if not can_match(data):
+        imputed, report = imputation_rules.impute(data, hierarchy, mean_columns)
+        return imputed, report, len(data)
+
+    file_name = state_file(output_file, "imputation")
+    hierarchy = [list(level) for level in (hierarchy or imputation_rules.default_hierarchy)]
+    rules_fingerprint = fingerprint(inspect.getsource(imputation_rules), hierarchy, list(mean_columns))
+    state = load_state(file_name, rules_fingerprint)
+    hashes = row_hashes(data)
+
+    # A column dropped or added by data_cleaning.py changes what the statistics are kept for, so start again
+    if state and state["columns"] != list(data.columns):
+        print("Columns changed since the last run, redoing the group statistics from scratch")
+        state = None
+
+    if state:
+        stats = state["stats"]
+        unchanged = unchanged_rows(hashes, state["hashes"])
+        gone = state["numeric"].index[~state["numeric"].index.isin(unchanged)]
+        if len(gone):
+            stats.update(state["numeric"].loc[gone], sign=-1)
+    else:
+        stats = imputation_rules.GroupStats(hierarchy, mean_columns)
+        unchanged = data.index[:0]
+
+    changed = data.index[~data.index.isin(unchanged)]
+    numeric = imputation_rules.numeric_copy(data, mean_columns)
+    if len(changed):
+        stats.update(numeric.loc[changed])
+
+    imputed, report = imputation_rules.fill_missing(data.loc[changed], stats)
+    if len(unchanged):
+        pieces = [state["imputed"].loc[unchanged]] + ([imputed] if len(changed) else [])
+        imputed = pd.concat(pieces).reindex(data.index)
+
+    save_state(file_name, {"fingerprint": rules_fingerprint, "columns": list(data.columns), "hashes": hashes,
+                           "numeric": numeric, "stats": stats, "imputed": imputed})
+    return imputed, report, len(changed)
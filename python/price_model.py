@@ -0,0 +1,150 @@
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+import cleaning_rules
+import dummy_encoding
+import feature_store
+
+# Pricing cars with a model trained on the feature store (see feature_store.py and training_model.py). A
+# PriceModel holds everything needed to go from raw scraped specs to a price, so it's trained once, pickled,
+# and then loaded once by whatever does the scoring (pricing.py, as a batch job or a local HTTP endpoint):
+#   - raw specs -> cleaning_rules.clean(), the exact same rules data_cleaning.py uses
+#   - cleaned table -> the feature store's columns: the numeric specs (anything missing gets the training mean,
+#     standing in for imputation.py's group means) then the dummy columns, from the same vocabulary
+#   - features -> the regression, for every car in the batch at once
+# Two kinds of regression:
+#   "linear"   ridge regression on standardized features, plain numpy
+#   "boosted"  scikit-learn's HistGradientBoostingRegressor (pip install scikit-learn)
+# Both are fit on log(MSRP) - prices are spread over a couple of orders of magnitude, and errors in percent
+# make more sense than errors in dollars.
+# https://scikit-learn.org/stable/modules/generated/sklearn.ensemble.HistGradientBoostingRegressor.html
+model_file = "price_model.pkl"
+
+kinds = ["linear", "boosted"]
+ridge_alpha = 1.0
+holdout_fraction = 0.2     # Cars kept back to report how well the model does, before it's refit on all of them
+
+class RidgeRegression:
+
+    def __init__(self, alpha=ridge_alpha):
+        self.alpha = alpha
+
+    def fit(self, features, target):
+        features = np.asarray(features, dtype=np.float64)
+        self.means = features.mean(axis=0)
+        self.scales = features.std(axis=0)
+        self.scales[self.scales == 0] = 1
+        standardized = (features - self.means) / self.scales
+        self.intercept = target.mean()
+        gram = standardized.T @ standardized + self.alpha * np.eye(standardized.shape[1])
+        self.coefficients = np.linalg.solve(gram, standardized.T @ (target - self.intercept))
+        return self
+
+    def predict(self, features):
+        return ((np.asarray(features, dtype=np.float64) - self.means) / self.scales) @ self.coefficients + self.intercept
+
+def boosted_regression():
+    try:
+        from sklearn.ensemble import HistGradientBoostingRegressor
+    except ImportError as e:
+        raise ImportError("kind='boosted' needs scikit-learn, pip install scikit-learn (%s)" % e) from e
+    return HistGradientBoostingRegressor(max_iter=500, learning_rate=0.05, random_state=0)
+
+def regression(kind):
+    if kind == "linear":
+        return RidgeRegression()
+    if kind == "boosted":
+        return boosted_regression()
+    raise ValueError("Unknown model kind %r, expected one of %s" % (kind, kinds))
+
+# The vocabulary the feature store's dummy columns were made from, back out of its manifest
+def vocabulary_of(manifest):
+    dummies = manifest["columns"][manifest["numeric_columns"]:]
+    return [[spec, column[len(spec) + len(dummy_encoding.prefix_sep):]] for spec, column in zip(manifest["dummy_specs"], dummies)]
+
+class PriceModel:
+
+    def __init__(self, kind, manifest, fill_values, estimator, scores):
+        self.kind = kind
+        self.columns = manifest["columns"]
+        self.numeric_columns = self.columns[:manifest["numeric_columns"]]
+        self.vocabulary = vocabulary_of(manifest)
+        self.upstream_hash = manifest["upstream_hash"]
+        self.fill_values = fill_values
+        self.estimator = estimator
+        self.scores = scores
+        self.trained_at = time.time()
+
+    def __repr__(self):
+        return "<PriceModel %s, %s features, %s>" % (self.kind, len(self.columns), self.scores)
+
+    # Cleaned table -> float32 feature matrix in the feature store's column order, plus spec -> how many values
+    # weren't in the vocabulary (those cars just get no dummy for that spec)
+    def features(self, cleaned):
+        numeric = cleaned.reindex(columns=self.numeric_columns)
+        numeric = np.column_stack([pd.to_numeric(numeric[column], errors="coerce").to_numpy(dtype=np.float32, na_value=np.nan)
+                                   for column in self.numeric_columns]) if self.numeric_columns else np.empty((len(cleaned), 0), np.float32)
+        missing = np.isnan(numeric)
+        numeric[missing] = np.broadcast_to(self.fill_values, numeric.shape)[missing]
+
+        dummies, _, unknown = dummy_encoding.encode(cleaned, self.vocabulary)
+        return np.hstack([numeric, dummies.toarray().astype(np.float32)]), unknown
+
+    def predict(self, features):
+        return np.exp(self.estimator.predict(features))
+
+    # Raw specs (one row per car, car names as the index, values as scraped) -> (prices as a Series, unknown)
+    def price(self, raw):
+        cleaned, _ = cleaning_rules.clean(raw, keep_sparse_columns=True)
+        features, unknown = self.features(cleaned)
+        return pd.Series(self.predict(features), index=raw.index, name="Estimated MSRP"), unknown
+
+def error_scores(actual, predicted):
+    errors = np.abs(predicted - actual)
+    return {
+        "cars": int(len(actual)),
+        "mean absolute error": float(errors.mean()),
+        "median percent error": float(np.median(errors / actual) * 100),
+        "r2": float(1 - ((predicted - actual) ** 2).sum() / ((actual - actual.mean()) ** 2).sum()),
+    }
+
+# Trains on the feature store: scores it on a random holdout_fraction of the cars first, then refits on all of
+# them. Cars with a missing or non positive MSRP are skipped.
+def train(directory=feature_store.store_dir, kind="linear", seed=0):
+    features, target, manifest = feature_store.open_store(directory)
+    usable = np.flatnonzero(np.asarray(target) > 0)
+    features = np.asarray(features[usable], dtype=np.float32)
+    target = np.asarray(target[usable], dtype=np.float64)
+
+    fill_values = np.nanmean(features[:, :manifest["numeric_columns"]], axis=0).astype(np.float32)
+    fill_values[np.isnan(fill_values)] = 0
+    missing = np.isnan(features[:, :manifest["numeric_columns"]])
+    features[:, :manifest["numeric_columns"]][missing] = np.broadcast_to(fill_values, missing.shape)[missing]
+
+    order = np.random.default_rng(seed).permutation(len(target))
+    held_out = order[:int(len(target) * holdout_fraction)]
+    kept = order[len(held_out):]
+    scores = None
+    if len(held_out):
+        estimator = regression(kind).fit(features[kept], np.log(target[kept]))
+        scores = error_scores(target[held_out], np.exp(estimator.predict(features[held_out])))
+
+    estimator = regression(kind).fit(features, np.log(target))
+    return PriceModel(kind, manifest, fill_values, estimator, scores)
+
+def save(model, file_name=model_file):
+    with open(file_name, "wb") as f:
+        pickle.dump(model, f)
+
+def load(file_name=model_file):
+    with open(file_name, "rb") as f:
+        return pickle.load(f)
+
+# [(name, {spec: value})] (what scraping.py's processSpecifications gives, and what's in final_data.txt) ->
+# the raw table cleaning_rules.clean() takes, one row per car
+def raw_frame(records):
+    records = [record for record in records if record is not None]
+    return pd.DataFrame.from_records([dict(specs) for _, specs in records], index=[name for name, _ in records])
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import pickle
+import sys
+import time
+
+import pandas as pd
+
+import price_model
+
+# Prices raw scraped cars with the model training_model.py saved. The model gets loaded once, then cars are
+# cleaned with the same rules as data_cleaning.py and scored batch_size at a time.
+#   python pricing.py [--model price_model.pkl] [input] [output csv]
+#   python pricing.py --serve [--model price_model.pkl] [--port 8081]
+# The input can be a pickled list of (name, {spec: value}) like txt_files/final_data.txt, the same as JSON (.json,
+# or .jsonl with one [name, specs] per line), or scraping.py's wide CSV / row per trim Parquet. The output is
+# one row per car with its estimated MSRP.
+#
+# --serve answers on http://127.0.0.1:8081 instead, with the model kept in memory between requests:
+#   POST /price    body is a JSON list of [name, {spec: value}] (or {"name": ..., "specs": {...}}),
+#                  answer is {"prices": {name: estimated MSRP}, "unknown_categories": {...}, "seconds": ...}
+#   GET /health    what model is loaded and how well it did on its holdout cars
+# Scoring runs on a thread (run_in_executor), so one big batch doesn't hold up every other request.
+batch_size = 5000
+host = "127.0.0.1"
+
+def argument_value(argv, name, default):
+    if name in argv and argv.index(name) + 1 < len(argv):
+        return argv[argv.index(name) + 1]
+    return default
+
+value_flags = ["--model", "--port"]
+model_file = argument_value(sys.argv, "--model", price_model.model_file)
+port = int(argument_value(sys.argv, "--port", 8081))
+serve = "--serve" in sys.argv
+arguments = [argument for i, argument in enumerate(sys.argv[1:], 1)
+             if argument != "--serve" and argument not in value_flags and sys.argv[i - 1] not in value_flags]
+input_file = arguments[0] if len(arguments) > 0 else "../txt_files/final_data.txt"
+output_file = arguments[1] if len(arguments) > 1 else "car_prices.csv"
+
+# JSON records can be [name, specs] pairs or {"name": ..., "specs": ...} objects
+def as_record(record):
+    if isinstance(record, dict):
+        return record["name"], record["specs"]
+    name, specs = record
+    return name, specs
+
+# Input file -> the raw table, one row per car, same as data_cleaning.py reads it
+def read_raw(file_name):
+    if file_name.endswith(".parquet"):
+        raw = pd.read_parquet(file_name).set_index("Name")
+        raw.index.name = None
+        raw = raw.astype(object)
+        return raw.where(raw.notna(), None)
+    if file_name.endswith(".csv"):
+        return pd.read_csv(file_name, delimiter=',', encoding="utf-8-sig", index_col=0, low_memory=False).transpose()
+    if file_name.endswith(".jsonl"):
+        with open(file_name, encoding="utf-8") as f:
+            return price_model.raw_frame([as_record(json.loads(line)) for line in f if line.strip()])
+    if file_name.endswith(".json"):
+        with open(file_name, encoding="utf-8") as f:
+            return price_model.raw_frame([as_record(record) for record in json.load(f)])
+    with open(file_name, "rb") as f:
+        return price_model.raw_frame(pickle.load(f))
+
+def price_batches(model, raw):
+    prices = []
+    unknown = {}
+    for start in range(0, len(raw), batch_size):
+        batch_prices, batch_unknown = model.price(raw.iloc[start:start + batch_size])
+        prices.append(batch_prices)
+        for spec, count in batch_unknown.items():
+            unknown[spec] = unknown.get(spec, 0) + count
+    return pd.concat(prices) if prices else pd.Series(dtype=float, name="Estimated MSRP"), unknown
+
+# The --serve app, kept separate from run_server so it can be tested without binding a port
+def make_app(model, model_name=model_file):
+    from aiohttp import web
+
+    async def price(request):
+        start = time.perf_counter()
+        try:
+            body = await request.json()
+            # A dict would iterate over its keys and come back as nonsense cars rather than an error
+            if not isinstance(body, list):
+                raise TypeError("got a JSON %s" % type(body).__name__)
+            raw = price_model.raw_frame([as_record(record) for record in body])
+        except (ValueError, TypeError, KeyError) as e:
+            raise web.HTTPBadRequest(text="Expected a JSON list of [name, {spec: value}]: %s" % e)
+        prices, unknown = await asyncio.get_running_loop().run_in_executor(None, price_batches, model, raw)
+        return web.json_response({
+            "prices": {name: round(float(value), 2) for name, value in prices.items()},
+            "unknown_categories": unknown,
+            "seconds": round(time.perf_counter() - start, 4),
+        })
+
+    async def health(request):
+        return web.json_response({"model": model_name, "kind": model.kind, "features": len(model.columns),
+                                  "trained_at": model.trained_at, "holdout_scores": model.scores})
+
+    app = web.Application(client_max_size=64 * 1024 ** 2)
+    app.router.add_post("/price", price)
+    app.router.add_get("/health", health)
+    return app
+
+def run_server(model):
+    from aiohttp import web
+
+    print("Pricing cars on http://%s:%s/price" % (host, port))
+    web.run_app(make_app(model), host=host, port=port, access_log=None, print=None)
+
+if __name__ == "__main__":
+    model = price_model.load(model_file)
+    print("Loaded %r" % model)
+
+    if serve:
+        run_server(model)
+    else:
+        start = time.perf_counter()
+        prices, unknown = price_batches(model, read_raw(input_file))
+        prices.rename_axis("Name").to_csv(output_file, float_format="%.2f")
+        for spec, count in unknown.items():
+            print("%s: %s values the model hasn't seen" % (spec, count))
+        print("Priced %s cars into %s in %.3fs" % (len(prices), output_file, time.perf_counter() - start))
@@ -0,0 +1,24 @@
+import sys
+import time
+
+import feature_store
+import price_model
+
+# Trains the price model on the feature store creating_features.py builds, and saves it for pricing.py.
+#   python training_model.py [--boosted] [feature store folder] [model file]
+# The default is ridge regression (numpy only), --boosted uses scikit-learn's gradient boosting instead.
+# The scores printed are for holdout cars the model hadn't seen, the saved model is then refit on every car.
+kind = "boosted" if "--boosted" in sys.argv else "linear"
+arguments = [argument for argument in sys.argv[1:] if argument != "--boosted"]
+store_dir = arguments[0] if len(arguments) > 0 else feature_store.store_dir
+model_file = arguments[1] if len(arguments) > 1 else price_model.model_file
+
+start = time.perf_counter()
+model = price_model.train(store_dir, kind)
+price_model.save(model, model_file)
+
+if model.scores:
+    for name, value in model.scores.items():
+        print("%s: %s" % (name, round(value, 3)))
+print("Trained a %s model on %s features from %s, saved to %s in %.1fs" % (kind, len(model.columns), store_dir,
+                                                                          model_file, time.perf_counter() - start))
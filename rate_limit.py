@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+
+from urllib.parse import urlsplit
+
+# Replaces the hardcoded asyncio.Semaphore(15) / Semaphore(10) each stage used to have. Too few requests at once
+# wastes time, too many and the site starts throttling us (which used to just show up as None results).
+#
+# AdaptiveLimiter works the same way TCP congestion control does (AIMD - additive increase, multiplicative
+# decrease): after every `window` finished requests it looks at how they went, and
+#   * halves the number of requests in flight if anything got a 429, or too many of them failed
+#   * adds one more request in flight if latency is still close to the best we've seen
+#   * otherwise holds steady, since latency creeping up means the server is starting to queue us
+# https://en.wikipedia.org/wiki/Additive_increase/multiplicative_decrease
+#
+# Each host gets its own window and limit (keyed by urlsplit(url).netloc), so a slow or throttling host only
+# backs off the requests going to it, and an optional requests per second cap, using a token bucket.
+# https://en.wikipedia.org/wiki/Token_bucket
+
+class TokenBucket:
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.last = time.monotonic()
+
+    async def take(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# The AIMD state for one host
+class HostLimit:
+
+    def __init__(self, start, requests_per_sec=None):
+        self.limit = start
+        self.in_flight = 0
+        self.bucket = TokenBucket(requests_per_sec) if requests_per_sec else None
+
+        # Stats for the current window
+        self.window_latencies = []
+        self.window_errors = 0
+        self.window_throttled = 0
+        self.best_latency = None
+        self.peak_limit = start
+
+    def finished(self):
+        return self.window_errors + self.window_throttled + len(self.window_latencies)
+
+class AdaptiveLimiter:
+
+    def __init__(self, name, start=10, min_limit=1, max_limit=50, requests_per_sec=None, window=20,
+                 max_error_rate=0.1, latency_slack=1.5):
+        self.name = name
+        self.start = start
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.requests_per_sec = requests_per_sec
+        self.window = window
+        self.max_error_rate = max_error_rate
+        self.latency_slack = latency_slack
+
+        self.in_flight = 0
+        self.condition = asyncio.Condition()
+        self.hosts = {}     # host -> HostLimit
+
+        # Overall, for the end of stage log
+        self.total_requests = 0
+        self.total_errors = 0
+        self.total_throttled = 0
+
+    def __repr__(self):
+        return "<AdaptiveLimiter %s limits=%s in_flight=%s rate=%s>" % (self.name, self.limits(), self.in_flight,
+                                                                       self.requests_per_sec)
+
+    def host(self, url):
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = HostLimit(self.start, self.requests_per_sec)
+        return self.hosts[host]
+
+    # host -> how many requests it's allowed in flight right now
+    def limits(self):
+        return {host: state.limit for host, state in self.hosts.items()}
+
+    # Waits for a token (if there's a rate cap) and a free request slot for url's host
+    async def acquire(self, url):
+        host = self.host(url)
+        if host.bucket is not None:
+            await host.bucket.take()
+
+        async with self.condition:
+            await self.condition.wait_for(lambda: host.in_flight < host.limit)
+            host.in_flight += 1
+            self.in_flight += 1
+
+    # Hands url's slot back, along with how the request went. status is the HTTP status, or None if it blew up
+    # before we got one (timeouts, connection resets, etc)
+    async def release(self, url, latency, status):
+        host = self.host(url)
+        self.total_requests += 1
+        if status == 429:
+            host.window_throttled += 1
+            self.total_throttled += 1
+        elif status is None or status >= 500:
+            host.window_errors += 1
+            self.total_errors += 1
+        else:
+            host.window_latencies.append(latency)
+
+        if host.finished() >= self.window:
+            self.adjust(urlsplit(url).netloc, host)
+
+        async with self.condition:
+            host.in_flight -= 1
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def adjust(self, name, host):
+        error_rate = (host.window_errors + host.window_throttled) / host.finished()
+        latency = sum(host.window_latencies) / len(host.window_latencies) if host.window_latencies else None
+        old_limit = host.limit
+
+        if host.window_throttled or error_rate > self.max_error_rate:
+            host.limit = max(self.min_limit, host.limit // 2)
+        elif latency is not None:
+            if host.best_latency is None or latency < host.best_latency:
+                host.best_latency = latency
+            if latency <= host.best_latency * self.latency_slack:
+                host.limit = min(self.max_limit, host.limit + 1)
+
+        host.peak_limit = max(host.peak_limit, host.limit)
+        if host.limit != old_limit:
+            logging.debug("%s %s concurrency %s -> %s (latency %s, error rate %.2f, throttled %s)", self.name, name,
+                          old_limit, host.limit, "%.3fs" % latency if latency is not None else "n/a", error_rate,
+                          host.window_throttled, extra={"event": "limiter", "stage": self.name})
+
+        host.window_latencies = []
+        host.window_errors = 0
+        host.window_throttled = 0
+
+    def log_state(self):
+        hosts = ", ".join("%s %s (peak %s, best latency %s)" % (name, host.limit, host.peak_limit,
+                                                                "%.3fs" % host.best_latency if host.best_latency is not None else "n/a")
+                          for name, host in self.hosts.items())
+        logging.info("%s limiter: %s requests, %s errors, %s throttled, concurrency now %s", self.name,
+                     self.total_requests, self.total_errors, self.total_throttled, hosts or "n/a")
@@ -0,0 +1,85 @@
+import datetime
+import re
+import time
+
+# Which pages a refresh crawl (python scraping.py --refresh) goes back for. A full crawl is ~40,000 requests,
+# but most of those pages never change - a 2012 Corolla's specs are what they are. So every page gets a revisit
+# interval from how likely it is to have changed, and a refresh only fetches the ones that are overdue, most
+# overdue first, up to a budget:
+#   recently discovered  pages first seen in the last new_page_days days, still getting filled in
+#   current model year   this year and next, where prices and trims still move around
+#   no year              make and model pages, where new model years (and so new trims) show up
+#   last few years       up to recent_years model years old
+#   old                  everything older, revisited rarely
+# The model year comes from the URL (/overview/toyota_corolla_2019, /specifications/toyota_corolla_2019_le).
+# fetched_at and first_seen come from crawl_progress.db, and a refetched page whose sha256 matches the
+# one we had gets skipped rather than parsed again.
+
+day = 24 * 60 * 60
+
+new_page_days = 30
+recent_years = 3
+
+intervals = {
+    "recently discovered": 3 * day,
+    "current model year": 7 * day,
+    "no year": 14 * day,
+    "last few years": 60 * day,
+    "old": 365 * day,
+}
+
+year_pattern = re.compile(r"_((?:19|20)\d\d)(?:_|$)")
+
+def model_year(url):
+    match = year_pattern.search(url.rstrip("/"))
+    return int(match.group(1)) if match else None
+
+def volatility(url, first_seen, now, this_year=None):
+    if first_seen is not None and now - first_seen < new_page_days * day:
+        return "recently discovered"
+
+    year = model_year(url)
+    this_year = this_year or datetime.date.fromtimestamp(now).year
+    if year is None:
+        return "no year"
+    if year >= this_year:
+        return "current model year"
+    if year >= this_year - recent_years:
+        return "last few years"
+    return "old"
+
+# How far past its revisit interval a page is: 1.0 means it's due right now, 2.0 that it's been twice as long.
+# Pages we've never got a good copy of are always due (and go first).
+def overdue(url, times, now, this_year=None):
+    if url not in times:
+        return float("inf")
+    fetched_at, first_seen = times[url]
+    return (now - fetched_at) / intervals[volatility(url, first_seen, now, this_year)]
+
+# Picks which URLs to refetch: everything at least due, most overdue first, at most budget of them (None for
+# no limit). urls_by_stage is [(stage name, urls)], times is url -> (fetched_at, first_seen) from
+# crawl_progress.fetch_times. Returns stage name -> URLs to refetch for it, in the same order as urls_by_stage.
+def plan(urls_by_stage, times, budget=None, now=None, this_year=None):
+    now = now or time.time()
+    due = []
+    for stage_name, urls in urls_by_stage:
+        for url in urls:
+            how_overdue = overdue(url, times, now, this_year)
+            if how_overdue >= 1:
+                due.append((how_overdue, stage_name, url))
+
+    due.sort(key=lambda item: item[0], reverse=True)
+    if budget is not None:
+        due = due[:budget]
+
+    chosen = {(stage_name, url) for _, stage_name, url in due}
+    return {stage_name: [url for url in urls if (stage_name, url) in chosen] for stage_name, urls in urls_by_stage}
+
+# How many of urls fall into each volatility class, for the log
+def summary(urls, times, now=None, this_year=None):
+    now = now or time.time()
+    counts = dict.fromkeys(intervals, 0)
+    for url in urls:
+        if url in times:
+            counts[volatility(url, times[url][1], now, this_year)] += 1
+    return counts
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+import aiohttp
+
+# asyncfetch used to catch every exception and just return None, so one blip meant a car silently went missing.
+# Now every failure gets sorted into a kind, each kind gets its own number of attempts, and we wait a bit longer
+# (exponential backoff with jitter) between each one.
+# https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/
+#
+#   timeout     - the request took too long
+#   connection  - connection refused/reset, DNS hiccups, the server hanging up on us
+#   server      - 5xx from the website
+#   throttled   - 429 Too Many Requests, waits at least as long as the Retry-After header asks
+#   client      - any other 4xx (404 and friends), retrying won't help so those go straight to the dead letters
+#   other       - anything else that went wrong while getting the page
+#
+# URLs that still fail after all their attempts get written to a dead letter file, one JSON object per line,
+# which `python scraping.py --replay-dead-letters` can go back and retry on its own later.
+dead_letter_file = "txt_files/dead_letters.jsonl"
+
+default_attempts = {
+    "timeout": 4,
+    "connection": 4,
+    "server": 4,
+    "throttled": 6,
+    "client": 1,
+    "other": 1,
+}
+
+class RetryPolicy:
+
+    def __init__(self, attempts=None, base_delay=1.0, max_delay=60.0):
+        self.attempts = dict(default_attempts)
+        self.attempts.update(attempts or {})
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    # Works out what kind of failure this was, from the exception and the HTTP status (None if we never got one)
+    def classify(self, error, status=None):
+        if status == 429:
+            return "throttled"
+        if status is not None and status >= 500:
+            return "server"
+        if status is not None and status >= 400:
+            return "client"
+        if isinstance(error, asyncio.TimeoutError):
+            return "timeout"
+        if isinstance(error, (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, ConnectionError)):
+            return "connection"
+        return "other"
+
+    def should_retry(self, kind, attempt):
+        return attempt < self.attempts.get(kind, 1)
+
+    # How long to wait before the next attempt. "Full jitter" - a random wait between 0 and the backoff, so a whole
+    # batch of failed requests doesn't come back and hit the server at the exact same moment
+    def delay(self, kind, attempt, retry_after=None):
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        wait = random.uniform(0, backoff)
+
+        if kind == "throttled":
+            # The server told us how long to back off for, so wait at least that long
+            wait = max(wait, parse_retry_after(retry_after) or backoff)
+        return wait
+
+# Retry-After can be a number of seconds or an HTTP date, only bothering with the seconds version
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Retry-After
+def parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+def add_dead_letter(url, stage, kind, error, attempts, file_name=dead_letter_file):
+    entry = {"url": url, "stage": stage, "kind": kind, "error": str(error), "attempts": attempts, "failed_at": time.time()}
+    with open(file_name, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+
+# Every dead letter, the last one for each URL wins
+def read_dead_letters(file_name=dead_letter_file):
+    entries = {}
+    if os.path.exists(file_name):
+        with open(file_name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                entries[entry["url"]] = entry
+    return list(entries.values())
+
+# Swaps the dead letter file for just these entries (the ones that still failed after a replay)
+def write_dead_letters(entries, file_name=dead_letter_file):
+    with open(file_name + ".tmp", "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+    os.replace(file_name + ".tmp", file_name)
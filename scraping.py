@@ -1,32 +1,158 @@
 import logging
-import bs4 as bs
-import pandas as pd
-import aiohttp
 import asyncio
 import pickle
+import contextlib
+import itertools
+import os
+import sys
 import time
 import multiprocessing
-import joblib
-
-from joblib import Parallel, delayed
-from urllib.request import Request, urlopen
-from bs4 import BeautifulSoup
+import crawl_progress
+import page_store
+import rate_limit
+import crawl_metrics
+import crawl_logging
+import refresh_schedule
+import url_store
+import work_queue
+import subprocess
+import collections
+
+# The heavy stuff only gets imported once something actually uses it, so importing scraping.py (or running
+# `python cli.py --help`) doesn't have to wait on pandas and friends, see lazy_import.py
+from lazy_import import lazy_import
+bs = lazy_import("bs4")
+pd = lazy_import("pandas")
+joblib = lazy_import("joblib")
+html_extract = lazy_import("html_extract")
+retry_policy = lazy_import("retry_policy")
+http_session = lazy_import("http_session")
+spec_table = lazy_import("spec_table")
 
 website = "https://www.thecarconnection.com" # Site to scrap from
 
+# Point the whole crawl somewhere else, e.g. at mock_site.py for testing offline:
+#   SCRAPER_WEBSITE=http://127.0.0.1:8080 python scraping.py
+website = os.environ.get("SCRAPER_WEBSITE", website)
+
 # For parallel processing data
-num_cores = multiprocessing.cpu_count() - 1  # don't freeze the machine! leave a core free!
+num_cores = max(1, multiprocessing.cpu_count() - 1)  # don't freeze the machine! leave a core free!
+
+# Pages get handed to the worker processes in chunks of this many, so we aren't paying the cost of
+# shipping work between processes for every single page
+parse_chunk_size = 16
+
+# Streaming mode - instead of gathering every single page into one giant list and *then* parsing it,
+# pages get pushed into a bounded queue as they come back and the parse workers chew on them right away.
+# Keeps memory flat (no more 10GB spikes on the specifications run) and the CPUs busy during the fetching.
+# Set to False to go back to the old gather everything -> Joblib approach.
+streaming = True
+stream_queue_size = 100     # Max pages sitting in memory waiting to be parsed
+stream_fetchers = 20        # Coroutines pulling URLs to fetch, the stage's limiter still caps in flight requests
+
+# Frontier mode - instead of running each stage as a hard barrier (no years page gets requested until every
+# single models page is done), every URL gets queued up for the next stage the moment it's found, so the
+# network and the CPUs stay busy the whole way through. Still writes out all the same per stage files.
+# Only kicks in when some of the cached stage files are missing, otherwise they get read back like normal.
+frontier_mode = True
+frontier_workers = 50       # Coroutines working through the frontier, the limiter still caps in flight requests
+
+# Per URL checkpoints - every page we fetch gets saved to the page store (txt_files/page_store, see page_store.py)
+# and recorded in txt_files/crawl_progress.db, so if we crash halfway through a stage the rerun only fetches the
+# URLs that are missing or failed. See crawl_progress.py
+checkpoints = True
+
+# The pages in the page store get reused on every run, not just to pick up after a crash - so deleting the
+# txt_files cache files rebuilds them from the saved pages rather than the website. With --fresh (main() sets
+# this to when the run started) only pages fetched during this run count, everything else gets fetched again.
+fresh_since = None
+
+# Each stage starts at the same number of requests in flight it used to be hardcoded to (15 or 10), then
+# rate_limit.AdaptiveLimiter raises or lowers it based on latency and errors/429s, staying between these two.
+# max_requests_per_sec caps how many requests per second we send to any one host (None = no cap).
+min_concurrency = 2
+max_concurrency = 50
+max_requests_per_sec = None
+
+# How many times to try each kind of failure before giving up on a URL (see retry_policy.py), and the
+# backoff between attempts: a random wait up to base * 2^attempt seconds, never more than the max.
+# URLs that still fail end up in txt_files/dead_letters.jsonl, run `python scraping.py --replay-dead-letters`
+# to retry just those.
+retry_attempts = {"timeout": 4, "connection": 4, "server": 4, "throttled": 6, "client": 1}
+retry_base_delay = 1.0
+retry_max_delay = 60.0
+
+# Settings for the one HTTP session the whole crawl shares (see http_session.py). connection_limit is just a
+# ceiling on open sockets, the limiters above decide how many requests are actually in flight.
+connection_limit = 100
+dns_cache_seconds = 300
+keepalive_seconds = 30
+request_timeout_seconds = 60
+connect_timeout_seconds = 15
+user_agent = "X"            # Same as the old urlopen fetch sent, the site turns away urllib/aiohttp's default one
+
+# Per stage metrics (latency histograms, bytes, retries, parse time, rows...) get written to
+# txt_files/crawl_metrics.json after every stage, see crawl_metrics.py. Set write_prometheus to also write
+# them to txt_files/crawl_metrics.prom in the Prometheus text format.
+write_prometheus = False
+
+# python scraping.py --refresh goes back for the pages most likely to have changed since they were fetched
+# (current model years, new trims...) instead of reading everything out of the cache, see refresh_schedule.py
+refresh_budget = 2000       # Max pages to revisit per refresh, pages it finds that are brand new don't count
+
+# Multi-worker crawl - the frontier lives in a SQLite work queue (see work_queue.py) instead of in this process,
+# and any number of worker processes lease URLs out of it, a make at a time:
+#   python scraping.py --coordinator [--workers 4] [--queue txt_files/work_queue.db]
+# seeds the queue with the makes, starts that many local workers (and works on it too), then writes out all the
+# usual files once the queue's empty. To help out from another machine, point it at the same queue file:
+#   python scraping.py --worker --queue /shared/work_queue.db
+# Each worker logs to its own log_scraping_worker_<pid>.log and writes its own metrics file.
+# (main() sets the first four from the command line.)
+coordinator_mode = False
+worker_mode = False
+queue_file = work_queue.work_queue_file
+local_workers = max(1, num_cores // 2)
+worker_batch_size = 20      # URLs leased at a time, all from the same make
+lease_seconds = 300         # A dead worker's URLs go back in the queue after this long
+worker_poll_seconds = 2     # How long to wait when the queue's empty but other workers are still busy
+worker_parse_processes = max(1, num_cores // (local_workers + 1))   # Parse processes per worker
+
+# Queued logging (see crawl_logging.py) - logging calls just put the record on a queue and a background thread
+# writes it out, so the event loop never waits on the disk or the console. json_logs makes log_scraping.log
+# JSON lines instead of plain text. The per URL events are sampled so they can't flood the log:
+# event -> (fraction kept, max per second for each stage), None for no limit.
+# Set queue_logging = False to go back to writing every line straight out, in plain text.
+queue_logging = True
+json_logs = True
+file_log_level = logging.DEBUG
+console_log_level = logging.INFO
+log_sampling = {
+    "fetch": (0.01, 5),             # Every page that comes back
+    "fetch_retry": (1.0, 5),        # A request that'll be retried
+    "fetch_failed": (1.0, 10),      # Out of retries (the dead letter file has them all anyway)
+    "parse_error": (1.0, 5),        # Pages the process*Urls functions couldn't make sense of
+    "checkpoint_failed": (1.0, 5),  # Pages that came back but couldn't be saved to the page store
+    "limiter": (1.0, 2),            # Concurrency going up or down
+}
+
+# Which HTML extractor the process*Urls functions use, see html_extract.py
+# "lxml" = lxml + precompiled XPaths (much quicker), "bs4" = the original BeautifulSoup html.parser code
+parser_backend = "lxml"
 
 # File Names for storing to & pulling from for future runs
 trimsCsvFile = "csv_files/every_single_car.csv"
 dataCsvFile = "csv_files/the_big_data.csv"
+dataParquetFile = "csv_files/the_big_data.parquet"   # Same data, one typed row per trim, see spec_table.py
+
+# python/data_cleaning.py still reads the wide (one column per car) CSV, set this to False to only write the Parquet
+write_wide_csv = True
 
 all_makes_file = "txt_files/all_makes_file.txt"
 all_models_file = "txt_files/all_models_file.txt"
 all_years_file = "txt_files/all_years_file.txt"
 all_specs_file = "txt_files/all_specs_file.txt"
 all_trims_file = "txt_files/all_trims_file.txt"
-all_data_file = "txt_files/all_data_file.txt"
+final_data_file = "txt_files/final_data.txt"
 
 # Code seems to be repeatedly calling out to the CarConnection website. No wonder it takes 8 hours to run currently...
 # Instead, let's cache the basics like Makes & Models to speed this up.
@@ -35,57 +161,384 @@ all_models_list = []    # Make_Models like Toyota Corolla
 all_years_list = []     # Make_Model_Years like Toyota Corolla 2010
 all_specs_list = []     # Make_Model_Year_Spec like Toyota Corolla 2010 XYZ
 all_trims_list = []     # Make_Model_Year_Spec_Trim like Toyota Corolla 2010 XYZ ABC
-all_data_list = []      # All the data scraped for the all_trims_list
+
+# Once they're found the lists above live in here, named after the stage that found them, see url_list
+crawl_urls = url_store.UrlStore()
 
 # Some logging for scraping.py, to both understand the script better and have debug info if it crashes
 # or dies mid scrap. Logging is built into Python
 # https://realpython.com/python-logging/
-logging.basicConfig(filename='log_scraping.log',
-                    filemode='w',
-                    format='%(asctime)s - %(levelname)s - %(message)s',
-                    datefmt='%m-%d-%yT%H:%M:%S',
-                    level=logging.DEBUG)
-
-# Setup logging to the console too
-# https://stackoverflow.com/a/38613204
-console = logging.StreamHandler()
-console.setLevel(logging.DEBUG)
-
-# Format = DateTime: <message>
-# http://strftime.org/
-formatter = logging.Formatter('%(asctime)s: %(message)s', '%m-%d-%y %H:%M:%S')
-console.setFormatter(formatter)
-logging.getLogger('').addHandler(console)
-
-# Logging should be working now
-logging.info("************** Starting... **************")
-logging.info('This will get logged to a file called log_scraping.log')
-
-# Original fetch function
+def setup_logging(log_file="log_scraping.log"):
+    if queue_logging:
+        crawl_logging.setup(log_file, json_logs, file_log_level, console_log_level, log_sampling)
+        logging.info("************** Starting... **************")
+        logging.info('This will get logged to a file called %s', log_file)
+        return
+
+    logging.basicConfig(filename=log_file,
+                        filemode='w',
+                        format='%(asctime)s - %(levelname)s - %(message)s',
+                        datefmt='%m-%d-%yT%H:%M:%S',
+                        level=logging.DEBUG)
+
+    # Setup logging to the console too
+    # https://stackoverflow.com/a/38613204
+    console = logging.StreamHandler()
+    console.setLevel(logging.DEBUG)
+
+    # Format = DateTime: <message>
+    # http://strftime.org/
+    formatter = logging.Formatter('%(asctime)s: %(message)s', '%m-%d-%y %H:%M:%S')
+    console.setFormatter(formatter)
+    logging.getLogger('').addHandler(console)
+
+    # Logging should be working now
+    logging.info("************** Starting... **************")
+    logging.info('This will get logged to a file called %s', log_file)
+
+# Everything below gets set up by setup(), not on import - so other scripts (cli.py, extract_benchmark.py...)
+# can import scraping.py for its stage functions without it grabbing the log file or opening databases.
+store = None            # The raw HTML for every page lives in here, compressed, instead of one giant pickled list
+progress_conn = None
+retry = None
+metrics = crawl_metrics.CrawlMetrics()
+metrics_name = ""
+extractor = None        # See page_extractor
+crawl_loop = None       # See run_crawl
+shared_session = None
+writer = None           # See page_writer
+
+# Sets up logging, the page store, checkpoints and the event loop. Only does anything the first time.
+# log_file=None leaves logging alone, for scripts that set up their own.
+def setup(log_file="log_scraping.log"):
+    global store, progress_conn, retry, metrics_name, crawl_loop
+    if crawl_loop is not None:
+        return
+    if log_file is not None:
+        setup_logging(log_file)
+    store = page_store.PageStore()
+    progress_conn = crawl_progress.open_progress() if checkpoints else None
+    retry = retry_policy.RetryPolicy(retry_attempts, retry_base_delay, retry_max_delay)
+    metrics_name = "_worker_%s" % os.getpid() if worker_mode else ""
+
+    # Every stage runs on this one event loop (instead of a fresh asyncio.run() each time), so they can all share
+    # the same HTTP session and its open connections
+    crawl_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(crawl_loop)
+
+def run_crawl(coroutine):
+    return crawl_loop.run_until_complete(coroutine)
+
+# The HTML extractor for parser_backend, made the first time a page gets parsed (which might be in a joblib
+# worker process, where setup() never ran - so that's where the worker's logging gets set up too)
+def page_extractor():
+    global extractor
+    if extractor is None:
+        crawl_logging.setup_worker(log_sampling)
+        extractor = html_extract.get_extractor(parser_backend)
+    return extractor
+
+# Stages borrow the shared session with `async with crawl_session() as session:`. It's only created the first
+# time it's needed, and isn't closed at the end of the block so the next stage can reuse its connections.
+@contextlib.asynccontextmanager
+async def crawl_session():
+    global shared_session
+    if shared_session is None or shared_session.closed:
+        shared_session = http_session.make_session(limit=connection_limit,
+                                                   dns_cache_seconds=dns_cache_seconds,
+                                                   keepalive_seconds=keepalive_seconds,
+                                                   timeout_seconds=request_timeout_seconds,
+                                                   connect_timeout_seconds=connect_timeout_seconds,
+                                                   user_agent=user_agent)
+    yield shared_session
+
+async def close_crawl_session():
+    if shared_session is not None:
+        await shared_session.close()
+    if writer is not None:
+        writer.close()
+
+# Pages get checkpointed on the CheckpointWriter's thread, see crawl_progress.py. Like the session it's started
+# the first time it's needed and stopped (after committing everything) by close_crawl_session.
+def page_writer():
+    global writer
+    if writer is None or writer.closed():
+        writer = crawl_progress.CheckpointWriter(progress_conn, store)
+    return writer
+
+# Original fetch function, now going through the shared session (retries and all) instead of a blocking urlopen.
+# Everything else hangs off this one page, so if it's still failing after the retries the crawl stops here
+# (the same as urlopen raising used to) rather than carrying on with no makes.
 def fetch(hostname, filename):
-    return bs.BeautifulSoup(urlopen(Request(hostname + filename, headers={'User-Agent': 'X'})).read(), 'lxml')
+    async def fetch_page():
+        async with crawl_session() as session:
+            return await asyncfetch(session, hostname + filename, stage_limiter("all_makes", 1), "all_makes")
+
+    page = run_crawl(fetch_page())
+    if page is None:
+        raise RuntimeError("Couldn't fetch %s%s, see %s" % (hostname, filename, retry_policy.dead_letter_file))
+    return bs.BeautifulSoup(page, 'lxml')
 
 # Async fetch for some super fast data minin'
-async def asyncfetch(session, url, sem):
-    try:
-        async with sem:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    response.raise_for_status()
-                    logging.critical("Failed to get async request!")
-                #logging.debug("Got response for: %s", url)
-                return await response.text()
-    except Exception as e:
-        logging.error('aiohttp exception: %s %s', type(e), str(e))
-        return
+# use_cache=False always asks the website, even if we already have the page (that's how a refresh gets new copies)
+async def asyncfetch(session, url, limiter, stage=None, use_cache=True):
+    stage_metrics = metrics.stage(stage)
+
+    # Already got this page on a previous run? No need to ask the website for it again.
+    # A copy that can't be read back (corrupt blob, missing zdict...) is as good as not having one.
+    if progress_conn is not None and use_cache:
+        try:
+            body = crawl_progress.load_body(progress_conn, store, url, fresh_since)
+        except Exception as e:
+            logging.warning("Couldn't read the saved copy of %s, fetching it again: %s %s", url, type(e), str(e),
+                            extra={"event": "checkpoint_failed", "stage": stage, "url": url})
+            body = None
+        if body is not None:
+            stage_metrics.cached()
+            return body
+
+    attempt = 0
+    while True:
+        attempt += 1
+        status = None
+        retry_after = None
+        try:
+            await limiter.acquire(url)
+            stage_metrics.request_started()
+            start = time.perf_counter()
+            size = 0
+            try:
+                async with session.get(url) as response:
+                    status = response.status
+                    if response.status != 200:
+                        retry_after = response.headers.get("Retry-After")
+                        response.raise_for_status()
+                        logging.critical("Failed to get async request!")
+                    size = len(await response.read())
+                    body = await response.text()
+            finally:
+                # Let the limiter know how it went, so it can back off or speed up
+                latency = time.perf_counter() - start
+                stage_metrics.request_finished(latency, status, size)
+                await limiter.release(url, latency, status)
+        except Exception as e:
+            # Timeouts, 5xx and 429s are usually just a blip, so have another go after a little wait
+            kind = retry.classify(e, status)
+            if retry.should_retry(kind, attempt):
+                delay = retry.delay(kind, attempt, retry_after)
+                logging.warning("%s error on %s (attempt %s), retrying in %.1fs", kind, url, attempt, delay,
+                                extra={"event": "fetch_retry", "stage": stage, "url": url})
+                stage_metrics.retried()
+                await asyncio.sleep(delay)
+                continue
+
+            # Out of attempts, write it down so it can be replayed later instead of silently losing the car
+            logging.error('aiohttp exception: %s %s (%s, gave up after %s attempts)', type(e), str(e), kind, attempt,
+                          extra={"event": "fetch_failed", "stage": stage, "url": url})
+            stage_metrics.failed(kind)
+            if progress_conn is not None:
+                crawl_progress.mark_failed(progress_conn, url, e, stage)
+            retry_policy.add_dead_letter(url, stage, kind, e, attempt)
+            return
+
+        # Only the request itself gets retried - the page came back fine, so if the checkpoint can't be written
+        # (disk full, database locked...) that's logged on its own and the page still gets used, it'll just be
+        # fetched again on the next run
+        if progress_conn is not None:
+            try:
+                await page_writer().mark_done(url, body, stage)
+            except Exception as e:
+                logging.error("Couldn't checkpoint %s: %s %s", url, type(e), str(e),
+                              extra={"event": "checkpoint_failed", "stage": stage, "url": url})
+        logging.debug("Got %s (%s bytes in %.3fs)", url, size, latency, extra={"event": "fetch", "stage": stage, "url": url})
+        return body
 
 # Async gather - give it a session, and a list of URLs, fetches everything and returns it
-async def async_fetch_all(session, urls, sem):
-    logging.info("async_fetch_all: %s %s", len(urls), sem)
-    results = await asyncio.gather(*[asyncio.create_task(asyncfetch(session, url, sem))
+async def async_fetch_all(session, urls, limiter, stage=None):
+    logging.info("async_fetch_all: %s %s", len(urls), limiter)
+    results = await asyncio.gather(*[asyncio.create_task(asyncfetch(session, url, limiter, stage))
                                      for url in urls], return_exceptions=True)
     return results
 
+# Runs process_function over a whole chunk of (url, page) inside one worker process, handing back
+# (result, seconds it took) for each page. A page process_function chokes on gets logged and a None result,
+# so one bad page can't take the rest of the chunk (or the parser waiting on it) down with it.
+def parse_chunk(process_function, pages, stage=None):
+    parsed = []
+    for url, page in pages:
+        try:
+            parsed.append(crawl_metrics.timed(process_function, page))
+        except Exception as e:
+            crawl_logging.setup_worker(log_sampling)
+            logging.error("Couldn't parse %s: %s %s", url, type(e), str(e), extra={"event": "parse_error", "stage": stage, "url": url})
+            parsed.append((None, 0.0))
+    return parsed
+
+# Async stream - same idea as async_fetch_all, but each page is handed off to process_function as soon as it
+# comes back instead of waiting on every other page. Fetchers block on the bounded queue when the parsers fall
+# behind, so at most stream_queue_size pages (plus the chunks being parsed) are ever held in memory no matter
+# how many URLs there are. Parsing is spread across processes using Joblib's loky executor, since threads
+# would just end up taking turns on the GIL.
+# Returns the process_function results in the same order as urls.
+async def async_stream_all(session, urls, limiter, process_function, stage=None):
+    logging.info("async_stream_all: %s %s", len(urls), limiter)
+    loop = asyncio.get_running_loop()
+    page_queue = asyncio.Queue(maxsize=stream_queue_size)
+    url_iter = iter(enumerate(urls))
+    results = [None] * len(urls)
+    stage_metrics = metrics.stage(stage)
+
+    # Same pool of worker processes Joblib's Parallel uses under the hood, so the two play nice together
+    # https://joblib.readthedocs.io/en/latest/parallel.html
+    executor = joblib.executor.get_memmapping_executor(num_cores)
+
+    async def fetcher():
+        # Every fetcher pulls from the same iterator, so no URL is fetched twice
+        for i, url in url_iter:
+            page = await asyncfetch(session, url, limiter, stage)
+            await page_queue.put((i, url, page))
+            stage_metrics.queue_depth(page_queue.qsize())
+
+    async def parser():
+        while True:
+            # Wait for one page, then grab whatever else is already waiting (up to parse_chunk_size pages)
+            # so each trip out to a worker process carries a decent chunk of work
+            chunk = [await page_queue.get()]
+            while chunk[-1] is not None and len(chunk) < parse_chunk_size and not page_queue.empty():
+                chunk.append(page_queue.get_nowait())
+
+            stop = chunk[-1] is None
+            if stop:
+                chunk.pop()
+
+            pages = []
+            for i, url, page in chunk:
+                if page is None:
+                    logging.error("Nothing came back for %s, skipping it", url, extra={"event": "fetch_failed", "stage": stage, "url": url})
+                else:
+                    pages.append((i, url, page))
+
+            # Whatever goes wrong, this parser has to keep going until it gets its stop signal - if every parser
+            # died, the fetchers would wait on the full queue forever
+            if pages:
+                try:
+                    parsed = await loop.run_in_executor(executor, parse_chunk, process_function,
+                                                        [(url, page) for _, url, page in pages], stage)
+                except Exception as e:
+                    logging.error("Parse worker failed on a chunk of %s pages: %s %s", len(pages), type(e), str(e),
+                                  extra={"event": "parse_error", "stage": stage})
+                    parsed = [(None, 0.0)] * len(pages)
+
+                # Results go back in the slot for their URL, so the order doesn't depend on who finished first
+                for (i, _, _), (result, seconds) in zip(pages, parsed):
+                    results[i] = result
+                    stage_metrics.parsed(seconds)
+
+            if stop:
+                return
+
+    parsers = [asyncio.create_task(parser()) for _ in range(num_cores)]
+    fetchers = [asyncio.create_task(fetcher()) for _ in range(stream_fetchers)]
+    try:
+        await asyncio.gather(*fetchers)
+    except BaseException:
+        # One fetcher blew up (or the stage got cancelled) - don't leave the others and the parsers running
+        # on the loop after the stage is gone, every other stage shares it
+        for task in fetchers + parsers:
+            task.cancel()
+        await asyncio.gather(*fetchers, *parsers, return_exceptions=True)
+        raise
+
+    # One stop signal per parser, they'll finish whatever is still in the queue first
+    for _ in parsers:
+        await page_queue.put(None)
+    await asyncio.gather(*parsers)
+    return results
+
+# Retries every URL in the dead letter file on its own. Pages that come back this time get checkpointed like
+# normal, then the cached files for their stage (and every stage after it) get deleted, so the rest of this run
+# picks them up - which is cheap, since every other page gets read straight back out of the page store.
+# Anything that still fails stays in the dead letter file for next time.
+def replay_dead_letters():
+    dead_letters = retry_policy.read_dead_letters()
+    if not dead_letters:
+        logging.info("No dead letters to replay")
+        return
+
+    if progress_conn is None:
+        logging.error("Replaying dead letters needs checkpoints = True, otherwise the pages have nowhere to go")
+        return
+
+    logging.info("Replaying %s dead letters", len(dead_letters))
+
+    async def replay():
+        limiter = stage_limiter("dead_letters", 10)
+        async with crawl_session() as session:
+            results = await asyncio.gather(*[asyncfetch(session, entry["url"], limiter, entry["stage"])
+                                             for entry in dead_letters])
+        limiter.log_state()
+        return results
+
+    results = run_crawl(replay())
+    recovered = [entry for entry, page in zip(dead_letters, results) if page is not None]
+    logging.info("Recovered %s of %s dead letters", len(recovered), len(dead_letters))
+
+    # Whatever failed again got a fresh entry added by asyncfetch, just drop the ones we got back
+    recovered_urls = {entry["url"] for entry in recovered}
+    retry_policy.write_dead_letters([entry for entry in retry_policy.read_dead_letters() if entry["url"] not in recovered_urls])
+    recovered_stages = {entry["stage"] for entry in recovered}
+
+    # Each stage's pages feed into the cached file listed next to it, which feeds every file after it
+    stage_files = [("all_models", all_models_file), ("all_years", all_years_file), ("all_specs", all_specs_file),
+                   ("all_trims", all_trims_file), ("specifications", final_data_file)]
+    for i, (stage_name, _) in enumerate(stage_files):
+        if stage_name in recovered_stages:
+            for _, file_name in stage_files[i:]:
+                if os.path.exists(file_name):
+                    logging.info("Removing %s so it gets rebuilt with the recovered pages", file_name)
+                    os.remove(file_name)
+            break
+
+# New adaptive limiter for a stage, starting at the number of requests in flight it used to be hardcoded to
+def stage_limiter(stage_name, start):
+    return rate_limit.AdaptiveLimiter(stage_name, start=start, min_limit=min_concurrency, max_limit=max_concurrency,
+                                      requests_per_sec=max_requests_per_sec)
+
+# Let us know how much of a stage a previous run already got through
+def log_resume(urls, stage_name):
+    if progress_conn is not None:
+        pending = crawl_progress.pending_urls(progress_conn, urls)
+        if len(pending) != len(urls):
+            logging.info("Resuming %s: %s of %s URLs still need fetching", stage_name, len(pending), len(urls))
+
+# Fetch every URL and run process_function over the pages, either streaming or the old gather then Joblib way
+async def async_fetch_and_process(session, urls, limiter, process_function, stage_name):
+    log_resume(urls, stage_name)
+
+    if streaming:
+        logging.info("Streaming %s pages for %s...", len(urls), stage_name)
+        results = await async_stream_all(session, urls, limiter, process_function, stage=stage_name)
+        limiter.log_state()
+        return results
+
+    results = await async_fetch_all(session, urls, limiter, stage_name)
+    results = [page for page in results if page]
+    limiter.log_state()
+
+    # See note under all_specs for what Joblib does
+    if results:
+        logging.info("Got results back for %s: %s", stage_name, len(results))
+        logging.info("Starting joblib processes to process results...")
+        parsed = joblib.Parallel(n_jobs=num_cores, verbose=0, batch_size=parse_chunk_size)(joblib.delayed(crawl_metrics.timed)(process_function, page) for page in results)
+        for _, seconds in parsed:
+            metrics.stage(stage_name).parsed(seconds)
+        return [result for result, _ in parsed]
+    return []
+
+# Every page hands back its own list of URLs, this joins them all up in page order
+def flatten(results):
+    return [url for urls in results if urls for url in urls]
+
 # File IO functions - caching results of previous web scraps, so if we crash or timeout, or whatever
 # we won't have to grab the same data repeatedly. In the future, we can overwrite these files or
 # add an option to delete them if we want fresh data (perhaps a new model came out recently)
@@ -99,15 +552,30 @@ def try2readfile(scrap_name, scrap_list, scrap_file, async_function):
             logging.info("Found %s, with %s entries", scrap_name, len(scrap_list))
         else:
             logging.error("%s is empty, running web scraper", scrap_file)
-            scrap_list = asyncio.run(async_function())
+            scrap_list = run_crawl(async_function())
         
     except Exception as e:
         logging.error("Didn't find the %s file, running scraper", scrap_file)
-        scrap_list = asyncio.run(async_function())
+        scrap_list = run_crawl(async_function())
 
     logging.critical("Collected all %s successfully", scrap_name)
+    write_metrics()
     return scrap_list
 
+# Saves the metrics so far, after every stage so a crash part way through still leaves something to look at
+def write_metrics():
+    metrics.write_json(crawl_metrics.metrics_file.replace(".json", metrics_name + ".json"))
+    if write_prometheus:
+        metrics.write_prometheus(crawl_metrics.prometheus_file.replace(".prom", metrics_name + ".prom"))
+
+# Puts urls into the named list in crawl_urls and returns that list. Each URL is only kept once (so never fetched
+# twice), see url_store.py. The cache files still get plain lists of URLs.
+def url_list(name, urls):
+    found = crawl_urls.list(name)
+    if urls is not found:
+        found.extend(urls)
+    return found
+
 def readFromfile(file_name):
     with open(file_name, 'rb') as f:
         list_arr = pickle.load(f)
@@ -145,7 +613,7 @@ def all_makes():
     logging.info("Found %s Car Makes", len(all_makes_list))
 
     # Write the makes to a file with the same name for easy retrieval.
-    logging.info("Car makes list: %s", all_makes_list)
+    logging.debug("Car makes list: %s ...", all_makes_list[:5])
     dump2file(all_makes_file, all_makes_list)
 
     return all_makes_list
@@ -157,39 +625,33 @@ def all_makes():
 async def all_models():
 
     # Don't overwhelm aiohttp!
-    # 15 Requests *at most* at a time
+    # Starts at 15 Requests at a time, and the limiter adjusts it from there
     # https://pawelmhm.github.io/asyncio/python/aiohttp/2016/04/22/asyncio-aiohttp.html
-    sem = asyncio.Semaphore(15)
+    limiter = stage_limiter("all_models", 15)
 
     # Trying some async Python for looping to make this go super quick (hopefully)
     # Results: 5 seconds quicker for this call.
     # https://stackoverflow.com/a/48052347
     # https://stackoverflow.com/a/35900453
-    async with aiohttp.ClientSession() as session:
-        results = await async_fetch_all(session, all_makes_list, sem)
-
-    # See note under all_specs for what Joblib does
-    if results:
-        logging.info("Got results back for all_models: %s", len(results))
-        logging.info("Starting joblib processes to process results...")
-        Parallel(n_jobs=num_cores, verbose=0, require='sharedmem')(delayed(processModelsUrls)(model) for model in results)
+    async with crawl_session() as session:
+        results = await async_fetch_and_process(session, all_makes_list, limiter, processModelsUrls, "all_models")
+    models_list = url_list("all_models", flatten(results))
+    metrics.stage("all_models").rows = len(models_list)
 
     # Log how many Make/Model combos we find
-    logging.info("Joblib processing completed for all_models!")
-    logging.info("Found %s Make & Model Combinations", len(all_models_list))
+    logging.info("Processing completed for all_models!")
+    logging.info("Found %s Make & Model Combinations", len(models_list))
 
     # Write the models to a file with the same name for easy retrieval.
-    dump2file(all_models_file, all_models_list)
-    return all_models_list
+    dump2file(all_models_file, models_list)
+    return models_list
 
+# Separated out the processing of each URL so we can parse them across processes. Each of these returns the
+# URLs it found rather than appending to a global list, since worker processes don't share memory.
 def processModelsUrls(model):
-    soup = BeautifulSoup(model, 'html.parser')
-
-    for div in soup.find_all("div", {"class": "name"}):
-        all_models_list.append(website + div.find_all("a")[0]['href'])
-        # Ex: Found Model for /make/new,toyota: /cars/toyota_corolla
-        # <a href="/cars/toyota_corolla">Toyota Corolla</a>
-        #logging.debug("Found Make Model Combo: %s", div.find_all("a")[0]['href'])
+    # Ex: Found Model for /make/new,toyota: /cars/toyota_corolla
+    # <a href="/cars/toyota_corolla">Toyota Corolla</a>
+    return [website + href for href in page_extractor().model_links(model)]
 
 # Grabs all the years for every given make/model combination
 # Example: 2010 Toyota Corolla
@@ -198,60 +660,48 @@ def processModelsUrls(model):
 async def all_years():
 
     # Don't overwhelm aiohttp!
-    # 15 Requests *at most* at a time
+    # Starts at 15 Requests at a time, and the limiter adjusts it from there
     # https://pawelmhm.github.io/asyncio/python/aiohttp/2016/04/22/asyncio-aiohttp.html
-    sem = asyncio.Semaphore(15)
+    limiter = stage_limiter("all_years", 15)
 
     # Async call to get all make/model/year combos (3931 of these!)
     # Results: 
-    async with aiohttp.ClientSession() as session:
-        results = await async_fetch_all(session, all_models_list, sem)
-
-    # See note under all_specs for what Joblib does
-    if results:
-        logging.info("Got results back for all_years: %s", len(results))
-        logging.info("Starting joblib processes to process results...")
-        Parallel(n_jobs=num_cores, verbose=0, require='sharedmem')(delayed(processYearsUrls)(year) for year in results) 
+    async with crawl_session() as session:
+        results = await async_fetch_and_process(session, all_models_list, limiter, processYearsUrls, "all_years")
+    years_list = url_list("all_years", flatten(results))
+    metrics.stage("all_years").rows = len(years_list)
 
     # Log how many Make/Model/Years combos we find
-    logging.info("Joblib processing completed for all_years!")
-    logging.info("Found %s Make/Model/Year Combinations", len(all_years_list))
+    logging.info("Processing completed for all_years!")
+    logging.info("Found %s Make/Model/Year Combinations", len(years_list))
 
     # Write the years to a file with the same name for easy retrieval.
-    dump2file(all_years_file, all_years_list)
-    return all_years_list
+    dump2file(all_years_file, years_list)
+    return years_list
 
 # Separated out the processing of each URL so we can use Joblib for parallel processing
 def processYearsUrls(year):
-    soup = BeautifulSoup(year, 'html.parser')
-
-    for div in soup.find_all("a", {"class": "btn avail-now first-item"}):
-        all_years_list.append(website + div['href'])
-        # I think this gets the current model year, such as:
-        # <a class="btn avail-now 1" href="/overview/toyota_corolla_2019" title="2019 Toyota Corolla Review">2019</a>
-        # Which would be "2019"
-        #logging.debug("Current Model Year: %s", div['href'])
-        
-    for div in soup.find_all("a", {"class": "btn 1"}):
-        all_years_list.append(website + div['href'])
-        # Seems like this gets each additional Model Year, such as:
-        # <a class="btn  1" href="/overview/toyota_corolla_2018" title="2018 Toyota Corolla Review">2018</a>
-        # Which would be "2018"
-        #logging.debug("Additional Model Years: %s", div['href'])
+    # I think this gets the current model year first, such as:
+    # <a class="btn avail-now 1" href="/overview/toyota_corolla_2019" title="2019 Toyota Corolla Review">2019</a>
+    # Which would be "2019"
+    # Then each additional Model Year, such as:
+    # <a class="btn  1" href="/overview/toyota_corolla_2018" title="2018 Toyota Corolla Review">2018</a>
+    # Which would be "2018"
+    return [website + href for href in page_extractor().year_links(year)]
 
 # Specs for each Make + Model + Year
 # Appears to be around 3812 of these
 async def all_specs():
 
     # This call has ~3931 URLs, so we don't want to overwhelm aiohttp
-    # Will limit it to 10 connections at the same time, and make it wait til those respond.
+    # Will start at 10 connections at the same time, and make it wait til those respond.
     # https://pawelmhm.github.io/asyncio/python/aiohttp/2016/04/22/asyncio-aiohttp.html
-    sem = asyncio.Semaphore(10)
+    limiter = stage_limiter("all_specs", 10)
 
     # Async call to get all the specs for every make/model/year combo
-    async with aiohttp.ClientSession() as session:
+    async with crawl_session() as session:
         # This works, but may cause results to be empty. Need to investigate it more.
-        results = await async_fetch_all(session, all_years_list, sem)
+        results = await async_fetch_and_process(session, all_years_list, limiter, processSpecUrls, "all_specs")
 
         # TODO: Look more into this article
         # https://hackernoon.com/threaded-asynchronous-magic-and-how-to-wield-it-bba9ed602c32
@@ -261,61 +711,55 @@ async def all_specs():
         # https://stackoverflow.com/questions/34509586/how-to-know-which-coroutines-were-done-with-asyncio-wait
         # https://stackoverflow.com/questions/52245922/is-it-more-efficient-to-use-create-task-or-gather
         # ALL_COMPLETED == don't return until every single make_model_year is found
-        #http_task = asyncio.ensure_future(async_fetch_all(session, all_years_list, sem))
+        #http_task = asyncio.ensure_future(async_fetch_all(session, all_years_list, limiter))
 
     # Process all the spec URLs using Joblib across n-1 cores (7 for an i7 4790k)
     # Joblib is awesome: https://joblib.readthedocs.io/en/latest/parallel.html#
-    # Using shared memory so we can just append the results to the all_specs_list
-    # https://joblib.readthedocs.io/en/latest/parallel.html#shared-memory-semantics
-    if results:
-        logging.info("Got results back for all_specs: %s", len(results))
-        logging.info("Starting joblib processes to process results...")
-        Parallel(n_jobs=num_cores, verbose=0, require='sharedmem')(delayed(processSpecUrls)(spec) for spec in results)
+    # (That happens inside async_fetch_and_process now, unless we're streaming.) Used to run with shared memory
+    # so workers could append to all_specs_list, but that forced Joblib onto threads that take turns on the GIL.
+    # Now every worker process hands back its own list and we join them up here, in the same order as the pages.
+    specs_list = url_list("all_specs", flatten(results))
+    metrics.stage("all_specs").rows = len(specs_list)
 
     # Log how many of these combos we find & dump the results to a file
-    logging.info("Joblib processing completed for all_specs!")
-    logging.info("Found %s Make/Model/Year/Spec Combinations", len(all_specs_list))
-    dump2file(all_specs_file, all_specs_list)
+    logging.info("Processing completed for all_specs!")
+    logging.info("Found %s Make/Model/Year/Spec Combinations", len(specs_list))
+    dump2file(all_specs_file, specs_list)
     
-    return all_specs_list
+    return specs_list
 
 # Separated out the processing of each URL so we can use Joblib for parallel processing
 def processSpecUrls(spec):
-    soup = BeautifulSoup(spec, 'html.parser')
-
-    for id in soup.find_all("a", {"id": "ymm-nav-specs-btn"}):
-        all_specs_list.append(website + id['href'])
+    return [website + href for href in page_extractor().spec_links(spec)]
 
 # This must be all the trims for a given Make/Model/Year/Spec
 # Turns out there's ~32321 Make/Model/Year/Trim Combinations! Jeez.
 async def all_trims():
 
-    # Same as all_specs(), this has ~3800 URLs to hit so limit of 10 concurrent requests
+    # Same as all_specs(), this has ~3800 URLs to hit so start at 10 concurrent requests
     # to avoid overwhelming the server
-    sem = asyncio.Semaphore(10)
+    limiter = stage_limiter("all_trims", 10)
     
     # GATHER ALL THE TRIMS!1!1
-    async with aiohttp.ClientSession() as session:
-        results = await async_fetch_all(session, all_specs_list, sem)
+    async with crawl_session() as session:
+        results = await async_fetch_and_process(session, all_specs_list, limiter, processTrimUrls, "all_trims")
+    trims_list = url_list("all_trims", flatten(results))
+    metrics.stage("all_trims").rows = len(trims_list)
 
-    # See note under all_specs for what Joblib does
-    if results:
-        logging.info("Got results back for all_trims: %s", len(results))
-        Parallel(n_jobs=num_cores, verbose=0, require='sharedmem')(delayed(processTrimUrls)(trim) for trim in results)
-        
     # Log how many of these trim combos we find & dump to file
-    logging.info("Joblib processing completed for all_trims!")
-    logging.info("Found %s Make/Model/Year/Trim Combinations", len(all_trims_list))
-    dump2file(all_trims_file, all_trims_list)
-    return all_trims_list
+    logging.info("Processing completed for all_trims!")
+    logging.info("Found %s Make/Model/Year/Trim Combinations", len(trims_list))
+    dump2file(all_trims_file, trims_list)
+    return trims_list
 
 # Separated out for Joblib
 def processTrimUrls(trim):
+    extractor = page_extractor()
     if trim:
-        soup = BeautifulSoup(trim, 'html.parser')
-        
-        div = soup.find_all("div", {"class": "block-inner"})[-1]
-        div_a = div.find_all("a")
+        div_a = extractor.trim_links(trim)
+        if div_a is None:
+            logging.error("all_trims page didn't have a block-inner div, skipping it", extra={"event": "parse_error", "stage": "all_trims"})
+            return []
 
         #
         # Ran into an exception on the len(div_a) call. I think the original code this is based on
@@ -326,110 +770,542 @@ def processTrimUrls(trim):
         #
         # Since it's possible for this to happen anywhere if the pages aren't 100% the same setup,
         # we should wrap this in a try/except and log any weird errors we run into.
+        # This used to go through div_a[-i], which is the first link and then the rest backwards from the last
+        # one. Now it's just page order, and each link once in case the page has the same trim on it twice.
+        trims = []
         try:
-            for i in range(len(div_a)):
-                all_trims_list.append(website + div_a[-i]['href'])
+            for href in dict.fromkeys(div_a):
+                trims.append(website + href)
 
         except Exception as e:
-            logging.error('all_trims exception at for i in range(len(div_a)): %s %s', type(e), str(e))
-            return
+            logging.error('all_trims exception at for i in range(len(div_a)): %s %s', type(e), str(e),
+                          extra={"event": "parse_error", "stage": "all_trims"})
+        return trims
     else:
         # Actually, seems like one of the trims might just be coming back as null for some reason...
-        logging.error("found a null trim: %s", trim)
+        logging.error("found a null trim: %s", trim, extra={"event": "parse_error", "stage": "all_trims"})
+        return []
 
 # Collect all the data on the 32,000 cars we found
 async def specifications():
-    # 32,000 URLs to hit, so limit of 10 concurrent requests to avoid overwhelming the server
-    sem = asyncio.Semaphore(10)
+    # 32,000 URLs to hit, so start at 10 concurrent requests to avoid overwhelming the server
+    limiter = stage_limiter("specifications", 10)
     
     # GATHER ALL THE SPECS!1!1
-    async with aiohttp.ClientSession() as session:
-        results = await async_fetch_all(session, all_trims_list, sem)
-
-    # Log and dump to file
-    logging.info("Found all the specifications data! Found %s data rows to process.", len(results))
-    dump2file(all_data_file, results)
+    log_resume(all_trims_list, "specifications")
+    async with crawl_session() as session:
+        if streaming:
+            # Parse every page into its record as soon as it lands, so the raw HTML never piles up.
+            results = await async_stream_all(session, all_trims_list, limiter, processSpecifications, stage="specifications")
+            results = [record for record in results if record is not None]
+            metrics.stage("specifications").rows = len(results)
+            limiter.log_state()
+            logging.info("Processed all the specifications data! Found %s data rows.", len(results))
+            dump2file(final_data_file, results)
+            return results
+
+        results = await async_fetch_all(session, all_trims_list, limiter, "specifications")
+
+    limiter.log_state()
+
+    # Save every page into the page store (a no-op for the ones asyncfetch already checkpointed) rather than
+    # pickling one giant list of HTML, so we can read them back one at a time later
+    for url, page in zip(all_trims_list, results):
+        if page:
+            store.put(url, page)
+
+    logging.info("Found all the specifications data! Page store now has %s pages.", len(store))
     return results
 
 # Finally, process the results and save to a CSV for future use
 def processSpecifications(row):
 
-    soup = BeautifulSoup(row, 'html.parser')
-     
-    specifications_df = pd.DataFrame(columns=[soup.find_all("title")[0].text[:-15]])
-    msrp_text = soup.find_all("div", {"class": "price"})[0]
-    
-    if len(msrp_text.find_all("a")) >= 1:
-        specifications_df.loc["MSRP"] = msrp_text.find_all("a")[0].text
-        
-    for div in soup.find_all("div", {"class": "specs-set-item"}):
-        row_name = div.find_all("span")[0].text
-        row_value = div.find_all("span")[1].text
-        specifications_df.loc[row_name] = row_value
-        
-    # Only returning each DataFrame - we can concat these together after into a single DataFrame
-    return specifications_df
-
-logging.info("Starting scraping.py ...")
+    # MSRP comes first (if the page has one), then every specs-set-item. If a spec shows up twice the
+    # last one wins, same as the old specifications_df.loc[row_name] = row_value did
+    name, spec_rows = page_extractor().specifications(row)
+
+    # Only returning a lightweight (car name, {spec: value}) record - building a whole DataFrame per car
+    # (then concat'ing 32,000 of them) was most of the time spent after the fetching was done.
+    # build_specifications_table puts them all together in one go at the end.
+    return name, dict(spec_rows)
+
+# Builds the whole specifications table in a single pass from the processSpecifications records.
+# Same layout the old pd.concat(final_results, axis=1) gave us: one column per car, spec names as the rows
+# (in the order they first show up), so data_cleaning.py doesn't need to change.
+# https://pandas.pydata.org/pandas-docs/stable/reference/api/pandas.DataFrame.from_records.html
+def build_specifications_table(records):
+    records = [record for record in records if record is not None]
+    names = [name for name, _ in records]
+    table = pd.DataFrame.from_records([specs for _, specs in records], index=names)
+    return table.transpose()
+
+# Frontier crawl - the stages are all running at once. Each entry is the stage name, the function that parses
+# the pages fetched for that stage, and the file its results get cached in (same as the barrier version)
+frontier_stages = [
+    ("all_models", processModelsUrls, all_models_file),
+    ("all_years", processYearsUrls, all_years_file),
+    ("all_specs", processSpecUrls, all_specs_file),
+    ("all_trims", processTrimUrls, all_trims_file),
+    ("specifications", processSpecifications, final_data_file),
+]
+
+# Starts from the makes, and every URL found gets put straight onto the frontier for the stage after it.
+# Deeper stages get priority, so cars flow all the way through to their specs instead of the frontier
+# ballooning with thousands of half explored years.
+# Every result carries a key made of where it was found (make #3 -> model #7 -> year #2 ...), and sorting by
+# that at the end gives the exact same order the barrier version produced, no matter what finished first.
+# Returns the models, years, specs and trims lists, plus the specification records.
+async def frontier_crawl(makes):
+    loop = asyncio.get_running_loop()
+    executor = joblib.executor.get_memmapping_executor(num_cores)
+    limiter = stage_limiter("frontier", 15)
+    frontier = asyncio.PriorityQueue()
+    order = itertools.count()
+
+    last_level = len(frontier_stages) - 1
+    found = [[] for _ in frontier_stages]       # (key, result) for everything each stage turned up
+    queued = url_store.UrlStore()               # don't fetch the same URL twice for a stage
+    pages_done = [0 for _ in frontier_stages]
+
+    def enqueue(level, key, url):
+        if queued.list(level).append(url):
+            frontier.put_nowait((-level, next(order), level, key, url))
+
+    async def worker(session):
+        while True:
+            _, _, level, key, url = await frontier.get()
+            stage_name, process_function, _ = frontier_stages[level]
+            metrics.stage(stage_name).queue_depth(frontier.qsize())
+            try:
+                page = await asyncfetch(session, url, limiter, stage_name)
+                if page is None:
+                    continue
+
+                result, seconds = await loop.run_in_executor(executor, crawl_metrics.timed, process_function, page)
+                metrics.stage(stage_name).parsed(seconds)
+                pages_done[level] += 1
+                if level == last_level:
+                    if result is not None:
+                        found[level].append((key, result))
+                    continue
+
+                for i, next_url in enumerate(result or []):
+                    found[level].append((key + (i,), next_url))
+                    enqueue(level + 1, key + (i,), next_url)
+            except Exception as e:
+                logging.error("Frontier failed on %s: %s %s", url, type(e), str(e), extra={"event": "parse_error", "stage": stage_name, "url": url})
+            finally:
+                frontier.task_done()
+
+    for i, url in enumerate(makes):
+        enqueue(0, (i,), url)
+
+    log_resume(makes, "frontier")
+    async with crawl_session() as session:
+        workers = [asyncio.create_task(worker(session)) for _ in range(frontier_workers)]
+        await frontier.join()
+        for task in workers:
+            task.cancel()
+    limiter.log_state()
+
+    # Put everything back in barrier order, log and cache it all the same way the stages do
+    results = []
+    for level, (stage_name, _, file_name) in enumerate(frontier_stages):
+        stage_results = [result for _, result in sorted(found[level], key=lambda item: item[0])]
+        if level != last_level:
+            stage_results = url_list(stage_name, stage_results)
+        logging.info("Frontier %s: fetched %s pages, found %s results", stage_name, pages_done[level], len(stage_results))
+        metrics.stage(stage_name).rows = len(stage_results)
+        dump2file(file_name, stage_results)
+        results.append(stage_results)
+    return results
 
-# Optimized as much as I could out of this. Async http & cache results to files.
-# Order is:
-# 1. Gather all Makes (Ford/Chevy/etc)
-# 2. For each Make, gather all Models (Corolla, F150, etc)
-# 3. For every Make/Model, gather all Years (2010, 2011, etc)
-# 4. For every Make/Model/Year, gather all Specs
-# 5. For every Make/Model/Year/Spec, gather all Trims
-# 6. For everything found in #5 (32,000+ cars), scrap all the spec data
-# 7. Write the results out to a csv file - final results should end up in csv_files/the_big_data.csv
-all_makes_list = all_makes()
-logging.critical("Collected all Makes successfully")
+# Refetches every URL for a stage, skipping the cache
+async def refetch_all(urls, stage_name):
+    limiter = stage_limiter(stage_name, 10)
+    async with crawl_session() as session:
+        pages = await asyncio.gather(*[asyncfetch(session, url, limiter, stage_name, use_cache=False) for url in urls])
+    limiter.log_state()
+    return pages
+
+# Refresh crawl - goes back for the pages refresh_schedule says are due (up to refresh_budget of them) and only
+# parses the ones that came back different to the copy we had. Anything new those turn up (a new model year
+# on a model page, say) gets fetched straight away, all the way down to its specifications. The cached lists
+# get the new URLs added on the end, and the returned final_results has changed cars swapped in (matched up
+# by name) and new ones added. Pages that have gone from the site are left where they are.
+def refresh_crawl(final_results):
+    if progress_conn is None:
+        logging.error("Refreshing needs checkpoints = True, otherwise there's no fetch times or page hashes to go on")
+        return final_results
+
+    # The pages fetched for each stage, same as frontier_stages. The make list itself isn't refreshed.
+    stage_inputs = [all_makes_list, all_models_list, all_years_list, all_specs_list, all_trims_list]
+    urls_by_stage = [(stage_name, urls) for (stage_name, _, _), urls in zip(frontier_stages, stage_inputs)]
+    times = crawl_progress.fetch_times(progress_conn, [url for urls in stage_inputs for url in urls])
+    due = refresh_schedule.plan(urls_by_stage, times, refresh_budget)
+    for stage_name, urls in urls_by_stage:
+        logging.info("Refresh %s: %s of %s pages due %s", stage_name, len(due[stage_name]), len(urls),
+                     refresh_schedule.summary(urls, times))
+
+    final_results = list(final_results)
+    positions = {record[0]: i for i, record in enumerate(final_results)}
+    new_urls = []
+    last_level = len(frontier_stages) - 1
+
+    for level, (stage_name, process_function, file_name) in enumerate(frontier_stages):
+        urls = due[stage_name] + new_urls
+        new_urls = []
+        if not urls:
+            continue
+
+        old_refs = crawl_progress.body_refs(progress_conn, urls)
+        pages = run_crawl(refetch_all(urls, stage_name))
+        new_refs = crawl_progress.body_refs(progress_conn, urls)
+
+        # Same sha256 as last time means the same page, no point parsing it again
+        changed = [page for url, page in zip(urls, pages) if page is not None and new_refs.get(url) != old_refs.get(url)]
+        logging.info("Refresh %s: refetched %s pages, %s changed", stage_name, len(urls), len(changed))
+        if not changed:
+            continue
+
+        parsed = joblib.Parallel(n_jobs=num_cores, batch_size=parse_chunk_size)(joblib.delayed(crawl_metrics.timed)(process_function, page)
+                                                                         for page in changed)
+        for _, seconds in parsed:
+            metrics.stage(stage_name).parsed(seconds)
+        results = [result for result, _ in parsed]
+
+        if level == last_level:
+            updated, added = 0, 0
+            for record in results:
+                if record is None:
+                    continue
+                if record[0] in positions:
+                    final_results[positions[record[0]]] = record
+                    updated += 1
+                else:
+                    positions[record[0]] = len(final_results)
+                    final_results.append(record)
+                    added += 1
+            logging.info("Refresh %s: %s cars updated, %s new", stage_name, updated, added)
+            dump2file(file_name, final_results)
+        else:
+            found = stage_inputs[level + 1]
+            new_urls = found.extend(flatten(results))
+            if new_urls:
+                logging.info("Refresh %s: found %s new pages for %s", stage_name, len(new_urls), frontier_stages[level + 1][0])
+                dump2file(file_name, found)
+
+    write_metrics()
+    return final_results
+
+# One worker's share of the multi-worker crawl, see work_queue.py. Leases a batch of URLs (one make at a time),
+# fetches and parses them the same as frontier_crawl does, and hands each result back to the queue along with
+# the URLs it turned up, for whichever worker gets to them. Runs until there's nothing left queued or leased.
+async def queue_worker(queue_conn, worker):
+    loop = asyncio.get_running_loop()
+    executor = joblib.executor.get_memmapping_executor(worker_parse_processes)
+    limiter = stage_limiter("worker", 15)
+    last_level = len(frontier_stages) - 1
+    leased = collections.deque()
+    lease_lock = asyncio.Lock()
+    shard = None
+
+    # Next URL to work on, leasing another batch when we run out. None once the whole crawl's done.
+    async def next_item():
+        nonlocal shard
+        while True:
+            if leased:
+                return leased.popleft()
+            async with lease_lock:
+                if leased:
+                    continue
+                items = work_queue.lease(queue_conn, worker, worker_batch_size, lease_seconds, shard)
+                if items:
+                    shard = items[0].shard
+                    leased.extend(items)
+                    continue
+                if work_queue.finished(queue_conn) or work_queue.get_meta(queue_conn, "closed"):
+                    return None
+            # Nothing to hand out, but someone's still working and might turn up more
+            await asyncio.sleep(worker_poll_seconds)
+
+    async def crawl(session):
+        while True:
+            item = await next_item()
+            if item is None:
+                return
+            stage_name, process_function, _ = frontier_stages[item.level]
+            metrics.stage(stage_name).queue_depth(len(leased))
+            try:
+                page = await asyncfetch(session, item.url, limiter, stage_name)
+                if page is None:
+                    work_queue.fail(queue_conn, worker, item, "fetch failed")
+                    continue
+
+                result, seconds = await loop.run_in_executor(executor, crawl_metrics.timed, process_function, page)
+                metrics.stage(stage_name).parsed(seconds)
+                if item.level == last_level:
+                    work_queue.complete(queue_conn, worker, item, result)
+                    continue
+
+                urls = list(result or [])
+                children = [work_queue.Item(url, item.level + 1, item.key + (i,), item.shard) for i, url in enumerate(urls)]
+                work_queue.complete(queue_conn, worker, item, urls, children)
+            except Exception as e:
+                logging.error("Worker failed on %s: %s %s", item.url, type(e), str(e),
+                              extra={"event": "parse_error", "stage": stage_name, "url": item.url})
+                work_queue.fail(queue_conn, worker, item, e)
+
+    # Keep our leases alive while we're still going, a worker that dies stops renewing and its URLs go back
+    async def renew_leases():
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            work_queue.renew(queue_conn, worker, lease_seconds)
+
+    logging.info("Worker %s working on %s", worker, queue_file)
+    renewing = asyncio.create_task(renew_leases())
+    async with crawl_session() as session:
+        await asyncio.gather(*[asyncio.create_task(crawl(session)) for _ in range(frontier_workers)])
+    renewing.cancel()
+    limiter.log_state()
+
+# Coordinator side: puts the makes in the queue, starts local_workers worker processes and works through the
+# queue alongside them. Once it's empty the results get put back in barrier order and cached exactly like
+# frontier_crawl does, and the same lists come back.
+def coordinate_crawl(makes):
+    queue_conn = work_queue.open_queue(queue_file)
+    work_queue.seed(queue_conn, [work_queue.Item(url, 0, (i,), i) for i, url in enumerate(makes)])
+
+    logging.info("Starting %s workers on %s", local_workers, queue_file)
+    fresh = ["--fresh"] if fresh_since is not None else []
+    workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", "--queue", queue_file] + fresh)
+               for _ in range(local_workers)]
+    run_crawl(queue_worker(queue_conn, work_queue.worker_name()))
+    for process in workers:
+        process.wait()
+
+    for level, statuses in sorted(work_queue.counts(queue_conn).items()):
+        logging.info("Queue %s: %s", frontier_stages[level][0], statuses)
+
+    last_level = len(frontier_stages) - 1
+    results = []
+    for level, (stage_name, _, file_name) in enumerate(frontier_stages):
+        found = [result for _, result in work_queue.results(queue_conn, level)]
+        if level == last_level:
+            stage_results = [record for record in found if record is not None]
+        else:
+            stage_results = url_list(stage_name, flatten(found))
+        logging.info("Queue %s: found %s results", stage_name, len(stage_results))
+        metrics.stage(stage_name).rows = len(stage_results)
+        dump2file(file_name, stage_results)
+        results.append(stage_results)
+
+    work_queue.close(queue_conn)
+    queue_conn.close()
+    return results
 
-# Now caching the models list
-all_models_list = try2readfile("all_models_list", all_models_list, all_models_file, all_models)
-logging.info("Size of all_models_list: %s", len(all_models_list))
+# Only claims everything got collected if nothing was dead lettered on the way. Otherwise the cached lists are
+# missing those pages (and everything under them), and the next run won't crawl again unless it's told to replay.
+def log_crawl_outcome(crawl_name):
+    dead_letters = retry_policy.read_dead_letters()
+    if not dead_letters:
+        logging.critical("%s crawl collected everything successfully", crawl_name)
+        return
 
-# Now caching the years list
-all_years_list = try2readfile("all_years_list", all_years_list, all_years_file, all_years)
+    stages = collections.Counter(entry["stage"] for entry in dead_letters)
+    logging.error("%s crawl finished, but %s URLs failed for good and were dead lettered (%s). What's under them is "
+                  "missing, run with --replay-dead-letters to retry them", crawl_name, len(dead_letters),
+                  ", ".join("%s %s" % (count, stage) for stage, count in stages.items()))
+
+# The stages in crawl order, named the same as their metrics and url lists
+stage_names = ["all_makes", "all_models", "all_years", "all_specs", "all_trims", "specifications"]
+
+# "--workers 4" -> "4"
+def argument_value(argv, name, default):
+    if name in argv[:-1]:
+        return argv[argv.index(name) + 1]
+    return default
+
+# The stage by stage crawl, up to and including stage_name (all_makes to all_trims). Each stage's list gets read
+# back from its cached file, or crawled if that isn't there yet, and the last one is returned.
+def crawl_through(stage_name="all_trims"):
+    global all_makes_list, all_models_list, all_years_list, all_specs_list, all_trims_list
+    last = stage_names.index(stage_name)
+    setup()
+
+    if not all_makes_list:
+        all_makes_list = url_list("all_makes", all_makes())
+        logging.critical("Collected all Makes successfully")
+    if last == 0:
+        return all_makes_list
 
-# Now caching the specs list
-all_specs_list = try2readfile("all_specs_list", all_specs_list, all_specs_file, all_specs)
+    # Now caching the models list
+    all_models_list = url_list("all_models", try2readfile("all_models_list", all_models_list, all_models_file, all_models))
+    logging.info("Size of all_models_list: %s", len(all_models_list))
+    if last == 1:
+        return all_models_list
+
+    # Now caching the years list
+    all_years_list = url_list("all_years", try2readfile("all_years_list", all_years_list, all_years_file, all_years))
+    if last == 2:
+        return all_years_list
+
+    # Now caching the specs list
+    all_specs_list = url_list("all_specs", try2readfile("all_specs_list", all_specs_list, all_specs_file, all_specs))
+    if last == 3:
+        return all_specs_list
+
+    # Now caching the trims list
+    all_trims_list = url_list("all_trims", try2readfile("all_trims_list", all_trims_list, all_trims_file, all_trims))
+    return all_trims_list
 
-# Now caching the trims list
-all_trims_list = try2readfile("all_trims_list", all_trims_list, all_trims_file, all_trims)
+# The processed specification records for every trim in all_trims_list - read back from the cache when
+# streaming, otherwise whatever the page store is missing gets fetched and then every page parsed
+def load_specifications():
+    setup()
+    if streaming:
+        # Streaming parses while it fetches, so we get (and cache) the processed records straight away
+        return try2readfile("final_results", [], final_data_file, specifications)
+
+    # The raw pages live in the page store now, so only go scraping if some of the trims aren't in there yet
+    missing_trims = [url for url in all_trims_list if url not in store]
+    if missing_trims:
+        logging.info("Page store is missing %s of %s trims, running scraper", len(missing_trims), len(all_trims_list))
+        run_crawl(specifications())
+    logging.critical("Collected all specifications pages successfully")
+    return parse_specifications()
+
+# Parses every trim page (all_trims_list unless given some) already in the page store into its record, with no
+# fetching, and caches them in final_data_file. Handy after changing processSpecifications.
+def parse_specifications(trims=None):
+    setup()
+    trims = all_trims_list if trims is None else trims
+
+    # Process the specification data in parallel using Joblib
+    # Pages are read out of the store lazily as Joblib asks for them, instead of unpickling all of them up front
+    # https://stackoverflow.com/a/50926231
+    stored_trims = [url for url in trims if url in store]
+    logging.info("Starting joblib processing of the page store. Processing %s pages", len(stored_trims))
+    parsed = joblib.Parallel(n_jobs=num_cores, batch_size=parse_chunk_size)(joblib.delayed(crawl_metrics.timed)(processSpecifications, row)
+                                                                            for row in store.iter_pages(stored_trims))
+    for _, seconds in parsed:
+        metrics.stage("specifications").parsed(seconds)
+    final_results = [record for record, _ in parsed]
+    metrics.stage("specifications").rows = len(final_results)
+
+    # Save The results to a txt file for future use
+    if final_results:
+       dump2file(final_data_file, final_results)
+    return final_results
+
+# Write the trims out to a CSV file in csv_files
+def write_trims_csv():
+    pd.DataFrame(list(all_trims_list)).to_csv(trimsCsvFile, index=False, header=None)
+
+# Writes the specification records out to csv_files/the_big_data.parquet, and the wide CSV if write_wide_csv
+def export(final_results):
+    # One typed row per trim, so later steps can read just the columns they need
+    spec_table.write_trim_table(spec_table.build_trim_table(final_results), dataParquetFile)
+
+    if write_wide_csv:
+        # Build the table from all the records in one go
+        specifications_table = build_specifications_table(final_results)
+
+        # See what is in specs table
+        logging.info("Type of specs table: %s", type(specifications_table))
+
+        # Try to save specifications_table to CSV file
+        try:
+            specifications_table.to_csv(dataCsvFile)
+        except Exception as e:
+            logging.info("Failed to save specifications_table to CSV file :( Exception was: %s", e)
+
+# The whole crawl, start to finish. argv is the command line flags (sys.argv[1:] by default):
+#   --refresh, --replay-dead-letters, --fresh, --coordinator [--workers N] [--queue path], --worker [--queue path]
+def main(argv=None):
+    global coordinator_mode, worker_mode, queue_file, local_workers, fresh_since
+    global all_makes_list, all_models_list, all_years_list, all_specs_list, all_trims_list
+    argv = sys.argv[1:] if argv is None else argv
+    coordinator_mode = "--coordinator" in argv
+    worker_mode = "--worker" in argv
+    queue_file = argument_value(argv, "--queue", queue_file)
+    local_workers = int(argument_value(argv, "--workers", local_workers))
+    fresh_since = time.time() if "--fresh" in argv else None
+
+    setup("log_scraping_worker_%s.log" % os.getpid() if worker_mode else "log_scraping.log")
+    logging.info("Starting scraping.py ...")
+
+    # Optimized as much as I could out of this. Async http & cache results to files.
+    # Order is:
+    # 1. Gather all Makes (Ford/Chevy/etc)
+    # 2. For each Make, gather all Models (Corolla, F150, etc)
+    # 3. For every Make/Model, gather all Years (2010, 2011, etc)
+    # 4. For every Make/Model/Year, gather all Specs
+    # 5. For every Make/Model/Year/Spec, gather all Trims
+    # 6. For everything found in #5 (32,000+ cars), scrap all the spec data
+    # 7. Write the results out to a csv file - final results should end up in csv_files/the_big_data.csv
+    # Workers don't need anything but the queue, they're done once it's empty
+    if worker_mode:
+        queue_conn = work_queue.open_queue(queue_file)
+        run_crawl(queue_worker(queue_conn, work_queue.worker_name()))
+        run_crawl(close_crawl_session())
+        write_metrics()
+        logging.info("Worker finished")
+        return
 
-# Write this all out to a CSV file in csv_files
-pd.DataFrame(all_trims_list).to_csv(trimsCsvFile, index=False, header=None)
+    crawl_through("all_makes")
+
+    # Go back and retry whatever failed for good last time
+    if "--replay-dead-letters" in argv:
+        replay_dead_letters()
+
+    final_results = None
+    if coordinator_mode and not all(os.path.exists(file_name) for _, _, file_name in frontier_stages):
+        # Every stage at once, spread across worker processes, see coordinate_crawl
+        logging.info("Running the multi-worker crawl...")
+        all_models_list, all_years_list, all_specs_list, all_trims_list, final_results = coordinate_crawl(all_makes_list)
+        log_crawl_outcome("Multi-worker")
+        write_metrics()
+    elif frontier_mode and not all(os.path.exists(file_name) for _, _, file_name in frontier_stages):
+        # Every stage at once, see frontier_crawl
+        logging.info("Running the frontier crawl...")
+        all_models_list, all_years_list, all_specs_list, all_trims_list, final_results = run_crawl(frontier_crawl(all_makes_list))
+        log_crawl_outcome("Frontier")
+        write_metrics()
+    else:
+        crawl_through("all_trims")
 
-logging.info("Scrapping Make/Model/Year/Spec/Trim **DONE**")
+    write_trims_csv()
 
-# With all 32,000 vehicles, we can finally pull in all their specs. Woo hoo!
-# Also now caching the results too for future processing :)
-logging.info("Specifications Scrapin' time!1!")
-all_data_list = try2readfile("all_data_list", all_data_list, all_data_file, specifications)
+    logging.info("Scrapping Make/Model/Year/Spec/Trim **DONE**")
 
-# Process the specification data in parallel using Joblib
-# https://stackoverflow.com/a/50926231
-logging.info("Starting joblib processing of all_data_list. All_data_list contains %s entries", len(all_data_list))
-specifications_table = pd.DataFrame()
-final_results = Parallel(n_jobs=num_cores)(delayed(processSpecifications)(row) for row in all_data_list)
+    # With all 32,000 vehicles, we can finally pull in all their specs. Woo hoo!
+    # Also now caching the results too for future processing :)
+    logging.info("Specifications Scrapin' time!1!")
+    if final_results is not None:
+        # The frontier (or multi-worker) crawl already scraped and processed them along with everything else
+        logging.info("Frontier crawl already processed %s specifications", len(final_results))
+    else:
+        final_results = load_specifications()
 
-# Save The results to a txt file for future use
-if final_results:
-   dump2file("txt_files/final_data.txt", final_results)
+    # Go back for whatever has probably changed since we got it
+    if "--refresh" in argv:
+        logging.info("Refreshing...")
+        final_results = refresh_crawl(final_results)
+        write_trims_csv()
 
-# Concat all the data frames together
-# https://stackoverflow.com/a/39316680
-specifications_table = pd.concat(final_results, axis=1, sort=False)
+    # That's all the web requests done, hang up the shared session (and commit the last of the checkpoints)
+    run_crawl(close_crawl_session())
 
-# See what is in specs table
-logging.info("Type of specs table: %s", type(specifications_table))
+    # Where did the time go? Network (fetch latency, retries) or CPU (parse time)
+    for line in metrics.summary_lines():
+        logging.info("Metrics %s", line)
+    write_metrics()
 
-# Try to save specifications_table to CSV file
-try:
-    specifications_table.to_csv(dataCsvFile)
-except Exception as e:
-    logging.info("Failed to save specifications_table to CSV file :( Exception was: %s", e)
+    export(final_results)
 
-# >>>DONE<<<
-logging.info("Finished getting data!")
+    # >>>DONE<<<
+    logging.info("Finished getting data!")
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+import logging
+import sys
+
+import pandas as pd
+
+# the_big_data.csv has one column per car (32,000+ of them) and a row per spec, with every value a string,
+# so anything downstream has to read the whole thing and transpose it before it can even look at one spec.
+# This writes the same data the right way round - one row per trim, one column per spec - to Parquet, with
+# numbers stored as numbers and repetitive text (Drivetrain, Body Style, ...) as categoricals. Parquet stores
+# each column separately, so read_trim_table(columns=[...]) only reads the specs it's asked for.
+# https://pandas.pydata.org/docs/user_guide/io.html#parquet
+#
+# Needs pyarrow (or fastparquet) installed: pip install pyarrow
+#
+# Already have a the_big_data.csv from an older run? Convert it with:
+#   python spec_table.py csv_files/the_big_data.csv csv_files/the_big_data.parquet
+
+# What the site puts in a spec it doesn't have a value for. Only treated as missing when the rest of the
+# column is numbers - in text columns "-" means "no" (Air Bag, Fog Lamps, ...) so they're left alone there.
+missing_values = ["", "NA", "N/A", "-", "- TBD -", "- TBD –"]
+
+# Text columns with fewer distinct values than this fraction of the rows get stored as categoricals
+category_ratio = 0.5
+
+name_column = "Name"
+
+# Turns one column of raw spec strings into the best fitting type: nullable integers, floats, a categorical,
+# or plain strings. Numbers can have a leading $ and thousands commas ("$27,500"), anything else that isn't
+# a number means the column stays text, so nothing gets thrown away.
+def typed_column(values):
+    text = values.astype("string").str.strip()
+    present = text.notna() & ~text.isin(missing_values)
+
+    if present.any():
+        numbers = pd.to_numeric(text.where(present).str.replace(r"^\$|,", "", regex=True), errors="coerce")
+        if numbers[present].notna().all():
+            if (numbers.dropna() % 1 == 0).all():
+                return numbers.astype("Int64")
+            return numbers.astype("float64")
+
+    if text.nunique() < category_ratio * len(text):
+        return values.astype("category")
+    return values.astype("string")
+
+def typed_table(table):
+    return pd.DataFrame({column: typed_column(table[column]) for column in table.columns})
+
+# One row per trim from processSpecifications' (car name, {spec: value}) records, columns in the order the
+# specs first show up (same as the rows of the wide CSV)
+def build_trim_table(records):
+    records = [record for record in records if record is not None]
+    table = pd.DataFrame.from_records([specs for _, specs in records])
+    table.insert(0, name_column, [name for name, _ in records])
+    return typed_table(table)
+
+# The old wide CSV (specs as rows, a column per car) turned into the same row per trim table
+def trim_table_from_wide_csv(file_name):
+    wide = pd.read_csv(file_name, index_col=0, dtype=str, keep_default_na=False)
+    table = wide.transpose().reset_index(names=name_column)
+    table.columns.name = None
+    return typed_table(table.replace({"": None}))
+
+# Returns False (and logs why) if there's no Parquet engine installed, rather than killing the whole run
+def write_trim_table(table, file_name):
+    try:
+        table.to_parquet(file_name, index=False)
+    except ImportError as e:
+        logging.warning("Couldn't write %s, pip install pyarrow to get Parquet output (%s)", file_name, e)
+        return False
+    logging.info("Wrote %s trims x %s specs to %s", len(table), len(table.columns) - 1, file_name)
+    return True
+
+# columns=None reads everything, otherwise just the named specs (plus the car name)
+def read_trim_table(file_name, columns=None):
+    if columns is not None and name_column not in columns:
+        columns = [name_column] + list(columns)
+    return pd.read_parquet(file_name, columns=columns)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python spec_table.py <wide csv in> <parquet out>")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s: %(message)s')
+    if not write_trim_table(trim_table_from_wide_csv(sys.argv[1]), sys.argv[2]):
+        sys.exit(1)
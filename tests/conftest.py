@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(here)
+sys.path[:0] = [root, os.path.join(root, "python")]
+
+import mock_site
+
+# scraping.py with everything it writes (page store, checkpoints, dead letters...) going to a scratch folder.
+# setup() only runs once per process, so the whole test session shares one.
+@pytest.fixture(scope="session")
+def scraping(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("crawl")
+    os.makedirs(directory / "txt_files")
+    old_directory = os.getcwd()
+    os.chdir(directory)
+
+    import scraping
+    scraping.setup(log_file=None)
+    yield scraping
+    scraping.run_crawl(scraping.close_crawl_session())
+    os.chdir(old_directory)
+
+# serve_site(mock_site.MockSite(...)) starts it on a free port on the crawl's event loop, returns its base URL.
+# Every site gets a new port, so its URLs never come back out of an earlier test's checkpoints.
+@pytest.fixture
+def serve_site(scraping):
+    runners = []
+
+    def serve(site):
+        runner = scraping.run_crawl(mock_site.start(site, port=0))
+        runners.append(runner)
+        return "http://127.0.0.1:%s" % runner.addresses[0][1]
+
+    yield serve
+    for runner in runners:
+        scraping.run_crawl(runner.cleanup())
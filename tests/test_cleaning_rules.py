@@ -0,0 +1,213 @@
+import random
+
+import numpy as np
+import pandas as pd
+
+import cleaning_rules
+import mock_site
+
+# The chained .str.replace version of data_cleaning.py that cleaning_rules.py replaced, step for step. It was
+# written for pandas < 2, where str.replace treated patterns as regexes except single characters, so that's
+# spelled out here.
+def replace(values, pattern, repl):
+    return values.str.replace(pattern, repl, regex=len(pattern) > 1)
+
+def baseline_clean(raw_data):
+    raw_data = raw_data.replace("- TBD –", 'NA')
+    raw_data = raw_data.replace("- TBD -", 'NA')
+    raw_data['EPA Fuel Economy Est - City (MPG)'] = replace(raw_data['EPA Fuel Economy Est - City (MPG)'], r"\(.*\)", "")
+    raw_data = raw_data.replace("NA", np.nan)
+
+    raw_data = raw_data.rename(columns=lambda x: x.split(" (ft")[0])
+    raw_data['Passenger Volume'] = replace(raw_data['Passenger Volume'], r"\(.*\)", "")
+
+    raw_data.MSRP = replace(raw_data.MSRP, "$", "")
+    raw_data.MSRP = replace(raw_data.MSRP, ",", "")
+
+    raw_data['Basic Miles/km'] = replace(raw_data['Basic Miles/km'], ",", "")
+    raw_data['Basic Miles/km'] = replace(raw_data['Basic Miles/km'], "Unlimited", "150000")
+    raw_data['Basic Miles/km'] = replace(raw_data['Basic Miles/km'], "49999", "50000")
+    raw_data['Drivetrain Miles/km'] = replace(raw_data['Drivetrain Miles/km'], ",", "")
+    raw_data['Drivetrain Miles/km'] = replace(raw_data['Drivetrain Miles/km'], "Unlimited", "150000")
+    raw_data['Roadside Assistance Miles/km'] = replace(raw_data['Roadside Assistance Miles/km'], ",", "")
+    raw_data['Roadside Assistance Miles/km'] = replace(raw_data['Roadside Assistance Miles/km'], "Unlimited", "100000")
+
+    raw_data['Transmission'] = raw_data['Transmission'].str.lower()
+    raw_data['Gears'] = raw_data['Transmission'].str.split("-speed", expand=True, n=1)[0].str[-2:].str.strip()
+    raw_data.Gears = replace(raw_data['Gears'], "le", "1")
+    for ending in ["ed", "ic", "es", "er", "ls", "ve", "to", "de", "ch", "ct", "rs", "ft", "al", "s,"]:
+        raw_data.Gears = replace(raw_data['Gears'], ending, "NA")
+
+    raw_data['Net Horsepower'] = raw_data['SAE Net Horsepower @ RPM'].str.split("@", expand=True)[0]
+    try:
+        raw_data['Net Horsepower'] = replace(raw_data['Net Horsepower'], r'[^\d.]+', '')
+        raw_data['Net Horsepower'] = raw_data['Net Horsepower'].astype(float)
+    except Exception:
+        pass
+    raw_data.replace("NA", np.nan, inplace=True)
+
+    raw_data['Net Horsepower RPM'] = raw_data['SAE Net Horsepower @ RPM'].str.split("@", expand=True)[1].str.strip()
+    raw_data['Net Horsepower RPM'] = replace(raw_data['Net Horsepower RPM'], "- TBD -", "NA")
+
+    raw_data['Net Torque'] = raw_data['SAE Net Torque @ RPM'].str.split("@", expand=True)[0]
+    raw_data.replace("NA", np.nan, inplace=True)
+    try:
+        raw_data['Net Torque'] = replace(raw_data['Net Torque'], r'[^\d.]+', '')
+        raw_data['Net Torque'] = raw_data['Net Torque'].astype(float)
+    except Exception:
+        pass
+
+    raw_data['Net Torque RPM'] = raw_data['SAE Net Torque @ RPM'].str.split().str.get(-1).str[-4:].str.strip()
+    raw_data['Net Torque RPM'] = replace(replace(raw_data['Net Torque RPM'], "- TBD -", "NA"), '-', 'NA')
+    raw_data.replace("NA", np.nan, inplace=True)
+    try:
+        raw_data['Net Torque RPM'] = replace(raw_data['Net Torque RPM'], r'[^\d.]+', '')
+        raw_data.replace("", np.nan, inplace=True)
+        raw_data['Net Torque RPM'] = raw_data['Net Torque RPM'].astype(float)
+    except Exception:
+        pass
+    raw_data['Net Torque RPM'] = raw_data['Net Torque RPM'].clip(lower=1000)
+
+    raw_data['Cylinders'] = raw_data['Engine Type'].str.split("-", expand=True)[1]
+    raw_data['Cylinders'] = replace(raw_data['Cylinders'], "Cyl", "4")
+    raw_data['Cylinders'] = replace(raw_data['Cylinders'], "in Electric I4", "4")
+
+    raw_data['Engine Configuration'] = raw_data['Engine Type'].str.split(" ").str.get(-1).str[0]
+    for letter in ["4", "T", "D", "G"]:
+        raw_data['Engine Configuration'] = replace(raw_data['Engine Configuration'], letter, "NA")
+
+    raw_data["Engine Class"] = raw_data["Engine Type"].str.split(' ').str.get(0)
+    raw_data["Engine Class"] = raw_data["Engine Class"].replace('Turbo', 'Turbocharged')
+    raw_data["Engine Class"] = raw_data["Engine Class"].replace('Electric/Gas', 'Electric')
+    raw_data["Engine Class"] = raw_data["Engine Class"].replace('Turbo/Supercharger', 'Supercharger')
+    raw_data["Engine Class"] = raw_data["Engine Class"].replace('Supercharged', 'Supercharger')
+
+    raw_data['Displacement (L)'] = raw_data['Displacement'].str.split("/", expand=True)[0].str[:3]
+    raw_data['Displacement (L)'] = replace(raw_data['Displacement (L)'], '39.', '3.9')
+    raw_data['Displacement (cc)'] = raw_data['Displacement'].str.split("/", expand=True)[1]
+    raw_data['Displacement (cc)'] = replace(raw_data['Displacement (cc)'], '- TBD -', 'NA')
+    raw_data['Displacement (cc)'] = replace(raw_data['Displacement (cc)'], '- TBD –', 'NA')
+
+    for side in ["Rear", "Front"]:
+        raw_data[side + " Tire Width"] = raw_data[side + " Tire Size"].str.split("/").str.get(0).str[-3:].str.strip()
+        raw_data[side + " Tire Width"] = raw_data[side + " Tire Width"].replace('R20', 'NA')
+        raw_data.replace("NA", np.nan, inplace=True)
+        try:
+            raw_data[side + " Tire Width"] = replace(raw_data[side + " Tire Width"], r'[^\d.]+', '')
+            raw_data[side + " Tire Width"] = raw_data[side + " Tire Width"].astype(float)
+        except Exception:
+            pass
+
+    for side in ["Rear", "Front"]:
+        raw_data[side + " Wheel Size (in)"] = replace(raw_data[side + " Wheel Size (in)"], r'[^\d.]+', '')
+        raw_data[side + " Wheel Size"] = raw_data[side + " Wheel Size (in)"].str[:2].astype(float)
+
+    raw_data["Tire Rating"] = raw_data["Front Tire Size"].str.split("/").str.get(-1).str[-4]
+    for digit in ['5', '0', '1', '2']:
+        raw_data["Tire Rating"] = raw_data["Tire Rating"].replace(digit, 'NA')
+
+    raw_data["Tire Width Ratio"] = raw_data["Rear Tire Width"] / raw_data["Front Tire Width"]
+    raw_data["Wheel Size Ratio"] = raw_data["Rear Wheel Size"] / raw_data["Front Wheel Size"]
+
+    raw_data["Tire Ratio"] = raw_data["Front Tire Size"].str.split("/").str.get(1).str[0]
+    raw_data["Tire Ratio"] = raw_data["Tire Ratio"].replace('Y', 'NA')
+
+    raw_data["Year"] = raw_data.index.str[:4].astype(float)
+
+    raw_data['Drivetrain'] = replace(raw_data['Drivetrain'], '4-Wheel Drive', 'Four Wheel Drive')
+    raw_data['Drivetrain'] = replace(raw_data['Drivetrain'], 'Front wheel drive', 'Front Wheel Drive')
+    raw_data['Drivetrain'] = replace(raw_data['Drivetrain'], 'Four-Wheel Drive', 'Four Wheel Drive')
+
+    raw_data['Fuel System'] = replace(raw_data['Fuel System'], 'Turbocharged EFI', 'Electronic Fuel Injection')
+    raw_data['Fuel System'] = replace(raw_data['Fuel System'], 'Electric', 'Electronic Fuel Injection')
+    raw_data['Fuel System'] = replace(raw_data['Fuel System'], 'Sequential MPI (injection)', 'Sequential MPI')
+    raw_data['Fuel System'] = replace(raw_data['Fuel System'], 'SMPI', 'Sequential MPI')
+    raw_data['Fuel System'] = replace(raw_data['Fuel System'], 'EFI', 'Electronic Fuel Injection')
+    raw_data['Fuel System'] = replace(raw_data['Fuel System'], 'Direct Gasoline Injection', 'Direct Injection')
+
+    raw_data.replace("NA", np.nan, inplace=True)
+
+    raw_data.MSRP = raw_data.MSRP.astype(float)
+    raw_data["Tire Ratio"] = raw_data["Tire Ratio"].astype(float)
+    for column in ['Displacement (cc)', 'Displacement (L)', 'Cylinders', 'Net Horsepower RPM', 'Gears']:
+        try:
+            raw_data[column] = replace(raw_data[column], r'[^\d.]+', '')
+            raw_data[column] = raw_data[column].astype(float)
+        except Exception:
+            pass
+    for column in ['Roadside Assistance Miles/km', 'Drivetrain Miles/km', 'Basic Miles/km']:
+        raw_data[column] = raw_data[column].astype(float)
+
+    for column in cleaning_rules.specs_to_numeric:
+        raw_data[column] = pd.to_numeric(raw_data[column], errors='coerce')
+
+    raw_data.drop(cleaning_rules.specs_to_delete, axis=1, inplace=True)
+    raw_data.drop(raw_data.columns[raw_data.isna().sum() >= 0.5 * len(raw_data)].tolist(), axis=1, inplace=True)
+    return raw_data
+
+# Made up cars from mock_site.py, in the same shape data_cleaning.py reads the wide CSV: one row per car,
+# every value a string
+def mock_cars(count, seed=0):
+    rng = random.Random(seed)
+    cars = {}
+    for i in range(count):
+        specs = mock_site.spec_values(rng)
+        specs["MSRP"] = specs.pop("MSRP price")
+        cars["%s Make-%s Model Trim-%s" % (rng.choice([2015, 2017, 2019]), i % 7, i)] = specs
+    return cars
+
+# The awkward values real pages have, on top of an otherwise normal car
+edge_cases = {
+    "dashes": {"SAE Net Torque @ RPM": "260 @ -", "Trans Description Cont.": "-", "Disc - Rear (Yes or   )": "-",
+               "Night Vision": "-", "Spare Wheel Material": "-", "SAE Net Horsepower @ RPM": "300 @ - TBD -"},
+    "empty strings": {"Drivetrain": "", "Front Wheel Size (in)": "", "Rear Wheel Size (in)": "", "Passenger Doors": "",
+                      "Body Style": "", "Fuel System": "", "Wheelbase (in)": ""},
+    "commas and units": {"MSRP": "$1,234,567", "Basic Miles/km": "100,000", "Base Curb Weight (lbs)": "3,500 lbs",
+                         "Displacement": "2.0 L/1,998", "Passenger Volume": "101.5 (2,874 cu ft)",
+                         "Fuel Tank Capacity, Approx (gal)": "14.5 gal", "SAE Net Torque @ RPM": "1,000 @ 1750-4,500",
+                         "Front Wheel Size (in)": "19 x 8.5\"", "Rear Wheel Size (in)": "20 x 9.5\""},
+    "placeholders": {"Displacement": "- TBD –", "SAE Net Horsepower @ RPM": "NA", "EPA Fuel Economy Est - City (MPG)": "- TBD -",
+                     "Transmission": "Automatic", "Engine Type": "Electric", "Front Tire Size": "NA"},
+    "odd formats": {"Transmission": "Continuously Variable Ratio", "Engine Type": "Turbo Gas I-Cyl",
+                    "Fuel System": "Sequential MPI injection", "Drivetrain": "Four-Wheel Drive",
+                    "Rear Tire Size": "P255/40YR20", "Front Tire Size": "245/35ZR20",
+                    "EPA Fuel Economy Est - City (MPG)": "18 (est)"},
+}
+
+def fixture_frame():
+    cars = mock_cars(200)
+    for i, (case, changes) in enumerate(edge_cases.items()):
+        specs = dict(mock_cars(1, seed=100 + i).popitem()[1])
+        specs.update(changes)
+        cars["2018 Edge Case %s" % case] = specs
+    return pd.DataFrame.from_dict(cars, orient="index").astype(object)
+
+# Same columns in the same order, same values, numbers as the same numeric types. Text gets compared as plain
+# values since pandas 3 infers a str dtype for the old script's columns.
+def assert_same_output(expected, cleaned):
+    assert list(cleaned.columns) == list(expected.columns)
+    assert list(cleaned.index) == list(expected.index)
+    for column in expected.columns:
+        if pd.api.types.is_numeric_dtype(expected[column]):
+            pd.testing.assert_series_equal(cleaned[column], expected[column], check_names=False)
+        else:
+            normalise = lambda values: [None if pd.isna(value) else value for value in values]
+            assert normalise(cleaned[column]) == normalise(expected[column]), column
+
+def test_rules_match_the_old_replace_chain():
+    raw = fixture_frame()
+    cleaned, report = cleaning_rules.clean(raw)
+    assert_same_output(baseline_clean(raw.copy()), cleaned)
+    assert set(report.columns) == {"rule", "seconds", "values", "failed"}
+
+def test_edge_cases_come_out_cleaned():
+    cleaned, _ = cleaning_rules.clean(fixture_frame(), keep_sparse_columns=True)
+    commas = cleaned.loc["2018 Edge Case commas and units"]
+    assert (commas["MSRP"], commas["Basic Miles/km"], commas["Displacement (cc)"]) == (1234567.0, 100000.0, 1998.0)
+    assert (commas["Front Wheel Size"], commas["Passenger Volume"]) == (19.0, 101.5)
+    assert np.isnan(commas["Base Curb Weight (lbs)"])
+
+    empty = cleaned.loc["2018 Edge Case empty strings"]
+    assert empty[["Drivetrain", "Front Wheel Size", "Passenger Doors", "Body Style"]].isna().all()
+    assert np.isnan(cleaned.loc["2018 Edge Case dashes", "Net Torque RPM"])
+    assert cleaned.loc["2018 Edge Case placeholders", ["Displacement (L)", "Net Horsepower", "Gears"]].isna().all()
@@ -0,0 +1,47 @@
+import json
+import logging
+import threading
+
+import crawl_logging
+
+# The file handler is held up while the queue overflows, and only let go after stop() has started - so the
+# warning about the dropped records can't go through the queue, it would be dropped too
+def test_dropped_records_are_reported_after_a_full_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(crawl_logging, "log_queue_size", 5)
+    log_file = tmp_path / "log.jsonl"
+    crawl_logging.setup(str(log_file), console_level=logging.CRITICAL)
+    file_handler = crawl_logging.listener.handlers[0]
+
+    held, let_go = threading.Event(), threading.Event()
+
+    def hold_handler():
+        with file_handler.lock:
+            held.set()
+            let_go.wait()
+
+    threading.Thread(target=hold_handler).start()
+    held.wait()
+    for i in range(50):
+        logging.debug("record %s", i)
+    dropped = crawl_logging.queue_handler.dropped
+    threading.Timer(0.2, let_go.set).start()
+    crawl_logging.stop()
+
+    lines = [json.loads(line) for line in log_file.read_text(encoding="utf-8").splitlines()]
+    assert dropped > 0
+    assert len(lines) == 50 - dropped + 1
+    assert lines[-1]["level"] == "WARNING" and lines[-1]["message"] == "Log queue was full, dropped %s records" % dropped
+
+def test_sampling_caps_each_event_and_counts_what_it_skipped():
+    sample_filter = crawl_logging.SampleFilter({"fetch": (1.0, 2)}, seed=0)
+
+    def record(event, created):
+        record = logging.makeLogRecord({"msg": "x", "event": event, "stage": "all_trims"})
+        record.created = created
+        return record
+
+    kept = [sample_filter.filter(record("fetch", 100.0)) for _ in range(5)]
+    assert kept == [True, True, False, False, False]
+    later = record("fetch", 101.0)
+    assert sample_filter.filter(later) and later.suppressed == 3
+    assert all(sample_filter.filter(record("other", 100.0)) for _ in range(5))
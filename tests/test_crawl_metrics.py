@@ -0,0 +1,14 @@
+import crawl_metrics
+
+def test_prometheus_in_flight_gauges():
+    metrics = crawl_metrics.CrawlMetrics()
+    stage = metrics.stage("all_years")
+    for _ in range(3):
+        stage.request_started()
+    stage.request_finished(0.2, 200, 1000)
+
+    lines = crawl_metrics.prometheus_text(metrics).splitlines()
+    assert "# TYPE crawl_in_flight gauge" in lines
+    assert 'crawl_in_flight{stage="all_years"} 2' in lines
+    assert 'crawl_in_flight_peak{stage="all_years"} 3' in lines
+    assert 'crawl_requests_total{stage="all_years",status="200"} 1' in lines
@@ -0,0 +1,65 @@
+import asyncio
+import threading
+
+import crawl_progress
+import page_store
+
+# Passes everything through to the real connection, counting the commits
+class CountingConn:
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.commits = 0
+
+    def execute(self, *args):
+        return self.conn.execute(*args)
+
+    def commit(self):
+        self.commits += 1
+        self.conn.commit()
+
+def test_checkpoint_writer_batches_commits_off_the_loop(tmp_path, monkeypatch):
+    conn = CountingConn(crawl_progress.open_progress(str(tmp_path / "progress.db")))
+    store = page_store.PageStore(str(tmp_path / "page_store"))
+    writer = crawl_progress.CheckpointWriter(conn, store, max_batch=50)
+
+    # The writer holds off until every page is queued up, like it would if the crawl was outrunning it
+    threads = set()
+    queued = threading.Event()
+    mark_done = crawl_progress.mark_done
+    def recording_mark_done(*args, **kwargs):
+        queued.wait(10)
+        threads.add(threading.current_thread().name)
+        return mark_done(*args, **kwargs)
+    monkeypatch.setattr(crawl_progress, "mark_done", recording_mark_done)
+
+    urls = ["http://127.0.0.1/specifications/page-%s" % i for i in range(200)]
+    async def checkpoint_all():
+        tasks = [asyncio.create_task(writer.mark_done(url, "<html>%s</html>" % url, "specifications")) for url in urls]
+        await asyncio.sleep(0)
+        queued.set()
+        return await asyncio.gather(*tasks)
+    digests = asyncio.run(checkpoint_all())
+    writer.close()
+
+    assert threads == {"checkpoint-writer"}
+    # One per max_batch pages, and one more on close
+    assert conn.commits == len(urls) // 50 + 1
+    assert crawl_progress.body_refs(conn.conn, urls) == dict(zip(urls, digests))
+    assert store.get_blob(digests[7]) == "<html>%s</html>" % urls[7]
+    assert crawl_progress.stage_summary(conn.conn, "specifications") == {crawl_progress.STATUS_DONE: len(urls)}
+
+# The error goes back to whoever was waiting on that page, the writer carries on with the rest
+def test_checkpoint_writer_hands_errors_back(tmp_path):
+    conn = crawl_progress.open_progress(str(tmp_path / "progress.db"))
+    store = page_store.PageStore(str(tmp_path / "page_store"))
+    writer = crawl_progress.CheckpointWriter(conn, store)
+
+    async def checkpoint_all():
+        return await asyncio.gather(writer.mark_done("http://127.0.0.1/a", None), writer.mark_done("http://127.0.0.1/b", "<html>b</html>"),
+                                    return_exceptions=True)
+    error, digest = asyncio.run(checkpoint_all())
+    writer.close()
+
+    assert isinstance(error, AttributeError)
+    assert crawl_progress.body_refs(conn, ["http://127.0.0.1/a", "http://127.0.0.1/b"]) == {"http://127.0.0.1/b": digest}
@@ -0,0 +1,101 @@
+import logging
+import os
+
+import pytest
+from aiohttp import web
+
+import crawl_progress
+import mock_site
+import retry_policy
+
+# Mock site where some paths always answer with a 500, until they get taken out of broken
+class FlakySite(mock_site.MockSite):
+
+    def __init__(self, broken, **kwargs):
+        super().__init__(**kwargs)
+        self.broken = set(broken)
+
+    async def handle(self, request):
+        if request.path in self.broken:
+            self.errors_sent += 1
+            return web.Response(status=500)
+        return await super().handle(request)
+
+def fetch(scraping, url, stage):
+    async def run():
+        async with scraping.crawl_session() as session:
+            return await scraping.asyncfetch(session, url, scraping.stage_limiter(stage, 2), stage)
+    return scraping.run_crawl(run())
+
+# A URL that keeps failing gets dead lettered, and --replay-dead-letters fetches it once the site is back,
+# clears it out of the dead letter file and drops the cached lists that were built without it
+def test_dead_letter_replay_round_trip(scraping, serve_site, monkeypatch, caplog):
+    monkeypatch.setattr(scraping, "retry", retry_policy.RetryPolicy(scraping.retry_attempts, 0.01, 0.05))
+    path = "/cars/make-1_model-1"
+    site = FlakySite([path], makes=1, models=1, padding_kb=0)
+    url = serve_site(site) + path
+
+    assert fetch(scraping, url, "all_years") is None
+    assert site.errors_sent == scraping.retry_attempts["server"]
+    assert [(entry["url"], entry["stage"], entry["kind"]) for entry in retry_policy.read_dead_letters()] == [(url, "all_years", "server")]
+
+    with caplog.at_level(logging.INFO):
+        scraping.log_crawl_outcome("Frontier")
+    assert "--replay-dead-letters" in caplog.text and "everything successfully" not in caplog.text
+
+    for file_name in [scraping.all_models_file, scraping.all_years_file, scraping.final_data_file]:
+        scraping.dump2file(file_name, [])
+
+    site.broken.clear()
+    scraping.replay_dead_letters()
+
+    assert retry_policy.read_dead_letters() == []
+    assert "make-1_model-1_2019" in crawl_progress.load_body(scraping.progress_conn, scraping.store, url)
+    assert os.path.exists(scraping.all_models_file)
+    assert not os.path.exists(scraping.all_years_file) and not os.path.exists(scraping.final_data_file)
+
+    caplog.clear()
+    with caplog.at_level(logging.INFO):
+        scraping.log_crawl_outcome("Frontier")
+    assert "everything successfully" in caplog.text
+
+# Mock site that remembers the User-Agent of every request
+class HeaderSite(FlakySite):
+
+    def __init__(self, broken, **kwargs):
+        super().__init__(broken, **kwargs)
+        self.user_agents = []
+
+    async def handle(self, request):
+        self.user_agents.append(request.headers.get("User-Agent"))
+        return await super().handle(request)
+
+# Every other stage starts from the makes page, so a crawl without it stops instead of finding nothing
+def test_failed_makes_page_stops_the_crawl(scraping, serve_site, monkeypatch):
+    monkeypatch.setattr(scraping, "retry", retry_policy.RetryPolicy(scraping.retry_attempts, 0.01, 0.05))
+    site = HeaderSite(["/new-cars"], makes=1, models=1, padding_kb=0)
+    website = serve_site(site)
+
+    with pytest.raises(RuntimeError, match="/new-cars"):
+        scraping.fetch(website, "/new-cars")
+    assert site.user_agents and set(site.user_agents) == {scraping.user_agent}
+
+    site.broken.clear()
+    assert len(scraping.fetch(website, "/new-cars").find_all("a", {"class": "add-zip"})) == 1
+    retry_policy.write_dead_letters([])
+
+# A page that came back fine but couldn't be checkpointed is still used, and isn't fetched again or dead lettered
+def test_checkpoint_errors_dont_retry_the_request(scraping, serve_site, monkeypatch, caplog):
+    def disk_full(*args, **kwargs):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(crawl_progress, "mark_done", disk_full)
+    path = "/cars/make-1_model-1"
+    site = mock_site.MockSite(makes=1, models=1, padding_kb=0)
+    url = serve_site(site) + path
+
+    with caplog.at_level(logging.ERROR):
+        assert "make-1_model-1_2019" in fetch(scraping, url, "all_years")
+    assert site.requests == 1
+    assert retry_policy.read_dead_letters() == []
+    assert "Couldn't checkpoint %s" % url in caplog.text
+    assert crawl_progress.load_body(scraping.progress_conn, scraping.store, url) is None
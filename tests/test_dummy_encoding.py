@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+import dummy_encoding
+
+def read_json(file_name):
+    with open(file_name, encoding="utf-8") as f:
+        return json.load(f)
+
+def test_categories_of_mixed_values():
+    values = pd.Series([65, "65", 70.0, "55", np.nan, 100, "R", None, "H"], dtype=object)
+    assert dummy_encoding.categories_of(values) == ["55", "65", "70", "100", "H", "R"]
+
+# A category that only shows up in a later dataset goes on the end, every column already in the file stays put
+def test_vocabulary_order_is_stable(tmp_path):
+    file_name = str(tmp_path / "dummy_vocabulary.json")
+    first = pd.DataFrame({"Drivetrain": ["Front Wheel Drive", "All Wheel Drive", None],
+                          "Tire Ratio": [65, 55.0, 40]})
+    vocabulary = dummy_encoding.build_vocabulary(first, ["Drivetrain", "Tire Ratio"])
+    dummy_encoding.save_vocabulary(vocabulary, file_name)
+    assert read_json(file_name) == [["Drivetrain", "All Wheel Drive"], ["Drivetrain", "Front Wheel Drive"],
+                                                            ["Tire Ratio", "40"], ["Tire Ratio", "55"], ["Tire Ratio", "65"]]
+
+    # Read back from a CSV with the numbers as text this time, plus a new drivetrain and tire ratio
+    second = pd.DataFrame({"Drivetrain": ["Rear Wheel Drive", "All Wheel Drive", "Front Wheel Drive"],
+                           "Tire Ratio": ["65", "30", "55"]}, dtype=object)
+    before, _, _ = dummy_encoding.encode(second, dummy_encoding.load_vocabulary(file_name))
+    updated = dummy_encoding.build_vocabulary(second, ["Drivetrain", "Tire Ratio"], dummy_encoding.load_vocabulary(file_name))
+    dummy_encoding.save_vocabulary(updated, file_name)
+
+    assert updated[:len(vocabulary)] == vocabulary
+    assert updated[len(vocabulary):] == [["Drivetrain", "Rear Wheel Drive"], ["Tire Ratio", "30"]]
+    assert read_json(file_name) == updated
+
+    # The old columns come out the same, the new ones are just added after them
+    after, names, unknown = dummy_encoding.encode(second, updated)
+    assert names[:len(vocabulary)] == dummy_encoding.dummy_columns(vocabulary)
+    assert (after[:, :len(vocabulary)] != before).nnz == 0
+    assert after[:, len(vocabulary):].toarray().tolist() == [[1, 0], [0, 1], [0, 0]]
+    assert unknown == {}
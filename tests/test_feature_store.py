@@ -0,0 +1,95 @@
+import os
+import runpy
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dummy_encoding
+import feature_store
+
+here = os.path.dirname(os.path.abspath(__file__))
+script = os.path.join(os.path.dirname(here), "python", "creating_features.py")
+vocabulary_file = "dummy_vocabulary.json"   # Where creating_features.py keeps it
+
+def imputed_cars():
+    return pd.DataFrame({
+        "MSRP": [25000.0, 31000.0, np.nan, 48000.0],
+        "Net Horsepower": [150.0, 180.0, 200.0, np.nan],
+        "Passenger Capacity": [5, 5, 7, 2],
+        "Drivetrain": ["Front Wheel Drive", "All Wheel Drive", "All Wheel Drive", "Rear Wheel Drive"],
+        "Body Style": ["Sedan", "Sedan", "Mini-van", "Convertible"],
+        "Engine": ["Gas 4", "Gas 4", "Gas 6", "Gas 8"],
+    }, index=["2019 Car-%s" % i for i in range(4)])
+
+def test_store_round_trip(tmp_path):
+    directory = str(tmp_path / "feature_store")
+    df = imputed_cars()
+    vocabulary = [["Drivetrain", "All Wheel Drive"], ["Drivetrain", "Front Wheel Drive"], ["Body Style", "Sedan"]]
+    manifest = feature_store.build(df, vocabulary, "upstream", directory)
+
+    features, target, opened = feature_store.open_store(directory)
+    assert isinstance(features, np.memmap) and isinstance(target, np.memmap)
+    assert opened == manifest
+    assert manifest["rows"] == 3 and manifest["upstream_hash"] == "upstream"
+    assert manifest["columns"] == ["Net Horsepower", "Passenger Capacity"] + dummy_encoding.dummy_columns(vocabulary)
+    assert manifest["numeric_columns"] == 2
+    assert manifest["skipped_columns"] == ["Engine"]
+    assert manifest["unknown_categories"] == {"Drivetrain": 1, "Body Style": 1}
+
+    # The car with no MSRP is left out, a missing spec stays NaN
+    assert feature_store.row_names(directory) == ["2019 Car-0", "2019 Car-1", "2019 Car-3"]
+    assert target.tolist() == [25000, 31000, 48000]
+    np.testing.assert_array_equal(features, np.array([[150, 5, 0, 1, 1],
+                                                      [180, 5, 1, 0, 1],
+                                                      [np.nan, 2, 0, 0, 0]], dtype=np.float32))
+    assert features.dtype == np.float32
+
+    # A rebuild replaces everything, no leftover temp files
+    feature_store.build(df.iloc[:2], vocabulary, "upstream 2", directory)
+    assert feature_store.open_store(directory)[0].shape == (2, 5)
+    assert sorted(os.listdir(directory)) == ["features.npy", "index.json", "manifest.json", "target.npy"]
+
+def test_open_store_needs_a_build(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        feature_store.open_store(str(tmp_path / "feature_store"))
+
+# creating_features.py only builds the store when the hash of its input and vocabulary changes
+def run_script(monkeypatch, capsys, *arguments):
+    monkeypatch.setattr(sys, "argv", [script] + list(arguments))
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        assert e.code == 0
+    return capsys.readouterr().out
+
+def test_rebuilds_only_when_upstream_changes(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    imputed_cars().to_csv("car_data_imputed.csv")
+
+    def built():
+        return os.stat(os.path.join(feature_store.store_dir, "features.npy")).st_mtime_ns
+
+    assert "written to" in run_script(monkeypatch, capsys)
+    assert os.path.exists(vocabulary_file)
+    first = built()
+    assert "already up to date" in run_script(monkeypatch, capsys)
+    assert built() == first
+
+    # A changed input gets a new hash
+    cars = imputed_cars()
+    cars.loc["2019 Car-0", "MSRP"] = 26000.0
+    cars.to_csv("car_data_imputed.csv")
+    assert "written to" in run_script(monkeypatch, capsys)
+    assert feature_store.open_store()[1][0] == 26000
+    assert "already up to date" in run_script(monkeypatch, capsys)
+
+    # So does a changed vocabulary
+    vocabulary = dummy_encoding.load_vocabulary(vocabulary_file)
+    dummy_encoding.save_vocabulary(vocabulary + [["Drivetrain", "Four Wheel Drive"]], vocabulary_file)
+    assert "written to" in run_script(monkeypatch, capsys)
+    assert feature_store.read_manifest()["columns"][-1] == "Drivetrain: Four Wheel Drive"
+
+    assert "already up to date" in run_script(monkeypatch, capsys)
+    assert "written to" in run_script(monkeypatch, capsys, "--force")
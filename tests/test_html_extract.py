@@ -0,0 +1,44 @@
+import pytest
+
+import html_extract
+import mock_site
+
+pytest.importorskip("lxml")
+
+site = mock_site.MockSite(makes=2, models=2, years=3, trims=3, padding_kb=1)
+
+# A page from every level of the mock site, for the extractor method scraping.py runs over it
+mock_pages = [
+    ("model_links", "/make/new,make-1"),
+    ("year_links", "/cars/make-1_model-2"),
+    ("spec_links", "/overview/make-2_model-1_2018"),
+    ("trim_links", "/specifications/make-2_model-2_2017"),
+    ("specifications", "/specifications/make-1_model-1_2019_trim-1"),
+    ("specifications", "/specifications/make-2_model-2_2017_trim-3"),
+]
+
+# Bits of real world markup the mock site doesn't have
+odd_pages = [
+    ("model_links", "<div class='name other'><span><a href='/cars/a_b'>x</a><a href='/cars/c_d'>y</a></span></div>"
+                    "<div class='name'>no link</div><div class='named'><a href='/cars/nope'>z</a></div>"),
+    ("year_links", "<a class='btn  1' href='/overview/a_2018'>2018</a><a class='btn avail-now first-item' "
+                   "href='/overview/a_2019'>2019</a><a class='btn 1 extra' href='/overview/nope'>x</a>"),
+    ("spec_links", "<p>nothing to see here</p>"),
+    ("trim_links", "<p>no trim list</p>"),
+    ("trim_links", "<div class='block-inner'><a href='/a'>a</a></div><div class='block-inner'><b><a href='/b'>b</a></b><a>no href</a></div>"),
+    ("specifications", "<html><head><title>2019 Caf&eacute; &amp; Co Ünïcode Specifications</title></head><body>"
+                       "<div class='specs-set-item'><span>Engine</span><span>2.0L <b>I-4</b></span></div></body></html>"),
+    ("specifications", "<html><head><title>2019 No Price Car Specifications</title></head><body>"
+                       "<div class='price'>Call for price</div><div class='price'><a>$1</a></div></body></html>"),
+]
+
+@pytest.mark.parametrize("method, path", mock_pages)
+def test_extractors_agree_on_mock_pages(method, path):
+    page = site.page_for(path)
+    bs4_result = getattr(html_extract.get_extractor("bs4"), method)(page)
+    assert bs4_result
+    assert getattr(html_extract.get_extractor("lxml"), method)(page) == bs4_result
+
+@pytest.mark.parametrize("method, page", odd_pages)
+def test_extractors_agree_on_odd_markup(method, page):
+    assert getattr(html_extract.get_extractor("lxml"), method)(page) == getattr(html_extract.get_extractor("bs4"), method)(page)
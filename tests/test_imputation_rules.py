@@ -0,0 +1,132 @@
+import numpy as np
+import pandas as pd
+
+import imputation_rules
+
+nan = np.nan
+
+# A handful of cars where every way of getting filled in comes up:
+#   - Sedan has MSRPs, so its missing one is a Sedan mean
+#   - the only Wagon has no Net Horsepower, so it falls back to its EPA Classification
+#   - the Coupe is alone in both its Body Style and EPA Classification, so its MSRP stays missing
+#   - the car with no Body Style can only go by EPA Classification (Body Style itself gets the EPA mode)
+def small_frame():
+    rows = {
+        "2018 Make-0 Model-0 Specs: Trim-0": ["Sedan", "Midsize Cars", 20000, 150, "FWD", "Gasoline Direct Injection"],
+        "2018 Make-0 Model-0 Specs: Trim-1": ["Sedan", "Midsize Cars", 25000, 180, "AWD", "Gasoline Direct Injection"],
+        "2018 Make-0 Model-0 Specs: Trim-2": ["Sedan", "Compact Cars", nan, 200, nan, "Sequential MPI"],
+        "2018 Make-1 Model-1 Specs: Trim-0": ["Sedan", "Compact Cars", 30001, nan, "RWD", nan],
+        "2018 Make-1 Model-1 Specs: Trim-1": ["Wagon", "Compact Cars", 28000, nan, "AWD", "Sequential MPI"],
+        "2018 Make-2 Model-2 Specs: Trim-0": ["Coupe", "Two Seaters", nan, 400, "RWD", nan],
+        "2018 Make-2 Model-2 Specs: Trim-1": [nan, "Midsize Cars", nan, 160, nan, "Sequential MPI"],
+    }
+    columns = ["Body Style", "EPA Classification", "MSRP", "Net Horsepower", "Drivetrain", "Fuel System"]
+    return pd.DataFrame.from_dict(rows, orient="index", columns=columns).astype({"MSRP": object, "Net Horsepower": object})
+
+# scipy's stats.mode, what the old script used: the most common value, the smallest if there's a tie
+def old_mode(values):
+    counts = values.value_counts()
+    return min(counts[counts == counts.max()].index)
+
+# The old imputation.py, cell by cell (get_value/set_value are .at now). Statistics always come from the
+# unfilled data with the mean columns made numeric, filled values go into a copy.
+def old_impute(data, mean_columns=imputation_rules.specs_to_mean):
+    raw_data = imputation_rules.numeric_copy(data, mean_columns)
+    imputed_data = data.copy()
+
+    def group(row, key, column):
+        return raw_data.loc[raw_data[key] == raw_data.at[row, key], column].dropna()
+
+    def imputer(row, column, statistic):
+        for key in ["Body Style", "EPA Classification"]:
+            values = group(row, key, column)
+            if len(values) > 0:
+                imputed_data.at[row, column] = statistic(values)
+                return
+
+    specs_to_mean = [column for column in mean_columns if column in data.columns]
+    specs_to_mode = [column for column in data.columns if column not in mean_columns]
+    for column in specs_to_mean:
+        for row in imputed_data.index:
+            if pd.isnull(imputed_data.at[row, column]):
+                imputer(row, column, lambda values: np.round(values.mean(), 2))
+    for column in specs_to_mode:
+        for row in imputed_data.index:
+            if pd.isnull(imputed_data.at[row, column]):
+                imputer(row, column, old_mode)
+    return imputed_data
+
+def filled_counts(report):
+    return {(row.column, row.level): row.filled for row in report.itertuples()}
+
+def test_same_as_the_old_loop():
+    data = small_frame()
+    imputed, _ = imputation_rules.impute(data)
+    expected = old_impute(data)
+    pd.testing.assert_frame_equal(imputed.astype(object), expected.astype(object))
+
+def test_fallback_order():
+    data = small_frame()
+    imputed, report = imputation_rules.impute(data, [["Body Style"], ["EPA Classification"], []])
+    counts = filled_counts(report)
+
+    # Sedan mean of 20000, 25000 and 30001
+    assert imputed.at["2018 Make-0 Model-0 Specs: Trim-2", "MSRP"] == 25000.33
+    # No other Wagon has a Net Horsepower, so it's the Compact Cars mean of 200
+    assert imputed.at["2018 Make-1 Model-1 Specs: Trim-1", "Net Horsepower"] == 200
+    assert counts[("Net Horsepower", "Body Style")] == 1
+    assert counts[("Net Horsepower", "EPA Classification")] == 1
+    # Nothing else is a Coupe or a Two Seater, so only the overall mean is left
+    assert imputed.at["2018 Make-2 Model-2 Specs: Trim-0", "MSRP"] == round((20000 + 25000 + 30001 + 28000) / 4, 2)
+    assert counts[("MSRP", "all cars")] == 1
+    # No Body Style -> the Midsize Cars mode, and its MSRP from the Midsize Cars mean
+    assert imputed.at["2018 Make-2 Model-2 Specs: Trim-1", "Body Style"] == "Sedan"
+    assert imputed.at["2018 Make-2 Model-2 Specs: Trim-1", "MSRP"] == 22500
+    assert not imputed.isna().any().any()
+
+def test_stops_at_the_end_of_the_hierarchy():
+    imputed, report = imputation_rules.impute(small_frame())
+    assert pd.isna(imputed.at["2018 Make-2 Model-2 Specs: Trim-0", "MSRP"])
+    assert filled_counts(report)[("MSRP", "still missing")] == 1
+
+def test_mean_for_numbers_mode_for_the_rest():
+    data = small_frame()
+    # Read from a CSV everything is text, the mean columns still get averaged as numbers
+    data["MSRP"] = data["MSRP"].map(lambda value: value if pd.isna(value) else str(value))
+    imputed, _ = imputation_rules.impute(data)
+    assert imputed.at["2018 Make-0 Model-0 Specs: Trim-2", "MSRP"] == 25000.33
+
+    # FWD, AWD and RWD are tied among the Sedans, the smallest one wins
+    assert imputed.at["2018 Make-0 Model-0 Specs: Trim-2", "Drivetrain"] == "AWD"
+    # Gasoline Direct Injection twice vs Sequential MPI once
+    assert imputed.at["2018 Make-1 Model-1 Specs: Trim-0", "Fuel System"] == "Gasoline Direct Injection"
+
+    # A column that isn't in specs_to_mean gets a mode even if it's numbers
+    imputed, _ = imputation_rules.impute(small_frame(), mean_columns=["MSRP"])
+    assert imputed.at["2018 Make-1 Model-1 Specs: Trim-0", "Net Horsepower"] == 150
+
+# Statistics kept from an earlier run (incremental.py) won't have groups that only show up in new cars
+def test_group_missing_from_the_statistics():
+    data = small_frame()
+    stats = imputation_rules.GroupStats()
+    stats.update(imputation_rules.numeric_copy(data))
+
+    new = pd.DataFrame({"Body Style": ["Convertible", "Sedan"], "EPA Classification": ["Midsize Cars", "Minivans"],
+                        "MSRP": [nan, nan], "Net Horsepower": [nan, nan], "Drivetrain": [nan, nan],
+                        "Fuel System": ["Sequential MPI", nan]},
+                       index=["2019 Make-3 Model-3 Specs: Trim-0", "2019 Make-3 Model-3 Specs: Trim-1"])
+    imputed, report = imputation_rules.fill_missing(new, stats)
+    counts = filled_counts(report)
+
+    # No Convertibles, so the Midsize Cars mean. No Minivans, but the Sedan mean doesn't need them.
+    assert imputed["MSRP"].tolist() == [22500, 25000.33]
+    assert counts[("MSRP", "Body Style")] == 1
+    assert counts[("MSRP", "EPA Classification")] == 1
+    assert imputed.at["2019 Make-3 Model-3 Specs: Trim-1", "Drivetrain"] == "AWD"
+    assert imputed.at["2019 Make-3 Model-3 Specs: Trim-1", "Fuel System"] == "Gasoline Direct Injection"
+
+def test_model_level():
+    data = small_frame()
+    imputed, _ = imputation_rules.impute(data, [["Model"], ["Body Style"]])
+    # The other two Model-0 trims, where all the Sedans would have given 25000.33
+    assert imputed.at["2018 Make-0 Model-0 Specs: Trim-2", "MSRP"] == 22500
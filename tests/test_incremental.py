@@ -0,0 +1,99 @@
+import random
+
+import pandas as pd
+
+import cleaning_rules
+import imputation_rules
+import incremental
+from test_cleaning_rules import mock_cars
+
+# Mock cars with some of their specs missing ("- TBD -" on the site), so imputation has something to fill in
+def raw_cars(count, seed=0):
+    rng = random.Random(seed)
+    cars = mock_cars(count)
+    for specs in cars.values():
+        for spec in rng.sample(sorted(specs), 10):
+            specs[spec] = "- TBD -"
+    return pd.DataFrame.from_dict(cars, orient="index").astype(object)
+
+# Like data_cleaning.py then imputation.py with --incremental, on the same output files every time
+def incremental_run(raw):
+    cleaned, _, cleaned_count = incremental.clean(raw, "car_data_processed.csv")
+    imputed, _, imputed_count = incremental.impute(cleaned, "car_data_imputed.csv")
+    return cleaned, imputed, cleaned_count, imputed_count
+
+def change_some_cars(raw):
+    changed = raw.copy()
+    names = list(changed.index)
+    changed.loc[names[3], "MSRP"] = "$99,999"
+    changed.loc[names[8], "Body Style"] = "Convertible"
+    changed.loc[names[8], "Wheelbase (in)"] = "- TBD -"
+    new = raw_cars(32, seed=1).iloc[30:]
+    return pd.concat([changed, new]), [names[3], names[8]] + list(new.index)
+
+def test_incremental_run_matches_a_full_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw = raw_cars(30)
+
+    # First run has no state yet, so it's a full run
+    cleaned, imputed, cleaned_count, imputed_count = incremental_run(raw)
+    assert (cleaned_count, imputed_count) == (30, 30)
+    full_cleaned, _ = cleaning_rules.clean(raw)
+    pd.testing.assert_frame_equal(cleaned, full_cleaned)
+
+    # Nothing changed, nothing redone
+    assert incremental_run(raw)[2:] == (0, 0)
+
+    raw, changed = change_some_cars(raw)
+    cleaned, imputed_again, cleaned_count, imputed_count = incremental_run(raw)
+    assert (cleaned_count, imputed_count) == (len(changed), len(changed))
+
+    # Cleaning doesn't depend on the other cars, so it comes out exactly like a full run
+    full_cleaned, _ = cleaning_rules.clean(raw)
+    pd.testing.assert_frame_equal(cleaned, full_cleaned)
+    assert cleaned.loc[changed[0], "MSRP"] == 99999
+
+    # The group statistics were updated for the changed cars instead of rebuilt, and come out the same
+    stats = incremental.load_state(incremental.state_file("car_data_imputed.csv", "imputation"),
+                                   incremental.fingerprint(incremental.inspect.getsource(imputation_rules),
+                                                           imputation_rules.default_hierarchy,
+                                                           imputation_rules.specs_to_mean))["stats"]
+    full_stats = imputation_rules.GroupStats()
+    full_stats.update(imputation_rules.numeric_copy(full_cleaned))
+    for level in range(len(full_stats.hierarchy)):
+        for column in full_cleaned.columns:
+            expected = full_stats.statistic(level, column)
+            if expected is not None:
+                pd.testing.assert_series_equal(stats.statistic(level, column).sort_index(), expected.sort_index(),
+                                               check_names=False, check_dtype=False)
+
+    # New and changed cars get filled exactly like a full run would. Everything else keeps what it got last time
+    full_imputed, _ = imputation_rules.impute(full_cleaned)
+    assert list(imputed_again.index) == list(raw.index)
+    pd.testing.assert_frame_equal(imputed_again.loc[changed], full_imputed.loc[changed], check_dtype=False)
+    unchanged = [name for name in imputed.index if name not in changed]
+    pd.testing.assert_frame_equal(imputed_again.loc[unchanged], imputed.loc[unchanged], check_dtype=False)
+
+# Changing the rules (or the hierarchy) throws the saved state away
+def test_state_from_other_rules_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw = raw_cars(20)
+    incremental_run(raw)
+
+    getsource = incremental.inspect.getsource
+    monkeypatch.setattr(incremental.inspect, "getsource", lambda module: getsource(module) + "\n# a new rule")
+    assert incremental_run(raw)[2:] == (20, 20)
+    assert incremental_run(raw)[2:] == (0, 0)
+
+    imputed, _, count = incremental.impute(cleaning_rules.clean(raw)[0], "car_data_imputed.csv",
+                                           [["EPA Classification"]])
+    assert count == 20
+    pd.testing.assert_frame_equal(imputed, imputation_rules.impute(cleaning_rules.clean(raw)[0], [["EPA Classification"]])[0])
+
+# Cars are matched up by name, so duplicate names mean a full run every time
+def test_duplicate_names_do_a_full_run(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    raw = raw_cars(10)
+    raw = pd.concat([raw, raw.iloc[:2]])
+    assert incremental_run(raw)[2:] == (12, 12)
+    assert incremental_run(raw)[2:] == (12, 12)
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import cleaning_rules
+import dummy_encoding
+import feature_store
+import price_model
+import pricing
+from test_cleaning_rules import mock_cars
+
+@pytest.fixture(scope="module")
+def model(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("feature_store"))
+    raw = price_model.raw_frame(mock_cars(80).items())
+    cleaned, _ = cleaning_rules.clean(raw, keep_sparse_columns=True)
+    vocabulary = dummy_encoding.build_vocabulary(cleaned)
+    feature_store.build(cleaned, vocabulary, "test", directory)
+    return price_model.train(directory)
+
+# Runs requests(client) against the --serve app, without binding a real port
+def with_client(model, requests):
+    async def run():
+        async with TestClient(TestServer(pricing.make_app(model, "test_model.pkl"))) as client:
+            return await requests(client)
+    return asyncio.run(run())
+
+def test_prices_a_list_of_cars(model):
+    cars = list(mock_cars(3, seed=1).items())
+    async def requests(client):
+        response = await client.post("/price", json=[[name, specs] for name, specs in cars[:2]] +
+                                                     [{"name": cars[2][0], "specs": cars[2][1]}])
+        return response.status, await response.json()
+
+    status, answer = with_client(model, requests)
+    assert status == 200
+    expected, _ = model.price(price_model.raw_frame(cars))
+    assert answer["prices"] == {name: round(float(value), 2) for name, value in expected.items()}
+
+@pytest.mark.parametrize("body", ['{"name": "2019 Car", "specs": {}}', '"2019 Car"', "12", "not json", '[["2019 Car"]]'])
+def test_rejects_anything_but_a_list_of_cars(model, body):
+    async def requests(client):
+        response = await client.post("/price", data=body, headers={"Content-Type": "application/json"})
+        return response.status, await response.text()
+
+    status, text = with_client(model, requests)
+    assert status == 400
+    assert "Expected a JSON list" in text
+
+def test_scoring_runs_off_the_event_loop(model, monkeypatch):
+    threads = []
+    price_batches = pricing.price_batches
+    def recording_price_batches(*args):
+        threads.append(threading.get_ident())
+        return price_batches(*args)
+    monkeypatch.setattr(pricing, "price_batches", recording_price_batches)
+
+    async def requests(client):
+        loop_thread = threading.get_ident()
+        response = await client.post("/price", json=list(mock_cars(2, seed=2).items()))
+        health = await (await client.get("/health")).json()
+        return loop_thread, response.status, health
+
+    loop_thread, status, health = with_client(model, requests)
+    assert status == 200
+    assert threads and loop_thread not in threads
+    assert health["model"] == "test_model.pkl" and health["kind"] == "linear" and health["features"] == len(model.columns)
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import aiohttp
+
+import mock_site
+import rate_limit
+
+# Sends count requests to the site through the limiter, as many at once as it allows
+async def send(session, limiter, base, count):
+    async def one(i):
+        url = base + "/make/new,make-%s" % (i % 5 + 1)
+        await limiter.acquire(url)
+        start = time.perf_counter()
+        status = None
+        try:
+            async with session.get(url) as response:
+                status = response.status
+                await response.read()
+        finally:
+            await limiter.release(url, time.perf_counter() - start, status)
+
+    await asyncio.gather(*[one(i) for i in range(count)])
+
+# AIMD against the mock site: the limit climbs while everything's fine, gets cut when the site starts sending
+# 500s, and climbs back once it stops
+def test_limiter_backs_off_on_errors_and_recovers():
+    async def run():
+        site = mock_site.MockSite(makes=5, latency=0.01, padding_kb=0)
+        runner = await mock_site.start(site, port=0)
+        base = "http://127.0.0.1:%s" % runner.addresses[0][1]
+        limiter = rate_limit.AdaptiveLimiter("test", start=4, min_limit=1, max_limit=50)
+        limits = []
+        try:
+            async with aiohttp.ClientSession() as session:
+                await send(session, limiter, base, 200)
+                limits.append(limiter.host(base).limit)
+
+                site.error_rate = 0.5
+                await send(session, limiter, base, 100)
+                limits.append(limiter.host(base).limit)
+
+                site.error_rate = 0.0
+                await send(session, limiter, base, 300)
+                limits.append(limiter.host(base).limit)
+        finally:
+            await runner.cleanup()
+        return limiter, site, limits
+
+    limiter, site, (healthy, failing, recovered) = asyncio.run(run())
+    assert site.errors_sent > 0 and limiter.total_errors == site.errors_sent
+    assert healthy > 4
+    assert failing < healthy
+    assert recovered > failing
+
+# Two sites through the same limiter: the one sending 500s gets backed off, the healthy one doesn't
+def test_limits_are_per_host():
+    async def run():
+        healthy_site = mock_site.MockSite(makes=5, latency=0.01, padding_kb=0)
+        failing_site = mock_site.MockSite(makes=5, latency=0.01, error_rate=0.5, padding_kb=0)
+        runners = [await mock_site.start(site, port=0) for site in [healthy_site, failing_site]]
+        healthy, failing = ["http://127.0.0.1:%s" % runner.addresses[0][1] for runner in runners]
+        limiter = rate_limit.AdaptiveLimiter("test", start=8, min_limit=1, max_limit=50)
+        try:
+            async with aiohttp.ClientSession() as session:
+                await asyncio.gather(send(session, limiter, healthy, 200), send(session, limiter, failing, 200))
+        finally:
+            for runner in runners:
+                await runner.cleanup()
+        return limiter, healthy, failing
+
+    limiter, healthy, failing = asyncio.run(run())
+    assert limiter.host(healthy).limit > 8
+    assert limiter.host(failing).limit < 8
+    assert limiter.in_flight == 0
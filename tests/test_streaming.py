@@ -0,0 +1,77 @@
+import asyncio
+import time
+
+import pytest
+
+import crawl_progress
+import mock_site
+
+def stream(scraping, urls, process_function):
+    async def run():
+        async with scraping.crawl_session() as session:
+            limiter = scraping.stage_limiter("test", 5)
+            return await asyncio.wait_for(scraping.async_stream_all(session, urls, limiter, process_function, "test"), 60)
+    return scraping.run_crawl(run())
+
+def make_urls(base, count):
+    return [base + "/make/new,make-%s" % m for m in range(1, count + 1)]
+
+def test_stream_results_in_url_order(scraping, serve_site):
+    urls = make_urls(serve_site(mock_site.MockSite(makes=10, padding_kb=0)), 60)
+    pages = stream(scraping, urls, str)
+    assert all("make-%s_model-1" % m in page for m, page in enumerate(pages, 1))
+
+# More pages than the queue holds and a single parser, so a parser that died on the first bad page would leave
+# the fetchers stuck on the full queue
+def test_stream_survives_parse_errors(scraping, serve_site, monkeypatch):
+    monkeypatch.setattr(scraping, "num_cores", 1)
+    monkeypatch.setattr(scraping, "stream_queue_size", 5)
+    urls = make_urls(serve_site(mock_site.MockSite(makes=19, padding_kb=0)), 19)
+    assert stream(scraping, urls, int) == [None] * 19
+
+# A fetcher that raises takes the stage down, but not before the other fetchers and the parsers are stopped
+def test_stream_cleans_up_when_a_fetcher_fails(scraping, serve_site, monkeypatch):
+    urls = make_urls(serve_site(mock_site.MockSite(makes=10, padding_kb=0)), 30)
+    fetch = scraping.asyncfetch
+
+    async def broken_fetch(session, url, limiter, stage=None, use_cache=True):
+        if url == urls[5]:
+            raise RuntimeError("broken fetcher")
+        return await fetch(session, url, limiter, stage, use_cache)
+    monkeypatch.setattr(scraping, "asyncfetch", broken_fetch)
+
+    async def run():
+        async with scraping.crawl_session() as session:
+            with pytest.raises(RuntimeError, match="broken fetcher"):
+                await scraping.async_stream_all(session, urls, scraping.stage_limiter("test", 5), str, "test")
+            return [task for task in asyncio.all_tasks() if "async_stream_all" in task.get_coro().__qualname__]
+    assert scraping.run_crawl(run()) == []
+
+# A saved page that can't be read back any more is fetched again instead of breaking the fetcher
+def test_unreadable_saved_page_is_fetched_again(scraping, serve_site):
+    site = mock_site.MockSite(makes=3, padding_kb=0)
+    urls = make_urls(serve_site(site), 3)
+    assert len(stream(scraping, urls, str)) == 3
+    assert site.requests == 3
+
+    digest = crawl_progress.body_refs(scraping.progress_conn, urls[:1])[urls[0]]
+    with open(scraping.store.blob_path(digest), "wb") as f:
+        f.write(b"not zlib")
+    pages = stream(scraping, urls, str)
+    assert "make-1_model-1" in pages[0]
+    assert site.requests == 4
+    assert crawl_progress.load_body(scraping.progress_conn, scraping.store, urls[0]) == pages[0]
+
+# --fresh only reuses pages fetched since the run started
+def test_fresh_fetches_saved_pages_again(scraping, serve_site, monkeypatch):
+    site = mock_site.MockSite(makes=3, padding_kb=0)
+    urls = make_urls(serve_site(site), 3)
+    stream(scraping, urls, str)
+    stream(scraping, urls, str)
+    assert site.requests == 3
+
+    monkeypatch.setattr(scraping, "fresh_since", time.time())
+    stream(scraping, urls, str)
+    assert site.requests == 6
+    stream(scraping, urls, str)
+    assert site.requests == 6
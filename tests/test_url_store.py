@@ -0,0 +1,27 @@
+import pickle
+
+import url_store
+
+urls = ["https://www.thecarconnection.com/specifications/acme_model-1_2019_trim-1",
+        "https://www.thecarconnection.com/specifications/acme_model-1_2019_trim-2",
+        "https://www.thecarconnection.com/cars/acme_model-1",
+        "https://www.thecarconnection.com/specifications/acme_model-1_2019_trim-1",
+        "http://127.0.0.1:8080/new-cars"]
+
+def test_lists_keep_each_url_once_in_order():
+    store = url_store.UrlStore()
+    trims = store.list("trims")
+    assert trims.extend(urls) == urls[:3] + urls[4:]
+    assert list(trims) == urls[:3] + urls[4:]
+    assert urls[2] in trims and "https://www.thecarconnection.com/cars/nope" not in trims
+    assert store.lists_containing(urls[0]) == ["trims"]
+
+# The cache files have to load anywhere, not just where url_store.py can be imported
+def test_lists_pickle_as_plain_lists():
+    store = url_store.UrlStore()
+    trims = store.list("trims")
+    trims.extend(urls)
+    data = pickle.dumps(trims)
+    assert b"url_store" not in data
+    loaded = pickle.loads(data)
+    assert type(loaded) is list and loaded == list(trims)
@@ -0,0 +1,173 @@
+import json
+import os
+import pickle
+import socket
+import sqlite3
+import time
+
+# Shared work queue for running the crawl across several worker processes (on one machine, or several pointed at
+# the same database), instead of everything going through one event loop. It's the frontier from
+# scraping.py's frontier_crawl, kept in SQLite:
+#   - the coordinator (python scraping.py --coordinator) puts the makes in, with level 0 = the all_models stage
+#   - workers (python scraping.py --worker) lease a batch of URLs, fetch and parse them, and write the result
+#     back along with the URLs it turned up, which go in at the next level (each URL only ever goes in once)
+#   - a lease runs out after lease_seconds unless the worker keeps renewing it, so whatever a dead worker had
+#     goes back to the other workers. URLs that keep getting leased and never finished are eventually failed.
+#   - every URL carries the make it came from as its shard, and a worker sticks to one make for as long as it
+#     has work (then moves on to whichever make the fewest other workers are on), so one make's pages stay
+#     together instead of every worker picking at every make
+#   - deeper levels go first, same as the frontier, so cars make it all the way through to their specs
+# When nothing is queued or leased the crawl is done, and the coordinator puts the results back together in
+# the same order the stage by stage crawl gives. SQLite's locking needs a local disk (or a network filesystem
+# that really supports locks) - for lots of machines this is a stand in for a proper broker.
+# https://www.sqlite.org/lockingv3.html
+work_queue_file = "txt_files/work_queue.db"
+
+QUEUED = "queued"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+max_leases = 5      # A URL leased this many times without being finished gets failed
+
+def worker_name():
+    return "%s-%s" % (socket.gethostname(), os.getpid())
+
+def open_queue(db_file=work_queue_file):
+    conn = sqlite3.connect(db_file, timeout=60, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS work (
+                        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                        url TEXT UNIQUE NOT NULL,
+                        level INTEGER NOT NULL,
+                        key TEXT NOT NULL,
+                        shard INTEGER NOT NULL,
+                        status TEXT NOT NULL,
+                        worker TEXT,
+                        lease_until REAL,
+                        leases INTEGER NOT NULL DEFAULT 0,
+                        result BLOB,
+                        error TEXT)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS work_status ON work (status, shard, level)")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+class Item:
+
+    def __init__(self, url, level, key, shard):
+        self.url = url
+        self.level = level
+        self.key = tuple(json.loads(key)) if isinstance(key, str) else tuple(key)
+        self.shard = shard
+
+    def __repr__(self):
+        return "<Item %s level %s key %s>" % (self.url, self.level, self.key)
+
+def get_meta(conn, name):
+    row = conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+def set_meta(conn, name, value):
+    conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)", (name, value))
+
+def add_items(conn, items):
+    conn.executemany("INSERT OR IGNORE INTO work (url, level, key, shard, status) VALUES (?, ?, ?, ?, ?)",
+                     [(item.url, item.level, json.dumps(item.key), item.shard, QUEUED) for item in items])
+
+# Puts the first level in. A queue left over from a finished crawl gets emptied first, one from a crawl that
+# died part way is picked up where it left off (the URLs already in there are skipped).
+def seed(conn, items):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if get_meta(conn, "closed"):
+            conn.execute("DELETE FROM work")
+            conn.execute("DELETE FROM meta")
+        add_items(conn, items)
+        set_meta(conn, "seeded", str(time.time()))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+# The coordinator's done with it, any workers still watching can go home
+def close(conn):
+    set_meta(conn, "closed", str(time.time()))
+
+available = "(status = '%s' OR (status = '%s' AND lease_until < :now))" % (QUEUED, LEASED)
+
+# Leases up to count URLs to worker, all from one shard - the one it had last time if that still has work.
+# Returns a list of Items, empty if there's nothing to hand out right now.
+def lease(conn, worker, count, lease_seconds, shard=None):
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Anything leased too many times is probably what's killing the workers, stop handing it out
+        conn.execute("UPDATE work SET status = ?, error = 'lease expired %s times' WHERE status = ? AND lease_until < ? AND leases >= ?"
+                     % max_leases, (FAILED, LEASED, now, max_leases))
+
+        # Our own shard if it's got anything left, otherwise the one the fewest other workers are busy on
+        row = conn.execute("""SELECT waiting.shard FROM
+                                  (SELECT shard, MAX(level) AS level, MIN(seq) AS seq FROM work WHERE """ + available + """
+                                   GROUP BY shard) AS waiting
+                              LEFT JOIN
+                                  (SELECT shard, COUNT(*) AS busy FROM work WHERE status = :leased AND lease_until >= :now
+                                   GROUP BY shard) AS busy
+                              ON waiting.shard = busy.shard
+                              ORDER BY waiting.shard = :shard DESC, COALESCE(busy.busy, 0), waiting.level DESC, waiting.seq
+                              LIMIT 1""", {"now": now, "shard": shard, "leased": LEASED}).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return []
+
+        rows = conn.execute("SELECT url, level, key, shard FROM work WHERE shard = :shard AND " + available +
+                            " ORDER BY level DESC, seq LIMIT :count", {"now": now, "shard": row[0], "count": count}).fetchall()
+        conn.executemany("UPDATE work SET status = ?, worker = ?, lease_until = ?, leases = leases + 1 WHERE url = ?",
+                         [(LEASED, worker, now + lease_seconds, url) for url, _, _, _ in rows])
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return [Item(*row) for row in rows]
+
+# Pushes out the lease on everything worker is still working on
+def renew(conn, worker, lease_seconds):
+    conn.execute("UPDATE work SET lease_until = ? WHERE worker = ? AND status = ?", (time.time() + lease_seconds, worker, LEASED))
+
+# Saves the result for item and queues up the URLs it found (children is a list of Items). Ignored if the lease
+# ran out and someone else has it now, they'll finish it instead.
+def complete(conn, worker, item, result, children=()):
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        updated = conn.execute("UPDATE work SET status = ?, result = ?, lease_until = NULL WHERE url = ? AND worker = ? AND status = ?",
+                               (DONE, pickle.dumps(result), item.url, worker, LEASED)).rowcount
+        if updated:
+            add_items(conn, children)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return bool(updated)
+
+def fail(conn, worker, item, error):
+    conn.execute("UPDATE work SET status = ?, error = ?, lease_until = NULL WHERE url = ? AND worker = ? AND status = ?",
+                 (FAILED, str(error), item.url, worker, LEASED))
+
+def finished(conn):
+    if not get_meta(conn, "seeded"):
+        return False
+    row = conn.execute("SELECT COUNT(*) FROM work WHERE status IN (?, ?)", (QUEUED, LEASED)).fetchone()
+    return row[0] == 0
+
+# level -> {status: count}
+def counts(conn):
+    result = {}
+    for level, status, count in conn.execute("SELECT level, status, COUNT(*) FROM work GROUP BY level, status"):
+        result.setdefault(level, {})[status] = count
+    return result
+
+# (key, result) for every finished URL at level, in key order
+def results(conn, level):
+    rows = [(tuple(json.loads(key)), pickle.loads(result))
+            for key, result in conn.execute("SELECT key, result FROM work WHERE level = ? AND status = ?", (level, DONE))]
+    return sorted(rows, key=lambda row: row[0])